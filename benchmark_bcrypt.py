@@ -0,0 +1,68 @@
+"""bcrypt のコスト (ラウンド数) のベンチマーク.
+
+このホストでラウンド数ごとのパスワード検証時間を計測し、目標のログイン時間に収まる
+最大のラウンド数を表示します. 同時ログイン数を指定すると、``PASSWORD_HASH_CONCURRENCY``
+個のスレッドで検証した場合に全員のログインが完了するまでの時間も表示します.
+
+結果のラウンド数は環境変数 ``INVENTORY_BCRYPT_ROUNDS`` に設定してください.
+既存のユーザーのハッシュは次回のログイン成功時に新しいラウンド数で再ハッシュされます.
+
+Usage:
+    python benchmark_bcrypt.py --target-ms 250 --logins 50
+"""
+
+import argparse
+import math
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+from inventory_app import security
+
+
+def measure(rounds: int, samples: int) -> float:
+    """指定したラウンド数でのパスワード検証時間の中央値 (ミリ秒) を返します."""
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    hashed = context.hash("benchmark-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("benchmark-password", hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0, help="1 回のログインで許容する検証時間 (ミリ秒).")
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=15)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--logins", type=int, default=50, help="同時に発生するログインの数.")
+    args = parser.parse_args()
+
+    concurrency = security.PASSWORD_HASH_CONCURRENCY
+    print(f"configured rounds: {security.BCRYPT_ROUNDS}, concurrency: {concurrency}")
+    recommended = None
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        median_ms = measure(rounds, args.samples)
+        burst_s = math.ceil(args.logins / concurrency) * median_ms / 1000
+        within = median_ms <= args.target_ms
+        if within:
+            recommended = rounds
+        print(
+            f"rounds {rounds:>2}: {median_ms:8.1f} ms/login, "
+            f"{args.logins} concurrent logins finish in {burst_s:6.2f} s {'*' if within else ''}"
+        )
+        if not within:
+            break
+
+    if recommended is None:
+        print(f"No rounds fit within {args.target_ms:.0f} ms; use {args.min_rounds} or lower the target.")
+    else:
+        print(f"Recommended: INVENTORY_BCRYPT_ROUNDS={recommended}")
+
+
+if __name__ == "__main__":
+    main()
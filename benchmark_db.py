@@ -0,0 +1,125 @@
+"""SQLite エンジン設定のベンチマーク.
+
+一時ファイルのデータベースに対して、複数スレッドから読み取り (備品一覧の取得) と
+書き込み (貸出・返却) を混在させて実行し、エンジン設定ごとのスループットと
+エラー件数を表示します.
+
+``legacy`` は従来の設定 (ロールバックジャーナル、``synchronous=FULL``、再試行なし)、
+``tuned`` は環境変数から読み込んだ ``database.EngineProfile`` と書き込みの再試行です.
+
+Usage:
+    python benchmark_db.py --threads 16 --seconds 10 --write-ratio 0.3
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from inventory_app import crud, database, models
+
+LEGACY_PROFILE = database.EngineProfile(
+    journal_mode="DELETE",
+    synchronous="FULL",
+    cache_size=-2000,
+    mmap_size=0,
+    temp_store="DEFAULT",
+    statement_cache_size=128,
+    pool_size=5,
+    max_overflow=10,
+)
+
+
+def prepare(session_factory, items: int, users: int):
+    db = session_factory()
+    db.add_all(models.User(username=f"bench{i}", hashed_password="x", display_name=f"Bench {i}") for i in range(users))
+    db.add_all(models.Item(name=f"Bench {i}", management_code=f"BEN-{i:05d}") for i in range(items))
+    db.commit()
+    user_ids = [row.id for row in db.query(models.User.id)]
+    item_ids = [row.id for row in db.query(models.Item.id)]
+    db.close()
+    return user_ids, item_ids
+
+
+def run(profile: database.EngineProfile, retries: int, args) -> Counter:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = database.create_profiled_engine(f"sqlite:///{path}", profile)
+    database.init_db(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    user_ids, item_ids = prepare(session_factory, args.items, args.users)
+    database.WRITE_RETRIES = retries
+
+    totals = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    due = date.today() + timedelta(days=7)
+
+    def worker():
+        counts = Counter()
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            db = session_factory()
+            started = time.perf_counter()
+            try:
+                if rng.random() < args.write_ratio:
+                    item_id = rng.choice(item_ids)
+                    try:
+                        if rng.random() < 0.5:
+                            crud.borrow_item(db, item_id, rng.choice(user_ids), due)
+                        else:
+                            crud.return_item(db, item_id, force=True)
+                    except crud.ItemStateConflictError:
+                        pass
+                    counts["writes"] += 1
+                else:
+                    crud.get_items_page(db, limit=50, skip=rng.randrange(max(1, args.items - 50)))
+                    counts["reads"] += 1
+                counts["latency_us"] += int((time.perf_counter() - started) * 1e6)
+            except Exception as e:  # noqa: BLE001 ロック競合などの失敗件数を集計する
+                counts[f"error: {type(e).__name__}"] += 1
+                db.rollback()
+            finally:
+                db.close()
+        with lock:
+            totals.update(counts)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    for name, profile, retries in (
+        ("legacy", LEGACY_PROFILE, 0),
+        ("tuned", database.EngineProfile.from_env(), database.WRITE_RETRIES),
+    ):
+        totals = run(profile, retries, args)
+        ops = totals["reads"] + totals["writes"]
+        errors = {key: value for key, value in totals.items() if key.startswith("error")}
+        mean_ms = totals["latency_us"] / ops / 1000 if ops else 0.0
+        print(
+            f"{name:>6}: {ops / args.seconds:8.1f} ops/s "
+            f"(reads {totals['reads']}, writes {totals['writes']}, mean {mean_ms:.2f} ms) errors={errors or 0}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 from sqladmin import ModelView
+from sqlalchemy import false
+from . import search
 from .models import User, Item, Log, NotificationSettings, EmailTemplate
 
 class UserAdmin(ModelView, model=User):
@@ -17,6 +19,13 @@ class ItemAdmin(ModelView, model=Item):
     column_sortable_list = [Item.id, Item.name, Item.status]
     icon = "fa-solid fa-box"
 
+    def search_query(self, stmt, term):
+        """検索ボックスの入力を API と同じ全文検索の索引で検索する."""
+        match = search.build_match_query(term)
+        if not match:
+            return stmt.filter(false())
+        return stmt.filter(Item.id.in_(search.matching_ids(match)))
+
 class LogAdmin(ModelView, model=Log):
     column_list = [Log.id, "item", "user", Log.action, Log.created_at]
     column_sortable_list = [Log.created_at]
@@ -0,0 +1,293 @@
+"""貸出・返却ログのアーカイブと履歴の取得.
+
+保持期間 (``INVENTORY_LOG_RETENTION_MONTHS`` か月、既定値 12) より古いログを、
+年ごとの SQLite データベース (``INVENTORY_ARCHIVE_DIR``/logs_<年>.db) へ移動します.
+
+移動はチャンク単位で行われます. 各チャンクはアーカイブへの書き込みをコミットしてから
+本体のログを削除する短いトランザクションで処理されるため、長時間の書き込みロックは
+発生しません. 途中で中断した場合も、再実行時に同じ ID のログは重複して書き込まれません.
+ログの ID は AUTOINCREMENT で採番されるため再利用されません. アーカイブに同じ ID で
+内容の異なるログがある場合は ``ArchiveConflictError`` を送出し、本体のログは削除しません.
+
+アーカイブ済みのログは ``history_page`` (``GET /api/v1/logs/history``) で
+本体のログと合わせて新しい順に取得できます.
+
+Usage:
+    python -m inventory_app.archive --months 12
+"""
+
+import argparse
+import calendar
+import heapq
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, create_engine, delete, func, select, text,
+)
+from sqlalchemy.orm import Session
+
+from . import cache, models, schemas
+from .database import retry_on_locked
+from .pagination import decode_cursor, encode_cursor
+
+# アーカイブデータベースを格納するディレクトリ
+ARCHIVE_DIR = os.environ.get("INVENTORY_ARCHIVE_DIR", "./archive")
+
+# 本体のデータベースに残すログの期間 (月)
+RETENTION_MONTHS = int(os.environ.get("INVENTORY_LOG_RETENTION_MONTHS", "12"))
+
+DEFAULT_CHUNK_SIZE = 1000
+
+_ARCHIVE_FILE_RE = re.compile(r"^logs_(\d{4})\.db$")
+
+archive_metadata = MetaData()
+
+archived_logs = Table(
+    "logs",
+    archive_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("item_id", Integer),
+    Column("user_id", Integer),
+    Column("action", String),
+    Column("created_at", DateTime),
+    Index("ix_logs_item_id_created_at", "item_id", "created_at"),
+    Index("ix_logs_user_id_created_at", "user_id", "created_at"),
+)
+"""アーカイブデータベースのログテーブル. 列は ``models.Log`` と同じです."""
+
+_LOG_COLUMNS = [column.name for column in archived_logs.columns]
+
+class ArchiveConflictError(RuntimeError):
+    """アーカイブに同じ ID で内容の異なるログが存在する場合に送出される例外."""
+
+
+_engines: Dict[str, object] = {}
+_engines_lock = threading.Lock()
+
+
+def archive_path(year: int, archive_dir: Optional[str] = None) -> str:
+    """指定した年のアーカイブデータベースのパスを返します."""
+    return os.path.join(archive_dir or ARCHIVE_DIR, f"logs_{year}.db")
+
+
+def list_archives(archive_dir: Optional[str] = None) -> List[Tuple[int, str]]:
+    """存在するアーカイブデータベースを新しい年から順に返します.
+
+    Returns:
+        list[tuple[int, str]]: (年, パス) のリスト.
+    """
+    directory = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(directory):
+        return []
+    archives = []
+    for name in os.listdir(directory):
+        match = _ARCHIVE_FILE_RE.match(name)
+        if match:
+            archives.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(archives, reverse=True)
+
+
+def archive_engine(path: str):
+    """アーカイブデータベースのエンジンを返します. 初回はテーブルを作成します."""
+    path = os.path.abspath(path)
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+            archive_metadata.create_all(engine)
+            _engines[path] = engine
+    return engine
+
+
+def retention_cutoff(months: int = None, now: Optional[datetime] = None) -> datetime:
+    """保持期間の起点となる日時 (これより前のログがアーカイブ対象) を返します.
+
+    Args:
+        months (int, optional): 保持期間 (月). 省略時は ``RETENTION_MONTHS``.
+        now (datetime, optional): 基準日時. 省略時は現在の UTC 日時.
+    """
+    months = RETENTION_MONTHS if months is None else months
+    now = now or models.utcnow()
+    month_index = now.year * 12 + now.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return now.replace(year=year, month=month, day=min(now.day, calendar.monthrange(year, month)[1]))
+
+
+def archive_logs(db: Session, cutoff: datetime, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 archive_dir: Optional[str] = None) -> schemas.ArchiveReport:
+    """``cutoff`` より前に作成されたログを年ごとのアーカイブデータベースへ移動します.
+
+    Args:
+        db (Session): データベースセッション.
+        cutoff (datetime): この日時より前のログを移動します.
+        chunk_size (int): 1 回のトランザクションで移動する件数.
+        archive_dir (str, optional): アーカイブの格納先. 省略時は ``ARCHIVE_DIR``.
+
+    Returns:
+        schemas.ArchiveReport: 移動した件数.
+    """
+    report = schemas.ArchiveReport(cutoff=cutoff)
+    table = models.Log.__table__
+    _reserve_archived_ids(db, archive_dir)
+    while True:
+        rows = db.execute(
+            select(table).where(table.c.created_at < cutoff).order_by(table.c.id).limit(chunk_size)
+        ).mappings().all()
+        # 読み取りトランザクションをアーカイブへの書き込み前に終了する
+        db.commit()
+        if not rows:
+            break
+
+        by_year: Dict[int, List[dict]] = {}
+        for row in rows:
+            by_year.setdefault(row["created_at"].year, []).append(dict(row))
+        for year, year_rows in by_year.items():
+            with archive_engine(archive_path(year, archive_dir)).begin() as connection:
+                new_rows = _unarchived_rows(connection, year_rows)
+                if new_rows:
+                    connection.execute(archived_logs.insert(), new_rows)
+            report.years[year] = report.years.get(year, 0) + len(year_rows)
+
+        _delete_chunk(db, [row["id"] for row in rows])
+        report.archived += len(rows)
+        report.chunks += 1
+    return report
+
+
+def _unarchived_rows(connection, rows: List[dict]) -> List[dict]:
+    """アーカイブにまだないログを返します.
+
+    前回の実行がアーカイブへの書き込み後、本体からの削除前に中断した場合は同じログが既に存在するため、
+    それらは書き込みを省きます.
+
+    Raises:
+        ArchiveConflictError: 同じ ID で内容の異なるログがアーカイブにある場合.
+    """
+    existing = {
+        row["id"]: row
+        for row in connection.execute(
+            select(archived_logs).where(archived_logs.c.id.in_([row["id"] for row in rows]))
+        ).mappings()
+    }
+    for row in rows:
+        archived = existing.get(row["id"])
+        if archived is not None and any(archived[name] != row[name] for name in _LOG_COLUMNS):
+            raise ArchiveConflictError(f"Log {row['id']} is already archived with different contents")
+    return [row for row in rows if row["id"] not in existing]
+
+
+@retry_on_locked
+def _reserve_archived_ids(db: Session, archive_dir: Optional[str] = None):
+    """アーカイブ済みの ID が新しいログに採番されないよう、``sqlite_sequence`` を進めます.
+
+    AUTOINCREMENT を指定する前に作成されたデータベースでは、アーカイブ済みの ID が
+    本体で再利用されている場合があるため、アーカイブの最大 ID 以降から採番させます.
+    """
+    archived_max = 0
+    for _, path in list_archives(archive_dir):
+        with archive_engine(path).connect() as connection:
+            archived_max = max(archived_max, connection.execute(select(func.max(archived_logs.c.id))).scalar() or 0)
+    if archived_max:
+        table = models.Log.__tablename__
+        db.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 "
+                 "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"),
+            {"name": table},
+        )
+        db.execute(
+            text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name AND seq < :seq"),
+            {"name": table, "seq": archived_max},
+        )
+    db.commit()
+
+
+@retry_on_locked
+def _delete_chunk(db: Session, ids: List[int]):
+    """アーカイブ済みのログを本体のデータベースから削除します."""
+    db.execute(delete(models.Log).where(models.Log.id.in_(ids)))
+    cache.bump_version(db, "logs")
+    db.commit()
+
+
+def history_page(db: Session, limit: int = 100, cursor: Optional[str] = None, item_id: Optional[int] = None,
+                 user_id: Optional[int] = None, archive_dir: Optional[str] = None):
+    """本体とアーカイブのログを合わせて ID の降順 (新しい順) で取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        limit (int): 取得する最大件数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        item_id (int, optional): 指定した場合、この備品のログのみを取得します.
+        user_id (int, optional): 指定した場合、このユーザーのログのみを取得します.
+        archive_dir (str, optional): アーカイブの格納先. 省略時は ``ARCHIVE_DIR``.
+
+    Returns:
+        tuple[list[dict], str | None]: ``schemas.HistoryEntry`` 形式の辞書のリストと次ページカーソル.
+
+    Raises:
+        pagination.InvalidCursorError: カーソルが不正な場合.
+    """
+    before = decode_cursor(cursor)["id"] if cursor else None
+    sources = [
+        [dict(row, archived=False) for row in _history_rows(db, models.Log.__table__, limit, before, item_id, user_id)]
+    ]
+    for _, path in list_archives(archive_dir):
+        with archive_engine(path).connect() as connection:
+            rows = _history_rows(connection, archived_logs, limit, before, item_id, user_id)
+            sources.append([dict(row, archived=True) for row in rows])
+
+    merged = list(heapq.merge(*sources, key=lambda row: row["id"], reverse=True))
+    page = merged[:limit]
+    next_cursor = encode_cursor({"id": page[-1]["id"]}) if len(merged) > limit else None
+    return page, next_cursor
+
+
+def _history_rows(connection, table, limit, before, item_id, user_id):
+    query = select(*(table.c[name] for name in _LOG_COLUMNS)).order_by(table.c.id.desc()).limit(limit + 1)
+    if before is not None:
+        query = query.where(table.c.id < before)
+    if item_id is not None:
+        query = query.where(table.c.item_id == item_id)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    return connection.execute(query).mappings().all()
+
+
+def main(argv=None):
+    """コマンドラインから保持期間を過ぎたログをアーカイブします."""
+    parser = argparse.ArgumentParser(description="保持期間を過ぎたログを年ごとのアーカイブデータベースへ移動します.")
+    parser.add_argument("--months", type=int, default=RETENTION_MONTHS, help="本体に残すログの期間 (月).")
+    parser.add_argument("--before", type=datetime.fromisoformat, help="この日時より前のログを移動します (--months より優先).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="1 回のトランザクションで移動する件数.")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="アーカイブの格納先ディレクトリ.")
+    parser.add_argument("--vacuum", action="store_true", help="移動後に VACUUM を実行してファイルを縮小します.")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, init_db
+
+    init_db()
+    cutoff = args.before or retention_cutoff(args.months)
+    db = SessionLocal()
+    try:
+        report = archive_logs(db, cutoff, chunk_size=args.chunk_size, archive_dir=args.archive_dir)
+    except ArchiveConflictError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    if args.vacuum and report.archived:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("VACUUM")
+    print(report.model_dump_json(indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,450 @@
+"""読み取り系エンドポイント向けのスナップショットキャッシュと ETag 生成.
+
+このモジュールは、``data_versions`` テーブルに保持されたバージョン番号を用いて
+シリアライズ済みのレスポンスをキャッシュする仕組みを提供します.
+
+備品・ユーザー・ログが ORM 経由で変更されると、フラッシュ時に対応する
+バージョンが同一トランザクション内で加算されます (sqladmin からの編集も含みます).
+同一プロセス内のキャッシュはコミット直後に無効化され、他のワーカープロセスは
+``CACHE_POLL_SECONDS`` 以内にバージョンの変化を検出します.
+
+認証済みユーザーのスナップショットは ``principal_cache`` にトークンのユーザー ID ごとに
+保持されます. ユーザーが変更されるとこのプロセスのキャッシュはコミット直後に破棄され、
+他のワーカープロセスでも ``PRINCIPAL_CACHE_TTL`` 秒以内に反映されます.
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+import weakref
+from typing import Callable, Hashable, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+# 他ワーカーでの変更を検出するまでの最大遅延 (秒)
+CACHE_POLL_SECONDS = float(os.environ.get("INVENTORY_CACHE_POLL_SECONDS", "2"))
+
+# 認証済みユーザーのスナップショットを保持する期間 (秒) と最大件数
+PRINCIPAL_CACHE_TTL = float(os.environ.get("INVENTORY_PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("INVENTORY_PRINCIPAL_CACHE_SIZE", "1024"))
+
+# ETag 付きレスポンスはキャッシュしてよいが、利用前に必ず再検証させる
+ETAG_CACHE_CONTROL = "no-cache"
+
+# バージョン管理対象のモデルとバージョン名の対応
+TRACKED_MODELS = {
+    models.Item: "items",
+    models.User: "users",
+    models.Log: "logs",
+}
+
+_caches: "weakref.WeakSet[VersionWatcher]" = weakref.WeakSet()
+
+
+def bump_version(db: Session, *names: str):
+    """指定したデータバージョンを現在のトランザクション内で加算します.
+
+    ORM のフラッシュを伴わない一括 UPDATE などを実行した場合に呼び出してください.
+    バージョンはトランザクションのコミットと同時に確定します.
+
+    Args:
+        db (Session): データベースセッション.
+        *names (str): 加算するバージョン名.
+    """
+    _execute_bump(db.connection(), names)
+    db.info.setdefault("bumped_versions", set()).update(names)
+
+
+def get_versions(db: Session, names: Tuple[str, ...]) -> Tuple[int, ...]:
+    """指定したデータバージョンの現在値を取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        names (tuple[str, ...]): 取得するバージョン名.
+
+    Returns:
+        tuple[int, ...]: ``names`` と同じ順序のバージョン番号. 未作成のものは 0.
+    """
+    table = models.DataVersion.__table__
+    rows = db.execute(
+        select(table.c.name, table.c.version).where(table.c.name.in_(names))
+    ).all()
+    found = dict(rows)
+    return tuple(found.get(name, 0) for name in names)
+
+
+def _execute_bump(connection, names):
+    table = models.DataVersion.__table__
+    for name in sorted(set(names)):
+        stmt = sqlite_insert(table).values(name=name, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"version": table.c.version + 1},
+        )
+        connection.execute(stmt)
+
+
+class VersionWatcher:
+    """データバージョンを一定間隔でポーリングして保持します.
+
+    Attributes:
+        names (tuple[str, ...]): 監視するデータバージョン名.
+        poll_interval (float): データベース上のバージョンを再確認する間隔 (秒).
+    """
+
+    def __init__(self, names: Tuple[str, ...], poll_interval: float = CACHE_POLL_SECONDS):
+        self.names = tuple(names)
+        self.poll_interval = poll_interval
+        self._versions: Optional[Tuple[int, ...]] = None
+        self._checked_at = 0.0
+        _caches.add(self)
+
+    def current_versions(self, db: Session) -> Tuple[int, ...]:
+        """監視しているデータバージョンを返します.
+
+        前回の確認から ``poll_interval`` 秒以内であれば、データベースへ問い合わせずに
+        前回の値を返します.
+
+        Args:
+            db (Session): データベースセッション.
+
+        Returns:
+            tuple[int, ...]: データバージョンの組.
+        """
+        versions = self._versions
+        if versions is None or time.monotonic() - self._checked_at >= self.poll_interval:
+            versions = get_versions(db, self.names)
+            self._versions = versions
+            self._checked_at = time.monotonic()
+        return versions
+
+    def invalidate(self):
+        """次回アクセス時にデータベース上のバージョンを再確認させます."""
+        self._checked_at = 0.0
+        self._versions = None
+
+    def clear(self):
+        """保持している状態を破棄します."""
+        self.invalidate()
+
+
+class SnapshotCache(VersionWatcher):
+    """データバージョンに紐づくシリアライズ済みペイロードを保持するキャッシュ.
+
+    ペイロードはバージョンと任意の追加キー (日付など) の組に対して 1 つだけ保持されます.
+    同時に発生したキャッシュミスはロックで直列化され、再構築は 1 回にまとめられます.
+    """
+
+    def __init__(self, names: Tuple[str, ...], poll_interval: float = CACHE_POLL_SECONDS):
+        super().__init__(names, poll_interval)
+        self._lock = threading.Lock()
+        self._key = None
+        self._payload: Optional[bytes] = None
+
+    def get(self, db: Session, build: Callable[[Session], bytes], key: Hashable = None) -> Tuple[Tuple[int, ...], bytes]:
+        """キャッシュされたペイロードを取得し、古い場合は再構築します.
+
+        Args:
+            db (Session): データベースセッション.
+            build (Callable[[Session], bytes]): ペイロードを構築する関数.
+            key (Hashable, optional): バージョン以外にペイロードが依存する値.
+
+        Returns:
+            tuple[tuple[int, ...], bytes]: ペイロードのデータバージョンとペイロード本体.
+        """
+        versions = self.current_versions(db)
+        cache_key = (versions, key)
+        payload = self._payload
+        if self._key == cache_key and payload is not None:
+            return versions, payload
+
+        with self._lock:
+            # 待機中に他のスレッドが再構築済みであればそれを返す
+            if self._key == cache_key and self._payload is not None:
+                return versions, self._payload
+            payload = build(db)
+            self._payload = payload
+            self._key = cache_key
+        return versions, payload
+
+    def clear(self):
+        """保持しているペイロードとバージョンを破棄します."""
+        with self._lock:
+            self._key = None
+            self._payload = None
+            self.invalidate()
+
+
+class CountCache(VersionWatcher):
+    """データバージョンごとに件数 (COUNT) の結果を保持するキャッシュ.
+
+    バージョンが変わると保持している件数はすべて破棄されます.
+
+    Attributes:
+        max_entries (int): 保持する件数の最大数 (フィルター条件の組み合わせ数).
+    """
+
+    def __init__(self, names: Tuple[str, ...], poll_interval: float = CACHE_POLL_SECONDS, max_entries: int = 256):
+        super().__init__(names, poll_interval)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counts_versions: Optional[Tuple[int, ...]] = None
+        self._counts: dict = {}
+
+    def get(self, db: Session, count: Callable[[Session], int], key: Hashable = None) -> int:
+        """キャッシュされた件数を取得し、ない場合は計算します.
+
+        Args:
+            db (Session): データベースセッション.
+            count (Callable[[Session], int]): 件数を計算する関数.
+            key (Hashable, optional): フィルター条件など、件数が依存する値.
+
+        Returns:
+            int: 件数.
+        """
+        versions = self.current_versions(db)
+        with self._lock:
+            if self._counts_versions == versions and key in self._counts:
+                return self._counts[key]
+        value = count(db)
+        with self._lock:
+            if self._counts_versions != versions or len(self._counts) >= self.max_entries:
+                self._counts = {}
+                self._counts_versions = versions
+            self._counts[key] = value
+        return value
+
+    def clear(self):
+        """保持している件数とバージョンを破棄します."""
+        with self._lock:
+            self._counts = {}
+            self._counts_versions = None
+            self.invalidate()
+
+
+class PrincipalCache:
+    """有効期限付きの LRU キャッシュ. 認証済みユーザーのスナップショットを保持します.
+
+    エントリーは ``ttl`` 秒で期限切れになり、``max_entries`` を超えると最も古く使われたものから
+    破棄されます. 値の取得中に ``invalidate`` された場合、取得した値は保存されません.
+
+    Attributes:
+        name (str): キャッシュ名.
+        ttl (float): エントリーの有効期間 (秒).
+        max_entries (int): 保持するエントリーの最大数.
+        hits (int): ヒット数.
+        misses (int): ミス数 (期限切れを含む).
+        evictions (int): 容量超過で破棄したエントリーの数.
+        invalidations (int): 無効化の回数.
+    """
+
+    def __init__(self, name: str, ttl: float = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[Hashable, Tuple[float, object]]" = collections.OrderedDict()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """無効化のたびに増える世代番号. ``put`` に渡して古い値の保存を防ぎます."""
+        return self._generation
+
+    def get(self, key: Hashable):
+        """キャッシュされた値を返します. ないか期限切れの場合は None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value, generation: Optional[int] = None):
+        """値を保存します.
+
+        Args:
+            key (Hashable): キー.
+            value: 保存する値.
+            generation (int, optional): 値の取得前に読んだ ``generation``. その後に無効化されていた場合は保存しません.
+        """
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable = None):
+        """指定したキー (省略時はすべて) のエントリーを破棄します."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """エントリーと統計情報を破棄します."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> schemas.CacheStats:
+        """ヒット数・ミス数などの統計情報を返します."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return schemas.CacheStats(
+                name=self.name,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+                hit_ratio=self.hits / lookups if lookups else 0.0,
+            )
+
+
+def make_etag(*parts) -> str:
+    """データバージョンなどの値から強い ETag を生成します.
+
+    Args:
+        *parts: ETag の元となる値. 同じ値の組からは常に同じ ETag が生成されます.
+
+    Returns:
+        str: ダブルクォートで囲まれた ETag 文字列.
+    """
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` ヘッダーが ETag に一致するか判定します.
+
+    Args:
+        if_none_match (str, optional): リクエストの ``If-None-Match`` ヘッダー値.
+        etag (str): 現在のリソースの ETag.
+
+    Returns:
+        bool: 一致する場合は True.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """304 Not Modified レスポンスを生成します."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
+
+
+def set_etag_headers(response: Response, etag: str):
+    """レスポンスに ETag と再検証を要求する Cache-Control を設定します."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = ETAG_CACHE_CONTROL
+
+
+def invalidate_all():
+    """このプロセス内のすべてのキャッシュにバージョンの再確認を要求します."""
+    for snapshot_cache in list(_caches):
+        snapshot_cache.invalidate()
+
+
+def clear_all():
+    """このプロセス内のすべてのキャッシュを破棄します."""
+    for snapshot_cache in list(_caches):
+        snapshot_cache.clear()
+    principal_cache.clear()
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changed_versions(session, flush_context, instances):
+    """フラッシュ対象のオブジェクトから加算すべきバージョン名を収集します."""
+    names = set()
+    for obj in session.new | session.deleted:
+        name = TRACKED_MODELS.get(type(obj))
+        if name:
+            names.add(name)
+    for obj in session.dirty:
+        name = TRACKED_MODELS.get(type(obj))
+        if name and session.is_modified(obj, include_collections=False):
+            names.add(name)
+    if names:
+        session.info.setdefault("pending_versions", set()).update(names)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_versions(session, flush_context):
+    """収集したバージョンをフラッシュと同じトランザクション内で加算します."""
+    names = session.info.pop("pending_versions", None)
+    if names:
+        _execute_bump(session.connection(), names)
+        session.info.setdefault("bumped_versions", set()).update(names)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    """バージョンを加算したトランザクションのコミット後にローカルキャッシュを無効化します.
+
+    ユーザーが変更された場合 (sqladmin や一括インポートを含む) は認証済みユーザーのキャッシュも破棄します.
+    """
+    names = session.info.pop("bumped_versions", None)
+    if names:
+        invalidate_all()
+        if "users" in names:
+            principal_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    """ロールバックされたトランザクションで収集したバージョンを破棄します."""
+    session.info.pop("pending_versions", None)
+    session.info.pop("bumped_versions", None)
+
+
+items_status_cache = SnapshotCache(("items", "users"))
+"""``GET /api/v1/items/status`` のレスポンスキャッシュ."""
+
+items_count = CountCache(("items",))
+"""備品の総件数キャッシュ. ``GET /api/v1/items/`` の ETag 生成にも使用します."""
+
+users_count = CountCache(("users",))
+"""ユーザーの総件数キャッシュ. ``GET /api/v1/users/`` の ETag 生成にも使用します."""
+
+logs_count = CountCache(("logs",))
+"""ログの総件数キャッシュ. ``GET /api/v1/logs/`` の ETag 生成にも使用します."""
+
+principal_cache = PrincipalCache("principals")
+"""トークンのユーザー ID (``uid``) ごとの ``schemas.Principal`` のキャッシュ. ユーザー名はキーに含みません."""
@@ -2,10 +2,14 @@
 
 このモジュールには、データベース内のユーザーと備品の作成 (Create)、
 読み取り (Read)、更新 (Update)、削除 (Delete) を行うための関数が含まれています.
+書き込みを行う関数は、ロック競合で失敗した場合に ``database.retry_on_locked`` によって再試行されます.
 """
 
-from sqlalchemy.orm import Session
-from . import models, schemas, security
+from sqlalchemy import func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session, joinedload
+from . import cache, models, schemas, search, security, stats  # cache: 変更時にデータバージョンを加算するイベントを登録
+from .database import retry_on_locked
+from .pagination import keyset_paginate
 from datetime import date
 from sqlalchemy.exc import IntegrityError
 
@@ -46,6 +50,35 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     """
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def get_users_page(db: Session, limit: int = 100, cursor: str = None, skip: int = 0):
+    """ユーザーのリストを ID 順のキーセットページネーションで取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        limit (int): 取得する最大レコード数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        skip (int): カーソル未指定時にスキップするレコード数.
+    
+    Returns:
+        tuple[list[models.User], str | None]: ユーザーのリストと次ページカーソル.
+    
+    Raises:
+        pagination.InvalidCursorError: カーソルが不正な場合.
+    """
+    return keyset_paginate(db.query(models.User), models.User.id, limit, cursor=cursor, skip=skip)
+
+def count_users(db: Session):
+    """ユーザーの総数を取得します.
+
+    Args:
+        db (Session): データベースセッション.
+    
+    Returns:
+        int: ユーザー数.
+    """
+    return db.query(func.count(models.User.id)).scalar()
+
+@retry_on_locked
 def create_user(db: Session, user: schemas.UserCreate):
     """新規ユーザーを作成します.
 
@@ -71,18 +104,189 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
+def get_items(db: Session, skip: int = 0, limit: int = 100, with_owner: bool = False):
     """備品のリストを取得します.
 
     Args:
         db (Session): データベースセッション.
         skip (int): スキップするレコード数.
         limit (int): 取得する最大レコード数.
+        with_owner (bool): Trueの場合、所有者を同一クエリで読み込みます.
     
     Returns:
         list[models.Item]: 備品オブジェクトのリスト.
     """
-    return db.query(models.Item).offset(skip).limit(limit).all()
+    query = db.query(models.Item)
+    if with_owner:
+        query = query.options(joinedload(models.Item.owner))
+    return query.offset(skip).limit(limit).all()
+
+# 備品一覧で並べ替えに使用できる列
+ITEM_SORT_FIELDS = {
+    "id": models.Item.id,
+    "name": models.Item.name,
+    "management_code": models.Item.management_code,
+    "category": models.Item.category,
+    "status": models.Item.status,
+    "due_date": models.Item.due_date,
+}
+
+def get_items_page(db: Session, limit: int = 100, cursor: str = None, skip: int = 0, with_owner: bool = False,
+                   filters: schemas.ItemFilter = None, sort: str = "id"):
+    """備品のリストをキーセットページネーションで取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        limit (int): 取得する最大レコード数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        skip (int): カーソル未指定時にスキップするレコード数.
+        with_owner (bool): Trueの場合、所有者を同一クエリで読み込みます.
+        filters (schemas.ItemFilter, optional): 絞り込み条件.
+        sort (str): 並べ替えに使用する列名 (``ITEM_SORT_FIELDS`` のいずれか).
+            先頭に ``-`` を付けると降順になります.
+    
+    Returns:
+        tuple[list[models.Item], str | None]: 備品のリストと次ページカーソル.
+    
+    Raises:
+        ValueError: ``sort`` が許可されていない列の場合.
+        pagination.InvalidCursorError: カーソルが不正な場合.
+    """
+    descending = sort.startswith("-")
+    sort_name = sort.lstrip("-")
+    if sort_name not in ITEM_SORT_FIELDS:
+        raise ValueError(f"Unsupported sort field: {sort_name}")
+    sort_column = None if sort_name == "id" else ITEM_SORT_FIELDS[sort_name]
+
+    query = db.query(models.Item)
+    if filters is not None:
+        query = _filter_items(query, filters)
+    if with_owner:
+        query = query.options(joinedload(models.Item.owner))
+    return keyset_paginate(query, models.Item.id, limit, cursor=cursor, skip=skip,
+                           descending=descending, sort_column=sort_column)
+
+def _filter_items(query, filters: schemas.ItemFilter):
+    if filters.status is not None:
+        query = query.filter(models.Item.status == filters.status)
+    if filters.category is not None:
+        query = query.filter(models.Item.category == filters.category)
+    if filters.is_fixed_asset is not None:
+        query = query.filter(models.Item.is_fixed_asset == filters.is_fixed_asset)
+    if filters.owner_id is not None:
+        query = query.filter(models.Item.owner_id == filters.owner_id)
+    if filters.due_before is not None:
+        query = query.filter(models.Item.due_date <= filters.due_before)
+    if filters.due_after is not None:
+        query = query.filter(models.Item.due_date >= filters.due_after)
+    if filters.overdue is True:
+        query = query.filter(
+            models.Item.status == models.ItemStatus.borrowed.value,
+            models.Item.due_date < date.today(),
+        )
+    elif filters.overdue is False:
+        query = query.filter(or_(
+            models.Item.status != models.ItemStatus.borrowed.value,
+            models.Item.due_date.is_(None),
+            models.Item.due_date >= date.today(),
+        ))
+    return query
+
+def iter_items(db: Session, batch_size: int = 500, with_owner: bool = False):
+    """すべての備品を ID 順にバッチ単位で取得するジェネレーター.
+
+    Args:
+        db (Session): データベースセッション.
+        batch_size (int): 1 回のクエリで取得するレコード数.
+        with_owner (bool): Trueの場合、所有者を同一クエリで読み込みます.
+    
+    Yields:
+        models.Item: 備品オブジェクト.
+    """
+    cursor = None
+    while True:
+        items, cursor = get_items_page(db, limit=batch_size, cursor=cursor, with_owner=with_owner)
+        yield from items
+        if cursor is None:
+            break
+
+def count_items(db: Session, filters: schemas.ItemFilter = None):
+    """備品の総数を取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        filters (schemas.ItemFilter, optional): 絞り込み条件.
+    
+    Returns:
+        int: 備品数.
+    """
+    query = db.query(func.count(models.Item.id))
+    if filters is not None:
+        query = _filter_items(query, filters)
+    return query.scalar()
+
+def get_logs_page(db: Session, limit: int = 100, cursor: str = None, item_id: int = None, user_id: int = None):
+    """ログのリストを新しい順のキーセットページネーションで取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        limit (int): 取得する最大レコード数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        item_id (int, optional): 指定した場合、この備品のログのみを取得します.
+        user_id (int, optional): 指定した場合、このユーザーのログのみを取得します.
+    
+    Returns:
+        tuple[list[models.Log], str | None]: ログのリストと次ページカーソル.
+    
+    Raises:
+        pagination.InvalidCursorError: カーソルが不正な場合.
+    """
+    query = _filter_logs(db.query(models.Log), item_id=item_id, user_id=user_id)
+    return keyset_paginate(query, models.Log.id, limit, cursor=cursor, descending=True)
+
+def count_logs(db: Session, item_id: int = None, user_id: int = None):
+    """ログの総数を取得します.
+
+    Args:
+        db (Session): データベースセッション.
+        item_id (int, optional): 指定した場合、この備品のログのみを数えます.
+        user_id (int, optional): 指定した場合、このユーザーのログのみを数えます.
+    
+    Returns:
+        int: ログ数.
+    """
+    query = _filter_logs(db.query(func.count(models.Log.id)), item_id=item_id, user_id=user_id)
+    return query.scalar()
+
+def _filter_logs(query, item_id: int = None, user_id: int = None):
+    if item_id is not None:
+        query = query.filter(models.Log.item_id == item_id)
+    if user_id is not None:
+        query = query.filter(models.Log.user_id == user_id)
+    return query
+
+def search_items(db: Session, q: str, limit: int = 20):
+    """全文検索で備品を関連度順に取得します.
+
+    名前・管理コード・カテゴリ・付属品を対象に、入力された各単語に前方一致する
+    備品を検索します.
+
+    Args:
+        db (Session): データベースセッション.
+        q (str): 検索文字列.
+        limit (int): 取得する最大レコード数.
+    
+    Returns:
+        list[models.Item]: 関連度の高い順に並んだ備品オブジェクトのリスト.
+    """
+    match = search.build_match_query(q)
+    if not match:
+        return []
+    ids = search.ranked_ids(db, match, limit)
+    if not ids:
+        return []
+    items = {item.id: item for item in db.query(models.Item).filter(models.Item.id.in_(ids))}
+    return [items[item_id] for item_id in ids if item_id in items]
 
 def get_item(db: Session, item_id: int):
     """IDで備品を取得します.
@@ -96,6 +300,7 @@ def get_item(db: Session, item_id: int):
     """
     return db.query(models.Item).filter(models.Item.id == item_id).first()
 
+@retry_on_locked
 def create_item(db: Session, item: schemas.ItemCreate):
     """新規備品を作成します.
 
@@ -112,6 +317,7 @@ def create_item(db: Session, item: schemas.ItemCreate):
     db.refresh(db_item)
     return db_item
 
+@retry_on_locked
 def delete_item(db: Session, item_id: int):
     """IDで備品を削除します.
 
@@ -129,9 +335,22 @@ def delete_item(db: Session, item_id: int):
         return True
     return False
 
+class ItemStateConflictError(ValueError):
+    """備品の状態が操作の前提と異なる場合に送出される例外.
+
+    貸出中の備品を貸し出そうとした場合や、同時に実行された別のリクエストとの
+    競合に負けた場合に送出されます. API では 409 Conflict に対応します.
+    """
+
+
+@retry_on_locked
 def borrow_item(db: Session, item_id: int, user_id: int, due_date: date, lending_reason: str = None, lending_location: str = None):
     """備品を貸し出します.
 
+    ``status`` が ``available`` の場合のみ更新する条件付き UPDATE (compare-and-set) で
+    貸出中に変更するため、同じ備品への同時リクエストのうち成功するのは 1 件だけです.
+    ログは同じトランザクション内で挿入されます.
+
     Args:
         db (Session): データベースセッション.
         item_id (int): 貸し出す備品のID.
@@ -144,64 +363,287 @@ def borrow_item(db: Session, item_id: int, user_id: int, due_date: date, lending
         models.Item: 更新された備品オブジェクト. 見つからない場合は None.
     
     Raises:
-        ValueError: 備品が利用可能でない場合.
+        ItemStateConflictError: 備品が利用可能でない場合.
     """
-    # Lock the row? For SQLite it's less critical but good practice.
-    # Here we just fetch and check.
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if not item:
-        return None
-    
-    if item.status != models.ItemStatus.available.value:
-        raise ValueError("Item is not available")
-    
-    item.status = models.ItemStatus.borrowed.value
-    item.owner_id = user_id
-    item.due_date = due_date
-    item.lending_reason = lending_reason
-    item.lending_location = lending_location
-    
-    log = models.Log(item_id=item_id, user_id=user_id, action=models.LogAction.borrow.value)
-    db.add(log)
-    
+    item = db.scalars(
+        update(models.Item)
+        .where(models.Item.id == item_id, models.Item.status == models.ItemStatus.available.value)
+        .values(
+            status=models.ItemStatus.borrowed.value,
+            owner_id=user_id,
+            due_date=due_date,
+            lending_reason=lending_reason,
+            lending_location=lending_location,
+        )
+        .returning(models.Item)
+        .execution_options(populate_existing=True)
+    ).first()
+    if item is None:
+        exists = db.query(models.Item.id).filter(models.Item.id == item_id).first()
+        db.rollback()
+        if not exists:
+            return None
+        raise ItemStateConflictError("Item is not available")
+
+    now = models.utcnow()
+    db.execute(insert(models.Log).values(item_id=item_id, user_id=user_id, action=models.LogAction.borrow.value, created_at=now))
+    stats.record_borrows(db, user_id, [item_id], now)
+    cache.bump_version(db, "items", "logs")
     db.commit()
     db.refresh(item)
     return item
 
-def return_item(db: Session, item_id: int, user_id: int, force: bool = False):
+@retry_on_locked
+def return_item(db: Session, item_id: int, user_id: int = None, force: bool = False):
     """備品を返却します.
 
+    ログの挿入 (``INSERT ... SELECT``) を最初に実行し、その時点で ``status`` が
+    ``borrowed`` である場合のみ処理を続けます. 書き込みロックはこの文で取得されるため、
+    同じ備品への同時リクエストのうち成功するのは 1 件だけです.
+
     Args:
         db (Session): データベースセッション.
         item_id (int): 返却する備品のID.
-        user_id (int): 備品を返却するユーザーのID.
+        user_id (int, optional): 備品を返却するユーザーのID. None の場合は返却時点の借用者をログに記録します.
+            借用者のいない貸出中の備品 (不整合なデータ) は、ログに記録するユーザーが分からないため返却しません.
         force (bool): Trueの場合、所有者チェックをバイパスします (管理者強制返却).
     
     Returns:
         models.Item: 更新された備品オブジェクト. 見つからない場合は None.
     
     Raises:
-        ValueError: 備品が貸出中でない場合、またはユーザーが借用者でない場合 (force=Falseのとき).
+        ItemStateConflictError: 備品が貸出中でない場合、または ``user_id`` が None で借用者がいない場合.
+        ValueError: ユーザーが借用者でない場合 (force=Falseのとき).
     """
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if not item:
-        return None
-    
-    if item.status != models.ItemStatus.borrowed.value:
-        raise ValueError("Item is not borrowed")
-    
-    if not force and item.owner_id != user_id:
-         raise ValueError("User is not the borrower")
-    
-    item.status = models.ItemStatus.available.value
-    item.owner_id = None
-    item.due_date = None
-    item.lending_reason = None
-    item.lending_location = None
-    
-    log = models.Log(item_id=item_id, user_id=user_id, action=models.LogAction.return_.value)
-    db.add(log)
-    
+    conditions = [models.Item.id == item_id, models.Item.status == models.ItemStatus.borrowed.value]
+    if not force:
+        conditions.append(models.Item.owner_id == user_id)
+    if user_id is None:
+        conditions.append(models.Item.owner_id.is_not(None))
+    now = models.utcnow()
+    log_user = models.Item.owner_id if user_id is None else literal(user_id)
+    logged = db.execute(
+        insert(models.Log).from_select(
+            ["item_id", "user_id", "action", "created_at"],
+            select(
+                models.Item.id,
+                log_user,
+                literal(models.LogAction.return_.value),
+                literal(now, models.Log.created_at.type),
+            ).where(*conditions),
+        )
+    ).rowcount
+    if not logged:
+        item = db.query(models.Item.status, models.Item.owner_id).filter(models.Item.id == item_id).first()
+        db.rollback()
+        if not item:
+            return None
+        if item.status != models.ItemStatus.borrowed.value:
+            raise ItemStateConflictError("Item is not borrowed")
+        if item.owner_id is None and user_id is None:
+            raise ItemStateConflictError("Item has no borrower to record the return for")
+        raise ValueError("User is not the borrower")
+
+    # 書き込みロックは取得済みのため、借用者は返却まで変化しない
+    owner_id = db.execute(select(models.Item.owner_id).where(models.Item.id == item_id)).scalar()
+    stats.record_returns(db, {item_id: owner_id}, now)
+    item = db.scalars(
+        update(models.Item)
+        .where(models.Item.id == item_id)
+        .values(
+            status=models.ItemStatus.available.value,
+            owner_id=None,
+            due_date=None,
+            lending_reason=None,
+            lending_location=None,
+        )
+        .returning(models.Item)
+        .execution_options(populate_existing=True)
+    ).one()
+    cache.bump_version(db, "items", "logs")
     db.commit()
     db.refresh(item)
     return item
+
+def _resolve_bulk_items(db: Session, selection: schemas.BulkItemSelection):
+    """一括操作の対象備品を 1 回のクエリで解決します.
+
+    Returns:
+        list[tuple[str, models.Item | None, str | None]]: リクエスト順の
+            (キー, 備品, エラー) のリスト.
+    """
+    conditions = []
+    if selection.item_ids:
+        conditions.append(models.Item.id.in_(selection.item_ids))
+    if selection.management_codes:
+        conditions.append(models.Item.management_code.in_(selection.management_codes))
+    items = db.query(models.Item).filter(or_(*conditions)).all()
+    by_id = {item.id: item for item in items}
+    by_code = {item.management_code: item for item in items}
+
+    resolved = []
+    seen = set()
+    keys = [(str(i), by_id.get(i)) for i in selection.item_ids]
+    keys += [(code, by_code.get(code)) for code in selection.management_codes]
+    for key, item in keys:
+        if item is None:
+            resolved.append((key, None, "Item not found"))
+        elif item.id in seen:
+            resolved.append((key, item, "Duplicate item"))
+        else:
+            seen.add(item.id)
+            resolved.append((key, item, None))
+    return resolved
+
+def _bulk_result(selection: schemas.BulkItemSelection, resolved, errors: dict, applied: bool):
+    results = []
+    for key, item, error in resolved:
+        item_id = item.id if item is not None else None
+        error = error or errors.get(item_id)
+        if error is None and not applied:
+            error = "Rolled back"
+        results.append(schemas.BulkItemResult(key=key, item_id=item_id, success=error is None, error=error))
+    succeeded = sum(1 for r in results if r.success)
+    return schemas.BulkOperationResult(
+        mode=selection.mode, succeeded=succeeded, failed=len(results) - succeeded, results=results
+    )
+
+@retry_on_locked
+def bulk_borrow_items(db: Session, request: schemas.BulkBorrowRequest, user_id: int):
+    """複数の備品を 1 つのトランザクションで貸し出します.
+
+    対象備品は 1 回のクエリで解決され、利用可能な備品のみを条件付きの一括 UPDATE で
+    貸出中に変更します. ログは一括で挿入され、コミットは 1 回だけ行われます.
+
+    Args:
+        db (Session): データベースセッション.
+        request (schemas.BulkBorrowRequest): 一括貸出リクエスト.
+        user_id (int): 備品を借りるユーザーのID.
+    
+    Returns:
+        schemas.BulkOperationResult: 備品ごとの結果. ``all_or_nothing`` モードで
+            失敗が含まれる場合、変更は反映されません.
+    """
+    resolved = _resolve_bulk_items(db, request)
+    errors = {}
+    for _, item, error in resolved:
+        if error is None and item.status != models.ItemStatus.available.value:
+            errors[item.id] = "Item is not available"
+    candidates = [item.id for _, item, error in resolved if error is None and item.id not in errors]
+    all_or_nothing = request.mode == "all_or_nothing"
+    if all_or_nothing and len(candidates) < len(resolved):
+        db.rollback()
+        return _bulk_result(request, resolved, errors, applied=False)
+
+    borrowed = set()
+    if candidates:
+        borrowed = set(db.execute(
+            update(models.Item)
+            .where(models.Item.id.in_(candidates), models.Item.status == models.ItemStatus.available.value)
+            .values(
+                status=models.ItemStatus.borrowed.value,
+                owner_id=user_id,
+                due_date=request.due_date,
+                lending_reason=request.lending_reason,
+                lending_location=request.lending_location,
+            )
+            .returning(models.Item.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    for item_id in candidates:
+        if item_id not in borrowed:
+            errors[item_id] = "Item is not available"
+    if all_or_nothing and len(borrowed) < len(candidates):
+        db.rollback()
+        return _bulk_result(request, resolved, errors, applied=False)
+
+    if borrowed:
+        now = models.utcnow()
+        borrowed_ids = [item_id for item_id in candidates if item_id in borrowed]
+        db.execute(insert(models.Log), [
+            {"item_id": item_id, "user_id": user_id, "action": models.LogAction.borrow.value, "created_at": now}
+            for item_id in borrowed_ids
+        ])
+        stats.record_borrows(db, user_id, borrowed_ids, now)
+        cache.bump_version(db, "items", "logs")
+    db.commit()
+    return _bulk_result(request, resolved, errors, applied=True)
+
+@retry_on_locked
+def bulk_return_items(db: Session, request: schemas.BulkReturnRequest):
+    """複数の備品を 1 つのトランザクションで返却します.
+
+    ログには各備品の現在の借用者が記録されます. 借用者のいない貸出中の備品 (不整合なデータ) は、
+    単体の返却 API と同様に返却しません. 対象備品の解決は ``bulk_borrow_items`` と同様に行い、
+    ログの一括挿入 (``INSERT ... SELECT``) の後に一括 UPDATE を行います.
+
+    Args:
+        db (Session): データベースセッション.
+        request (schemas.BulkReturnRequest): 一括返却リクエスト.
+    
+    Returns:
+        schemas.BulkOperationResult: 備品ごとの結果. ``all_or_nothing`` モードで
+            失敗が含まれる場合、変更は反映されません.
+    """
+    resolved = _resolve_bulk_items(db, request)
+    errors = {}
+    owners = {}
+    for _, item, error in resolved:
+        if error is not None:
+            continue
+        if item.status != models.ItemStatus.borrowed.value:
+            errors[item.id] = "Item is not borrowed"
+        elif item.owner_id is None:
+            errors[item.id] = "Item has no borrower"
+        else:
+            owners[item.id] = item.owner_id
+    all_or_nothing = request.mode == "all_or_nothing"
+    if all_or_nothing and len(owners) < len(resolved):
+        db.rollback()
+        return _bulk_result(request, resolved, errors, applied=False)
+
+    # return_item と同様にログの挿入 (INSERT ... SELECT) を最初に実行して書き込みロックを取得し、
+    # 挿入時点の借用者をログに記録する. SELECT から挿入までの間に返却・再貸出された備品でも
+    # 以前の借用者を記録することはない
+    now = models.utcnow()
+    returned_owners = {}
+    if owners:
+        returned_owners = dict(db.execute(
+            insert(models.Log).from_select(
+                ["item_id", "user_id", "action", "created_at"],
+                select(
+                    models.Item.id,
+                    models.Item.owner_id,
+                    literal(models.LogAction.return_.value),
+                    literal(now, models.Log.created_at.type),
+                ).where(
+                    models.Item.id.in_(list(owners)),
+                    models.Item.status == models.ItemStatus.borrowed.value,
+                    models.Item.owner_id.is_not(None),
+                ),
+            ).returning(models.Log.item_id, models.Log.user_id)
+        ).all())
+    for item_id in owners:
+        if item_id not in returned_owners:
+            errors[item_id] = "Item is not borrowed"
+    if all_or_nothing and len(returned_owners) < len(owners):
+        db.rollback()
+        return _bulk_result(request, resolved, errors, applied=False)
+
+    if returned_owners:
+        db.execute(
+            update(models.Item)
+            .where(models.Item.id.in_(list(returned_owners)))
+            .values(
+                status=models.ItemStatus.available.value,
+                owner_id=None,
+                due_date=None,
+                lending_reason=None,
+                lending_location=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        stats.record_returns(db, returned_owners, now)
+        cache.bump_version(db, "items", "logs")
+    db.commit()
+    return _bulk_result(request, resolved, errors, applied=True)
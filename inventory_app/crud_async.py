@@ -0,0 +1,53 @@
+"""Item Manager アプリケーションの非同期 CRUD 操作.
+
+このモジュールには、``AsyncSession`` を使用する ``crud`` モジュールの非同期版の関数が
+含まれています. ``async def`` のエンドポイントや依存関係から使用し、
+イベントループをブロックせずにデータベースへアクセスします.
+"""
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    """IDでユーザーを取得します.
+
+    Args:
+        db (AsyncSession): 非同期データベースセッション.
+        user_id (int): 取得するユーザーのID.
+
+    Returns:
+        models.User: ユーザーオブジェクト. 見つからない場合は None.
+    """
+    return await db.get(models.User, user_id)
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    """ユーザー名でユーザーを取得します.
+
+    Args:
+        db (AsyncSession): 非同期データベースセッション.
+        username (str): 検索するユーザー名.
+
+    Returns:
+        models.User: ユーザーオブジェクト. 見つからない場合は None.
+    """
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+
+
+async def update_password_hash(db: AsyncSession, user_id: int, hashed_password: str):
+    """ユーザーのパスワードハッシュを更新します (ハッシュ設定の変更に伴う再ハッシュ用).
+
+    ハッシュ値はレスポンスにもキャッシュにも含まれないため、データバージョンは加算しません.
+
+    Args:
+        db (AsyncSession): 非同期データベースセッション.
+        user_id (int): ユーザーID.
+        hashed_password (str): 新しいハッシュ値.
+    """
+    await db.execute(update(models.User).where(models.User.id == user_id).values(hashed_password=hashed_password))
+    await db.commit()
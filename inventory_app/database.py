@@ -1,19 +1,396 @@
-from sqlalchemy import create_engine
+"""データベースエンジンとセッションの設定.
+
+エンジンの設定 (SQLite の PRAGMA とコネクションプールの大きさ) は環境変数から読み込まれます.
+
+- ``INVENTORY_DATABASE_URL``: データベース URL (既定値 ``sqlite:///./inventory.db``).
+- ``INVENTORY_ASYNC_DATABASE_URL``: 非同期エンジンの URL. 省略時は SQLite の URL から aiosqlite の URL を
+  作成します. SQLite 以外のデータベースでは指定が必要です.
+- ``INVENTORY_SQLITE_JOURNAL_MODE``, ``INVENTORY_SQLITE_SYNCHRONOUS``,
+  ``INVENTORY_SQLITE_BUSY_TIMEOUT_MS``, ``INVENTORY_SQLITE_CACHE_SIZE``,
+  ``INVENTORY_SQLITE_MMAP_SIZE``, ``INVENTORY_SQLITE_TEMP_STORE``,
+  ``INVENTORY_SQLITE_STATEMENT_CACHE``: ``EngineProfile`` の各 PRAGMA 設定.
+- ``INVENTORY_DB_POOL_SIZE``, ``INVENTORY_DB_MAX_OVERFLOW``, ``INVENTORY_DB_POOL_TIMEOUT``:
+  コネクションプールの設定.
+- ``INVENTORY_DB_WRITE_RETRIES``, ``INVENTORY_DB_RETRY_BASE_DELAY``:
+  ロック競合で失敗した書き込みの再試行回数と初回待ち時間の上限 (秒).
+"""
+
+import functools
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Mapping, Optional, Tuple
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateTable
+
+from . import metrics
+
+SQLALCHEMY_DATABASE_URL = os.environ.get("INVENTORY_DATABASE_URL", "sqlite:///./inventory.db")
+
+
+def async_database_url(url: str) -> Optional[URL]:
+    """同期エンジンの URL から aiosqlite を使う非同期エンジンの URL を作成します.
+
+    Returns:
+        URL | None: SQLite 以外のデータベースの場合は None.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return None
+    return parsed.set(drivername="sqlite+aiosqlite")
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./inventory.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+# SQLite 以外のデータベースでは、非同期ドライバーの URL を INVENTORY_ASYNC_DATABASE_URL で指定する
+ASYNC_SQLALCHEMY_DATABASE_URL = (
+    os.environ.get("INVENTORY_ASYNC_DATABASE_URL") or async_database_url(SQLALCHEMY_DATABASE_URL)
 )
+
+# ロック競合 (database is locked) で失敗した書き込みの再試行設定
+WRITE_RETRIES = int(os.environ.get("INVENTORY_DB_WRITE_RETRIES", "5"))
+RETRY_BASE_DELAY = float(os.environ.get("INVENTORY_DB_RETRY_BASE_DELAY", "0.05"))
+RETRY_MAX_DELAY = 1.0
+
+
+@dataclass(frozen=True)
+class EngineProfile:
+    """SQLite の PRAGMA とコネクションプールの設定.
+
+    Attributes:
+        journal_mode (str): ジャーナルモード. WAL では読み取りが書き込みを待たなくなります.
+        synchronous (str): 同期モード. WAL と NORMAL の組み合わせではコミットごとの fsync が不要になります.
+        busy_timeout_ms (int): ロックが解放されるまで待機する時間 (ミリ秒).
+        cache_size (int): ページキャッシュの大きさ. 負の値は KiB 単位.
+        mmap_size (int): メモリマップ I/O に使用する最大バイト数.
+        temp_store (str): 一時テーブルと一時インデックスの格納先.
+        statement_cache_size (int): コネクションごとにキャッシュするプリペアドステートメント数.
+        pool_size (int): コネクションプールの大きさ.
+        max_overflow (int): プールを超えて作成できるコネクション数.
+        pool_timeout (float): プールからコネクションを取得する際の待ち時間 (秒).
+    """
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    busy_timeout_ms: int = 5000
+    cache_size: int = -65536
+    mmap_size: int = 268435456
+    temp_store: str = "MEMORY"
+    statement_cache_size: int = 256
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "EngineProfile":
+        """環境変数から設定を読み込みます. 未設定の項目は既定値を使用します."""
+        default = cls()
+
+        def get(name, value):
+            return type(value)(environ.get(name, value))
+
+        return cls(
+            journal_mode=get("INVENTORY_SQLITE_JOURNAL_MODE", default.journal_mode),
+            synchronous=get("INVENTORY_SQLITE_SYNCHRONOUS", default.synchronous),
+            busy_timeout_ms=get("INVENTORY_SQLITE_BUSY_TIMEOUT_MS", default.busy_timeout_ms),
+            cache_size=get("INVENTORY_SQLITE_CACHE_SIZE", default.cache_size),
+            mmap_size=get("INVENTORY_SQLITE_MMAP_SIZE", default.mmap_size),
+            temp_store=get("INVENTORY_SQLITE_TEMP_STORE", default.temp_store),
+            statement_cache_size=get("INVENTORY_SQLITE_STATEMENT_CACHE", default.statement_cache_size),
+            pool_size=get("INVENTORY_DB_POOL_SIZE", default.pool_size),
+            max_overflow=get("INVENTORY_DB_MAX_OVERFLOW", default.max_overflow),
+            pool_timeout=get("INVENTORY_DB_POOL_TIMEOUT", default.pool_timeout),
+        )
+
+    def pragmas(self) -> List[Tuple[str, object]]:
+        """接続ごとに実行する PRAGMA の一覧を返します."""
+        return [
+            ("journal_mode", self.journal_mode),
+            ("synchronous", self.synchronous),
+            ("busy_timeout", self.busy_timeout_ms),
+            ("cache_size", self.cache_size),
+            ("mmap_size", self.mmap_size),
+            ("temp_store", self.temp_store),
+        ]
+
+    def engine_options(self, url: str) -> dict:
+        """``create_engine`` に渡すキーワード引数を返します.
+
+        SQLite 用の接続引数は SQLite の場合のみ設定します. インメモリの SQLite 以外では
+        コネクションプールの設定も含めます.
+        """
+        parsed = make_url(url)
+        options = {}
+        if parsed.get_backend_name() == "sqlite":
+            options["connect_args"] = {
+                "check_same_thread": False,
+                "cached_statements": self.statement_cache_size,
+                # ロック待ちは PRAGMA busy_timeout で制御する
+                "timeout": self.busy_timeout_ms / 1000,
+            }
+            if parsed.database in (None, "", ":memory:"):
+                return options
+        options.update(pool_size=self.pool_size, max_overflow=self.max_overflow, pool_timeout=self.pool_timeout)
+        return options
+
+
+def apply_profile(engine, profile: EngineProfile):
+    """エンジンが新しいコネクションを作成するたびに PRAGMA を実行させます.
+
+    SQLite 以外のエンジンには何もしません.
+
+    Args:
+        engine: 同期エンジン (非同期エンジンの場合は ``sync_engine``).
+        profile (EngineProfile): 適用する設定.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = profile.pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+class _TimedPoolMixin:
+    """プールからコネクションを取得するまでの時間を ``metrics.db_pool_checkout_seconds`` に記録します.
+
+    プールの ``checkout`` イベントはコネクションを取得した後に発生し、空きを待った時間を含まないため、
+    ``connect`` 自体の所要時間を計測します. 計測はセッションが最初に SQL を実行してコネクションを
+    取得したときに行われ、データベースを使わないリクエストではコネクションを取得しません.
+    """
+
+    metric_label = "sync"
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        metrics.db_pool_checkout_seconds.observe(time.perf_counter() - started, (self.metric_label,))
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """取得待ち時間を記録する同期エンジン用のプール."""
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """取得待ち時間を記録する非同期エンジン用のプール."""
+
+    metric_label = "async"
+
+
+def create_profiled_engine(url: str, profile: EngineProfile):
+    """設定を適用した同期エンジンを作成します."""
+    options = profile.engine_options(url)
+    if "pool_size" in options:
+        options["poolclass"] = TimedQueuePool
+    engine = create_engine(url, **options)
+    apply_profile(engine, profile)
+    return engine
+
+
+def create_profiled_async_engine(url: str, profile: EngineProfile):
+    """設定を適用した非同期エンジンを作成します."""
+    options = profile.engine_options(url)
+    if "pool_size" in options:
+        options["poolclass"] = TimedAsyncQueuePool
+    engine = create_async_engine(url, **options)
+    apply_profile(engine.sync_engine, profile)
+    return engine
+
+
+def is_lock_error(error: Exception) -> bool:
+    """例外が SQLite のロック競合 (locked / busy) によるものか判定します."""
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+def retry_on_locked(func):
+    """ロック競合で失敗した書き込みをジッター付き指数バックオフで再試行するデコレーター.
+
+    デコレートする関数は第 1 引数にセッションを受け取り、関数内でコミットまで
+    完結している必要があります. 失敗時はセッションをロールバックしてから再実行します.
+    """
+    @functools.wraps(func)
+    def wrapper(db, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(db, *args, **kwargs)
+            except OperationalError as e:
+                if attempt >= WRITE_RETRIES or not is_lock_error(e):
+                    raise
+                db.rollback()
+                time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+                attempt += 1
+    return wrapper
+
+
+engine_profile = EngineProfile.from_env()
+
+engine = create_profiled_engine(SQLALCHEMY_DATABASE_URL, engine_profile)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# async def のエンドポイントや依存関係からイベントループをブロックせずに使用するエンジン.
+# 非同期ドライバーの URL がない場合は作成しない
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_SQLALCHEMY_DATABASE_URL:
+    async_engine = create_profiled_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, engine_profile)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+def ensure_indexes(bind=engine):
+    """モデルに定義されたインデックスのうち、存在しないものを作成します.
+
+    ``create_all`` は既存テーブルに追加されたインデックスを作成しないため、
+    起動時にこの関数で不足分を補います.
+
+    Args:
+        bind: インデックスを作成するエンジンまたはコネクション.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+def ensure_columns(bind=engine):
+    """モデルに定義された列のうち、既存のテーブルにないものを追加します.
+
+    ``create_all`` は既存テーブルに追加された列を作成しないため、起動時にこの関数で
+    ``ALTER TABLE ... ADD COLUMN`` を実行します. 追加する列には NULL を許可するか
+    ``server_default`` を設定しておく必要があります.
+
+    Args:
+        bind: 対象のエンジン.
+    """
+    def missing_columns(connection):
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        missing = []
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            missing.extend((table, column) for column in table.columns if column.name not in existing)
+        return missing
+
+    if bind.dialect.name != "sqlite":
+        with bind.begin() as connection:
+            for table, column in missing_columns(connection):
+                connection.exec_driver_sql(_add_column_ddl(bind, table, column))
+        return
+    # ensure_autoincrement と同様に、同時に起動したワーカーが同じ列を追加しないよう
+    # 書き込みロックを取得してから不足している列を確認し直す
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if not missing_columns(connection):
+            return
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            for table, column in missing_columns(connection):
+                connection.exec_driver_sql(_add_column_ddl(bind, table, column))
+        except BaseException:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+        connection.exec_driver_sql("COMMIT")
+
+def _add_column_ddl(bind, table, column) -> str:
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+def _needs_autoincrement(connection, table) -> bool:
+    ddl = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+    ).scalar()
+    return ddl is not None and "AUTOINCREMENT" not in ddl.upper()
+
+def ensure_autoincrement(bind=engine):
+    """``sqlite_autoincrement`` を指定したテーブルのうち、既存のものを AUTOINCREMENT 付きで作り直します.
+
+    ``create_all`` は既存テーブルの定義を変更しないため、新しいテーブルを作成して行をコピーし、
+    元のテーブルと置き換えます. インデックスはこの後の ``ensure_indexes`` で作成されます.
+    ``sqlite_sequence`` にはコピーした行の最大 ID が記録されます.
+
+    ``uvicorn --workers`` の各プロセスが起動時に同時に呼び出しても 1 つだけが作り直すよう、
+    ``BEGIN IMMEDIATE`` で書き込みロックを取得してから移行が必要かを確認し直し、
+    確認と置き換えを 1 つのトランザクションで行います.
+
+    Args:
+        bind: 対象のエンジン.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+    tables = [table for table in Base.metadata.sorted_tables if table.dialect_options["sqlite"].get("autoincrement")]
+    # pysqlite の暗黙のトランザクションを使わず、BEGIN / COMMIT を明示する
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # 移行済みの場合は書き込みロックを取得しない
+        if not any(_needs_autoincrement(connection, table) for table in tables):
+            return
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            for table in tables:
+                if not _needs_autoincrement(connection, table):
+                    continue
+                rebuilt = f"{table.name}_autoincrement"
+                create = str(CreateTable(table).compile(dialect=bind.dialect)).strip()
+                connection.exec_driver_sql(create.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {rebuilt} ", 1))
+                columns = ", ".join(column.name for column in table.columns)
+                connection.exec_driver_sql(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table.name}")
+                connection.exec_driver_sql(f"DROP TABLE {table.name}")
+                connection.exec_driver_sql(f"ALTER TABLE {rebuilt} RENAME TO {table.name}")
+        except BaseException:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+        connection.exec_driver_sql("COMMIT")
+
+def init_db(bind=engine):
+    """テーブル、不足している列、インデックス、全文検索の索引、備品の統計行を作成します.
+
+    アプリケーションおよびコマンドラインツールの起動時に呼び出します.
+
+    Args:
+        bind: 対象のエンジン.
+    """
+    from . import models, search, stats  # noqa: F401 モデル、全文検索と統計のイベントを登録する
+
+    Base.metadata.create_all(bind=bind)
+    ensure_columns(bind)
+    ensure_autoincrement(bind)
+    ensure_indexes(bind)
+    search.ensure_search_index(bind)
+    stats.ensure_item_stats(bind)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """非同期セッションを提供する依存関係.
+
+    Raises:
+        RuntimeError: 非同期エンジンが設定されていない場合.
+    """
+    if AsyncSessionLocal is None:
+        raise RuntimeError("INVENTORY_ASYNC_DATABASE_URL must be set for databases other than SQLite")
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,315 @@
+"""監査用の貸出・返却ログと備品一覧のストリーミングエクスポート.
+
+このモジュールは、ログ (備品名・ユーザー名を結合したもの) と備品の一覧を
+NDJSON / CSV / Parquet 形式で出力するためのジェネレーターを提供します.
+
+行はサーバーサイドカーソル (``yield_per``) で ``batch_size`` 件ずつ読み込まれ、
+シリアライズされたチャンクとして順に返されるため、件数にかかわらずメモリ使用量は一定です.
+Parquet 形式の出力には ``pyarrow`` (オプション依存関係 ``parquet``) が必要です.
+
+Usage:
+    python -m inventory_app.exporter logs --format csv --start 2026-01-01 --end 2026-04-01 -o logs.csv
+    python -m inventory_app.exporter items --format ndjson > items.ndjson
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime
+from typing import Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from . import models
+
+DEFAULT_BATCH_SIZE = 1000
+
+FORMATS = ("ndjson", "csv", "parquet")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+LOG_FIELDS = [
+    "id", "created_at", "action",
+    "item_id", "management_code", "item_name",
+    "user_id", "username", "display_name",
+]
+
+ITEM_FIELDS = [
+    "id", "management_code", "name", "category", "status",
+    "owner_id", "owner_username", "owner_name", "due_date",
+    "is_fixed_asset", "accessories", "lending_reason", "lending_location",
+]
+
+
+class ExportFormatError(ValueError):
+    """未対応の形式、または必要なライブラリがない形式が指定された場合に送出される例外."""
+
+
+def log_rows(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[dict]:
+    """備品名とユーザー名を結合したログを ID 順に返すジェネレーター.
+
+    Args:
+        db (Session): データベースセッション.
+        start (datetime, optional): この日時以降に作成されたログのみを返します.
+        end (datetime, optional): この日時より前に作成されたログのみを返します.
+        batch_size (int): サーバーサイドカーソルから一度に読み込む行数.
+
+    Yields:
+        dict: ``LOG_FIELDS`` をキーとする辞書.
+    """
+    log, item, user = models.Log, models.Item, models.User
+    stmt = (
+        select(
+            log.id, log.created_at, log.action,
+            log.item_id, item.management_code, item.name.label("item_name"),
+            log.user_id, user.username, user.display_name,
+        )
+        .outerjoin(item, item.id == log.item_id)
+        .outerjoin(user, user.id == log.user_id)
+        .order_by(log.id)
+    )
+    if start is not None:
+        stmt = stmt.where(log.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(log.created_at < end)
+    yield from _stream(db, stmt, batch_size)
+
+
+def item_rows(db: Session, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[dict]:
+    """借用者の名前を結合した備品を ID 順に返すジェネレーター.
+
+    Args:
+        db (Session): データベースセッション.
+        batch_size (int): サーバーサイドカーソルから一度に読み込む行数.
+
+    Yields:
+        dict: ``ITEM_FIELDS`` をキーとする辞書.
+    """
+    item = models.Item
+    owner = aliased(models.User)
+    stmt = (
+        select(
+            item.id, item.management_code, item.name, item.category, item.status,
+            item.owner_id, owner.username.label("owner_username"), owner.display_name.label("owner_name"),
+            item.due_date, item.is_fixed_asset, item.accessories, item.lending_reason, item.lending_location,
+        )
+        .outerjoin(owner, owner.id == item.owner_id)
+        .order_by(item.id)
+    )
+    yield from _stream(db, stmt, batch_size)
+
+
+def _stream(db: Session, stmt, batch_size: int) -> Iterator[dict]:
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    try:
+        for partition in result.mappings().partitions():
+            for row in partition:
+                yield dict(row)
+    finally:
+        result.close()
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def iter_ndjson(rows: Iterable[dict], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    """行を NDJSON にシリアライズし、``batch_size`` 行ごとのチャンクとして返します."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=_json_default))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_csv(rows: Iterable[dict], fields: List[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    """行をヘッダー付きの CSV (UTF-8 BOM 付き) にシリアライズし、チャンクとして返します.
+
+    リスト型の値 (付属品など) は JSON 文字列として出力されます.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(row.get(field)) for field in fields])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _csv_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if value is None:
+        return ""
+    return value
+
+
+class _ChunkSink(io.RawIOBase):
+    """書き込まれたバイト列を溜めておき、呼び出し側が順に取り出せるようにする出力先."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ExportFormatError("Parquet export requires pyarrow (install the 'parquet' extra)") from e
+    return pa, pq
+
+
+def _parquet_schema(kind: str):
+    pa, _ = _import_pyarrow()
+
+    if kind == "logs":
+        return pa.schema([
+            ("id", pa.int64()), ("created_at", pa.timestamp("us")), ("action", pa.string()),
+            ("item_id", pa.int64()), ("management_code", pa.string()), ("item_name", pa.string()),
+            ("user_id", pa.int64()), ("username", pa.string()), ("display_name", pa.string()),
+        ])
+    return pa.schema([
+        ("id", pa.int64()), ("management_code", pa.string()), ("name", pa.string()),
+        ("category", pa.string()), ("status", pa.string()),
+        ("owner_id", pa.int64()), ("owner_username", pa.string()), ("owner_name", pa.string()),
+        ("due_date", pa.date32()), ("is_fixed_asset", pa.bool_()), ("accessories", pa.list_(pa.string())),
+        ("lending_reason", pa.string()), ("lending_location", pa.string()),
+    ])
+
+
+def iter_parquet(rows: Iterable[dict], kind: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    """行を Parquet にシリアライズし、``batch_size`` 行ごとの行グループとして返します.
+
+    Raises:
+        ExportFormatError: ``pyarrow`` がインストールされていない場合.
+    """
+    pa, pq = _import_pyarrow()
+    schema = _parquet_schema(kind)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    batch = []
+
+    def flush():
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        batch.clear()
+        return sink.drain()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield flush()
+    if batch:
+        yield flush()
+    writer.close()
+    yield sink.drain()
+
+
+def export(db: Session, kind: str, fmt: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+           batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    """ログまたは備品を指定した形式でシリアライズしたチャンクを返します.
+
+    Args:
+        db (Session): データベースセッション.
+        kind (str): ``logs`` または ``items``.
+        fmt (str): ``ndjson``、``csv`` または ``parquet``.
+        start (datetime, optional): ログの作成日時の下限 (``logs`` のみ).
+        end (datetime, optional): ログの作成日時の上限 (``logs`` のみ, この日時を含まない).
+        batch_size (int): 一度に読み込み、シリアライズする行数.
+
+    Raises:
+        ExportFormatError: 形式が不正な場合、または Parquet 形式で ``pyarrow`` がない場合.
+    """
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"Unsupported format: {fmt}")
+    if fmt == "parquet":
+        # ストリームの開始前に依存関係の有無を確認する
+        _import_pyarrow()
+
+    if kind == "logs":
+        rows, fields = log_rows(db, start=start, end=end, batch_size=batch_size), LOG_FIELDS
+    else:
+        rows, fields = item_rows(db, batch_size=batch_size), ITEM_FIELDS
+
+    if fmt == "ndjson":
+        return iter_ndjson(rows, batch_size)
+    if fmt == "csv":
+        return iter_csv(rows, fields, batch_size)
+    return iter_parquet(rows, kind, batch_size)
+
+
+def filename(kind: str, fmt: str, today: Optional[date] = None) -> str:
+    """ダウンロード時のファイル名を返します (例: ``logs-20260401.csv``)."""
+    today = today or date.today()
+    return f"{kind}-{today:%Y%m%d}.{fmt}"
+
+
+def main(argv=None):
+    """コマンドラインからエクスポートを実行します."""
+    parser = argparse.ArgumentParser(description="ログまたは備品の一覧をファイルへエクスポートします.")
+    parser.add_argument("target", choices=["logs", "items"], help="エクスポートする対象.")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson", help="出力形式.")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="この日時以降のログのみを出力します.")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="この日時より前のログのみを出力します.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="一度に読み込む行数.")
+    parser.add_argument("-o", "--output", default="-", help="出力先ファイル ('-' で標準出力).")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in export(db, args.target, args.format, start=args.start, end=args.end, batch_size=args.batch_size):
+            output.write(chunk)
+    except ExportFormatError as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
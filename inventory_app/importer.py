@@ -0,0 +1,471 @@
+"""CSV / NDJSON からの一括インポート.
+
+このモジュールは、資産台帳や社員名簿などから出力されたファイルを 1 行ずつ読み込み、
+``schemas.ItemCreate`` / ``schemas.UserImportRow`` で検証した上でバッチ単位で登録する
+機能を提供します. ファイル全体をメモリに読み込むことはありません.
+
+コマンドラインからも実行できます::
+
+    python -m inventory_app.importer items assets.csv --batch-size 2000
+    python -m inventory_app.importer users employees.csv --update-existing
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import cache, models, schemas, security
+
+DEFAULT_BATCH_SIZE = 1000
+
+# レポートに含める失敗行の最大数 (件数自体はすべて数える)
+MAX_REPORTED_ERRORS = 1000
+
+# 付属品を 1 つの CSV セルに列挙する場合の区切り文字
+ACCESSORY_SEPARATORS = (";", "|")
+
+_TRUE_VALUES = {"1", "true", "yes", "y", "○", "on"}
+
+Row = Tuple[int, dict]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    """ファイル名または Content-Type からファイル形式を判定します.
+
+    Args:
+        filename (str, optional): ファイル名.
+        content_type (str, optional): Content-Type.
+
+    Returns:
+        str: ``csv`` または ``ndjson``.
+    """
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or (content_type or "").endswith(("ndjson", "jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def iter_csv_rows(stream: IO[str]) -> Iterator[Row]:
+    """CSV を 1 行ずつ辞書として読み込みます.
+
+    Args:
+        stream (IO[str]): テキストストリーム. 1 行目はヘッダーとして扱います.
+
+    Yields:
+        tuple[int, dict]: 行番号と値の辞書. 空のセルは除外されます.
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        values = {key.strip(): value.strip() for key, value in row.items() if key and value is not None and value.strip()}
+        if values:
+            yield reader.line_num, values
+
+
+def iter_ndjson_rows(stream: IO[str]) -> Iterator[Row]:
+    """NDJSON (1 行 1 オブジェクトの JSON) を 1 行ずつ読み込みます.
+
+    不正な JSON の行は ``{"__error__": ...}`` として返され、インポート時に失敗行となります.
+
+    Args:
+        stream (IO[str]): テキストストリーム.
+
+    Yields:
+        tuple[int, dict]: 行番号と値の辞書.
+    """
+    for line_num, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            values = json.loads(line)
+        except ValueError as e:
+            values = {"__error__": f"Invalid JSON: {e}"}
+        if not isinstance(values, dict):
+            values = {"__error__": "Each line must be a JSON object"}
+        yield line_num, values
+
+
+def iter_rows(stream: IO[str], fmt: str) -> Iterator[Row]:
+    """ファイル形式に応じて行を読み込みます.
+
+    Args:
+        stream (IO[str]): テキストストリーム.
+        fmt (str): ``csv`` または ``ndjson``.
+
+    Yields:
+        tuple[int, dict]: 行番号と値の辞書.
+    """
+    if fmt == "ndjson":
+        return iter_ndjson_rows(stream)
+    if fmt == "csv":
+        return iter_csv_rows(stream)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def open_text(binary: IO[bytes]) -> IO[str]:
+    """バイナリストリームを UTF-8 (BOM 付きも可) のテキストストリームとして開きます."""
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+def parse_bool(value) -> bool:
+    """CSV セルの値を真偽値に変換します."""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in _TRUE_VALUES
+
+
+def parse_accessories(value) -> list:
+    """CSV セルの値を付属品のリストに変換します.
+
+    JSON 配列、またはセミコロン / パイプ区切りの文字列を受け付けます.
+    """
+    if isinstance(value, list):
+        return value
+    value = str(value).strip()
+    if value.startswith("["):
+        return json.loads(value)
+    for separator in ACCESSORY_SEPARATORS:
+        if separator in value:
+            return [part.strip() for part in value.split(separator) if part.strip()]
+    return [value] if value else []
+
+
+class _ReportBuilder:
+    """インポート結果を集計します."""
+
+    def __init__(self):
+        self.report = schemas.ImportReport()
+
+    def fail(self, row: int, key: Optional[str], error: str):
+        self.report.failed += 1
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(schemas.ImportRowError(row=row, key=key, error=error))
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def _item_values(values: dict) -> dict:
+    values = dict(values)
+    if "accessories" in values:
+        values["accessories"] = parse_accessories(values["accessories"])
+    if "is_fixed_asset" in values:
+        values["is_fixed_asset"] = parse_bool(values["is_fixed_asset"])
+    return values
+
+
+def import_items(db: Session, rows: Iterable[Row], batch_size: int = DEFAULT_BATCH_SIZE, upsert: bool = True) -> schemas.ImportReport:
+    """備品をバッチ単位で一括登録します.
+
+    各行は ``schemas.ItemCreate`` で検証され、``management_code`` が既に存在する場合は
+    ``upsert`` が True なら更新、False ならスキップされます. バッチごとに既存の管理コードを
+    1 回のクエリで確認し、1 回の INSERT ... ON CONFLICT で書き込んでコミットします.
+
+    Args:
+        db (Session): データベースセッション.
+        rows (Iterable[tuple[int, dict]]): 行番号と値の辞書の組.
+        batch_size (int): 1 回のコミットで書き込む行数.
+        upsert (bool): 既存の備品を更新するかどうか.
+
+    Returns:
+        schemas.ImportReport: インポート結果.
+    """
+    builder = _ReportBuilder()
+    batch = {}
+    for row_num, values in rows:
+        builder.report.total += 1
+        if "__error__" in values:
+            builder.fail(row_num, None, values["__error__"])
+            continue
+        try:
+            item = schemas.ItemCreate.model_validate(_item_values(values))
+        except ValidationError as e:
+            builder.fail(row_num, values.get("management_code"), _validation_message(e))
+            continue
+        except ValueError as e:
+            builder.fail(row_num, values.get("management_code"), str(e))
+            continue
+
+        # 同一バッチ内で管理コードが重複した場合は後の行を優先する
+        if item.management_code in batch:
+            builder.report.skipped += 1
+        batch[item.management_code] = item.model_dump()
+        if len(batch) >= batch_size:
+            _write_item_batch(db, batch, upsert, builder.report)
+            batch = {}
+    if batch:
+        _write_item_batch(db, batch, upsert, builder.report)
+    return builder.report
+
+
+def _write_item_batch(db: Session, batch: dict, upsert: bool, report: schemas.ImportReport):
+    table = models.Item.__table__
+    existing = set(db.execute(
+        table.select().with_only_columns(table.c.management_code).where(table.c.management_code.in_(list(batch)))
+    ).scalars())
+
+    if upsert:
+        rows = list(batch.values())
+        report.updated += len(existing)
+    else:
+        rows = [values for code, values in batch.items() if code not in existing]
+        report.skipped += len(existing)
+    report.inserted += len(batch) - len(existing)
+    if not rows:
+        return
+
+    stmt = sqlite_insert(table)
+    if upsert:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.management_code],
+            set_={
+                "name": stmt.excluded.name,
+                "category": stmt.excluded.category,
+                "accessories": stmt.excluded.accessories,
+                "is_fixed_asset": stmt.excluded.is_fixed_asset,
+            },
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.management_code])
+    db.execute(stmt, [{**values, "status": models.ItemStatus.available.value} for values in rows])
+    cache.bump_version(db, "items")
+    db.commit()
+
+
+class PasswordHasher:
+    """パスワードをプロセスプールで並列にハッシュ化します.
+
+    bcrypt は CPU を占有するため、件数が ``min_parallel`` 以上の場合のみ
+    ``ProcessPoolExecutor`` に分散し、それ未満は呼び出し元で直接ハッシュ化します.
+    プロセスプールは最初に必要になった時点で起動されます.
+
+    Attributes:
+        max_workers (int, optional): ワーカープロセス数. 省略時は CPU 数.
+        min_parallel (int): 並列化する最小件数.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, min_parallel: int = 8):
+        self.max_workers = max_workers
+        self.min_parallel = min_parallel
+        self._executor = None
+
+    def hash_all(self, passwords: List[str]) -> List[str]:
+        """パスワードのリストをハッシュ化します.
+
+        Args:
+            passwords (list[str]): 平文のパスワード.
+
+        Returns:
+            list[str]: ``passwords`` と同じ順序のハッシュ値.
+        """
+        if len(passwords) < self.min_parallel or self.max_workers == 1:
+            return [security.get_password_hash(password) for password in passwords]
+        if self._executor is None:
+            # スレッドを持つサーバープロセスからの fork を避けるため spawn を使用する
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        workers = self.max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(self._executor.map(security.get_password_hash, passwords, chunksize=chunksize))
+
+    def close(self):
+        """プロセスプールを終了します."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_USER_UNIQUE_FIELDS = ("username", "employee_id", "email")
+
+
+def import_users(db: Session, rows: Iterable[Row], batch_size: int = DEFAULT_BATCH_SIZE, update_existing: bool = False,
+                 hash_workers: Optional[int] = None) -> schemas.ImportReport:
+    """ユーザーをバッチ単位で一括登録します.
+
+    各行は ``schemas.UserImportRow`` で検証されます. バッチごとに ``username``,
+    ``employee_id``, ``email`` が既存ユーザーと重複していないかを 1 回のクエリで確認し、
+    平文のパスワードはプロセスプールで並列にハッシュ化してから一括で挿入します.
+
+    ``username`` が一致する既存ユーザーは、``update_existing`` が True の場合は
+    行に含まれる項目のみ更新され (HR システムとの定期同期用)、False の場合はスキップされます.
+
+    Args:
+        db (Session): データベースセッション.
+        rows (Iterable[tuple[int, dict]]): 行番号と値の辞書の組.
+        batch_size (int): 1 回のコミットで書き込む行数.
+        update_existing (bool): 既存ユーザーを更新するかどうか.
+        hash_workers (int, optional): パスワードのハッシュ化に使用するプロセス数.
+
+    Returns:
+        schemas.ImportReport: インポート結果.
+    """
+    builder = _ReportBuilder()
+    with PasswordHasher(max_workers=hash_workers) as hasher:
+        batch = []
+        for row_num, values in rows:
+            builder.report.total += 1
+            if "__error__" in values:
+                builder.fail(row_num, None, values["__error__"])
+                continue
+            try:
+                if "is_active" in values:
+                    values = {**values, "is_active": parse_bool(values["is_active"])}
+                user = schemas.UserImportRow.model_validate(values)
+            except ValidationError as e:
+                builder.fail(row_num, values.get("username"), _validation_message(e))
+                continue
+            if user.hashed_password and not security.pwd_context.identify(user.hashed_password):
+                builder.fail(row_num, user.username, "hashed_password is not a supported hash")
+                continue
+            batch.append((row_num, user))
+            if len(batch) >= batch_size:
+                _write_user_batch(db, batch, update_existing, hasher, builder)
+                batch = []
+        if batch:
+            _write_user_batch(db, batch, update_existing, hasher, builder)
+    return builder.report
+
+
+def _write_user_batch(db: Session, batch: list, update_existing: bool, hasher: PasswordHasher, builder: _ReportBuilder):
+    # バッチ内の重複を除外する
+    accepted = []
+    seen = {field: set() for field in _USER_UNIQUE_FIELDS}
+    for row_num, user in batch:
+        duplicate = next(
+            (field for field in _USER_UNIQUE_FIELDS if getattr(user, field) and getattr(user, field) in seen[field]),
+            None,
+        )
+        if duplicate:
+            builder.fail(row_num, user.username, f"Duplicate {duplicate} in file")
+            continue
+        for field in _USER_UNIQUE_FIELDS:
+            if getattr(user, field):
+                seen[field].add(getattr(user, field))
+        accepted.append((row_num, user))
+
+    # 既存ユーザーとの重複を 1 回のクエリで確認する
+    conditions = [
+        getattr(models.User, field).in_(values) for field, values in seen.items() if values
+    ]
+    existing_users = db.query(models.User).filter(or_(*conditions)).all() if conditions else []
+    owners = {field: {} for field in _USER_UNIQUE_FIELDS}
+    for existing in existing_users:
+        for field in _USER_UNIQUE_FIELDS:
+            if getattr(existing, field):
+                owners[field][getattr(existing, field)] = existing
+
+    inserts, updates = [], []
+    for row_num, user in accepted:
+        target = owners["username"].get(user.username)
+        conflict = next(
+            (field for field in ("employee_id", "email")
+             if getattr(user, field) and owners[field].get(getattr(user, field)) not in (None, target)),
+            None,
+        )
+        if conflict:
+            builder.fail(row_num, user.username, f"{conflict} is already used by another user")
+        elif target is None:
+            if not user.password and not user.hashed_password:
+                builder.fail(row_num, user.username, "password or hashed_password is required")
+            else:
+                inserts.append((row_num, user))
+        elif update_existing:
+            updates.append((target, user))
+        else:
+            builder.report.skipped += 1
+
+    plain = [user for _, user in inserts if not user.hashed_password]
+    plain += [user for _, user in updates if user.password and not user.hashed_password]
+    hashes = dict(zip(map(id, plain), hasher.hash_all([user.password for user in plain])))
+
+    if inserts:
+        db.execute(insert(models.User.__table__), [
+            {
+                "username": user.username,
+                "hashed_password": user.hashed_password or hashes[id(user)],
+                "display_name": user.display_name,
+                "employee_id": user.employee_id,
+                "email": user.email,
+                "department": user.department,
+                "role": user.role or models.Role.user.value,
+                "is_active": True if user.is_active is None else user.is_active,
+            }
+            for _, user in inserts
+        ])
+        cache.bump_version(db, "users")
+    for target, user in updates:
+        # ORM 経由で更新し、ユーザー変更時のイベント (キャッシュ無効化など) を発生させる
+        values = user.model_dump(exclude_unset=True, exclude={"username", "password", "hashed_password"})
+        for field, value in values.items():
+            setattr(target, field, value)
+        if user.hashed_password or user.password:
+            target.hashed_password = user.hashed_password or hashes[id(user)]
+    db.commit()
+    builder.report.inserted += len(inserts)
+    builder.report.updated += len(updates)
+
+
+def main(argv=None):
+    """コマンドラインからインポートを実行します."""
+    parser = argparse.ArgumentParser(description="CSV / NDJSON ファイルからデータを一括登録します.")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    items_parser = subparsers.add_parser("items", help="備品をインポートします.")
+    items_parser.add_argument("path", help="インポートするファイル ('-' で標準入力).")
+    items_parser.add_argument("--format", choices=["csv", "ndjson"], help="ファイル形式 (省略時は拡張子から判定).")
+    items_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="1 回のコミットで書き込む行数.")
+    items_parser.add_argument("--no-upsert", action="store_true", help="既存の管理コードを更新せずにスキップします.")
+
+    users_parser = subparsers.add_parser("users", help="ユーザーをインポートします.")
+    users_parser.add_argument("path", help="インポートするファイル ('-' で標準入力).")
+    users_parser.add_argument("--format", choices=["csv", "ndjson"], help="ファイル形式 (省略時は拡張子から判定).")
+    users_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="1 回のコミットで書き込む行数.")
+    users_parser.add_argument("--update-existing", action="store_true", help="既存ユーザーを更新します (HR 同期用).")
+    users_parser.add_argument("--workers", type=int, help="パスワードのハッシュ化に使用するプロセス数.")
+
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, init_db
+
+    init_db()
+    fmt = args.format or detect_format(args.path)
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    db = SessionLocal()
+    try:
+        rows = iter_rows(stream, fmt)
+        if args.target == "users":
+            report = import_users(db, rows, batch_size=args.batch_size, update_existing=args.update_existing,
+                                  hash_workers=args.workers)
+        else:
+            report = import_items(db, rows, batch_size=args.batch_size, upsert=not args.no_upsert)
+    finally:
+        db.close()
+        if stream is not sys.stdin:
+            stream.close()
+    print(report.model_dump_json(indent=2))
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""データベースのリース (ロック行) による定期処理の排他.
+
+``uvicorn --workers`` で複数のプロセスを起動した場合や複数のホストで動かす場合に、
+定期処理を 1 つのワーカーだけが実行するために使用します. リースには有効期限があり、
+保持者が異常終了しても期限が過ぎれば他のワーカーが引き継ぎます.
+"""
+
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .database import retry_on_locked
+from .models import SchedulerLease, utcnow
+
+# リースの有効期間 (秒). 保持者はこれより短い間隔で更新する必要がある
+LEASE_TTL = float(os.environ.get("INVENTORY_LEASE_TTL_SECONDS", "300"))
+
+
+def default_holder() -> str:
+    """このプロセスとスレッドを識別するリース保持者名を返します."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+@retry_on_locked
+def acquire(db: Session, name: str, holder: str, ttl: float = LEASE_TTL, now: Optional[datetime] = None) -> bool:
+    """リースを取得または更新します.
+
+    リースが未取得、期限切れ、または ``holder`` 自身が保持している場合に、
+    1 つの UPDATE 文で保持者と有効期限を書き換えます.
+
+    Args:
+        db (Session): データベースセッション.
+        name (str): リース名.
+        holder (str): 保持者の識別子.
+        ttl (float): 有効期間 (秒).
+        now (datetime, optional): 現在の UTC 日時.
+
+    Returns:
+        bool: リースを保持している場合は True.
+    """
+    now = now or utcnow()
+    table = SchedulerLease.__table__
+    db.execute(sqlite_insert(table).values(name=name).on_conflict_do_nothing(index_elements=[table.c.name]))
+    result = db.execute(
+        update(table)
+        .where(
+            table.c.name == name,
+            or_(table.c.holder == holder, table.c.holder.is_(None), table.c.expires_at < now),
+        )
+        .values(holder=holder, expires_at=now + timedelta(seconds=ttl))
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+@retry_on_locked
+def release(db: Session, name: str, holder: str):
+    """``holder`` が保持しているリースを解放します."""
+    table = SchedulerLease.__table__
+    db.execute(
+        update(table).where(table.c.name == name, table.c.holder == holder).values(holder=None, expires_at=None)
+    )
+    db.commit()
+
+
+@contextmanager
+def held(db: Session, name: str, holder: Optional[str] = None, ttl: float = LEASE_TTL) -> Iterator[bool]:
+    """リースを取得し、ブロックを抜けるときに解放するコンテキストマネージャ.
+
+    Yields:
+        bool: リースを取得できた場合は True. False の場合、処理は他のワーカーが行っています.
+    """
+    holder = holder or default_holder()
+    acquired = acquire(db, name, holder, ttl)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            db.rollback()
+            release(db, name, holder)
+
+
+class Heartbeat:
+    """リースを別スレッドで定期的に更新するコンテキストマネージャ.
+
+    リースの有効期間より長くかかる処理 (SMTP の送信など) の間もリースを保持し続けるために使用します.
+    更新は ``session_factory`` で作成した独自のセッションで行います. リースを他のワーカーに
+    取られた場合や、有効期間を超えて更新できなかった場合は ``lost`` がセットされるため、
+    呼び出し元は処理を中断してください.
+
+    Attributes:
+        lost (threading.Event): リースを失った (または失った可能性がある) 場合にセットされます.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], name: str, holder: str, ttl: float = LEASE_TTL,
+                 interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self.interval = interval if interval is not None else ttl / 3
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        renewed = time.monotonic()
+        while not self._stop.wait(self.interval):
+            db = self.session_factory()
+            try:
+                if not acquire(db, self.name, self.holder, self.ttl):
+                    print(f"Lease {self.name} was taken over by another worker.")
+                    self.lost.set()
+                    return
+                renewed = time.monotonic()
+            except Exception as e:  # noqa: BLE001 次の周期で再試行する
+                print(f"Failed to renew lease {self.name}: {e}")
+                if time.monotonic() - renewed >= self.ttl:
+                    self.lost.set()
+                    return
+            finally:
+                db.close()
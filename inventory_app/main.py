@@ -2,61 +2,38 @@
 
 このモジュールは、FastAPI アプリケーションの初期化、ミドルウェアの設定、
 静的ファイルのマウント、ルーターのインクルード、および管理インターフェースの設定を行います.
-また、通知ループなどのアプリケーションのライフスパンイベントも管理します.
+また、通知スケジューラーなどのアプリケーションのライフスパンイベントも管理します.
 """
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from . import models, database
-from .routers import auth, users, items
+from .routers import auth, users, items, logs, stats, system
 from sqladmin import Admin
 from .admin import UserAdmin, ItemAdmin, LogAdmin, NotificationSettingsAdmin, EmailTemplateAdmin
 import asyncio
-from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-from .notification import check_and_send_notifications
-from .database import SessionLocal
+from . import metrics, querystats, scheduler
 
-models.Base.metadata.create_all(bind=database.engine)
+database.init_db(database.engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """FastAPI アプリケーションのライフスパンコンテキストマネージャ.
 
     起動およびシャットダウンイベントを処理します.
-    通知の確認と送信を行うバックグラウンドタスクを開始します.
+    通知の確認と送信を行うスケジューラースレッドを開始し、終了時に停止します.
     """
-    # Background task loop
-    async def notification_loop():
-        """毎日午前 8:00 に通知を確認するバックグラウンドタスク."""
-        print("Notification scheduler started.")
-        while True:
-            now = datetime.now()
-            # Target: Today 8:00 AM
-            target = now.replace(hour=8, minute=0, second=0, microsecond=0)
-            
-            # If 8:00 AM has already passed today, target tomorrow 8:00 AM
-            if now >= target:
-                target += timedelta(days=1)
-            
-            seconds_to_wait = (target - now).total_seconds()
-            print(f"Next notification check at {target} (in {seconds_to_wait:.0f} seconds)")
-            
-            await asyncio.sleep(seconds_to_wait)
-
-            try:
-                print("Running daily notification check...")
-                db = SessionLocal()
-                check_and_send_notifications(db)
-                db.close()
-            except Exception as e:
-                print(f"Error in notification loop: {e}")
-
-    task = asyncio.create_task(notification_loop())
+    app.state.scheduler = None
+    if scheduler.SCHEDULER_ENABLED:
+        app.state.scheduler = scheduler.create_notification_scheduler()
+        app.state.scheduler.start()
     yield
-    task.cancel()
+    if app.state.scheduler is not None:
+        # 実行中のジョブを待つとシャットダウンが長引くため、一定時間で打ち切る
+        await asyncio.to_thread(app.state.scheduler.stop, 30)
 
 app = FastAPI(title="Equipment Management System", lifespan=lifespan)
 
@@ -68,8 +45,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count"]
+    + (querystats.RESPONSE_HEADERS if querystats.QUERY_STATS_ENABLED else []),
 )
 
+if querystats.QUERY_STATS_ENABLED:
+    app.add_middleware(querystats.QueryStatsMiddleware)
+
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        """Prometheus テキスト形式でメトリクスを返します.
+
+        認証は行わないため、公開する場合はリバースプロキシなどでアクセス元を制限してください.
+        """
+        return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/", include_in_schema=False)
 async def root():
     """API ドキュメントへリダイレクトします."""
@@ -80,6 +73,9 @@ app.mount("/static", StaticFiles(directory="inventory_app/static"), name="static
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(items.router)
+app.include_router(logs.router)
+app.include_router(stats.router)
+app.include_router(system.router)
 
 admin = Admin(app, database.engine)
 admin.add_view(UserAdmin)
@@ -0,0 +1,268 @@
+"""Prometheus テキスト形式で公開するアプリケーションのメトリクス.
+
+HTTP リクエストのレイテンシー・ステータスコード・処理中の件数、データベースのコネクションプールからの
+取得待ち時間、および通知ジョブの実行結果を記録し、``GET /metrics`` で公開します.
+
+メトリクスはプロセスごとに集計されます. ``uvicorn --workers`` で複数のプロセスを起動した場合は、
+各プロセスを個別にスクレイプするか、ワーカー数 1 のプロセスを複数起動してください.
+
+ラベルにはルートのパステンプレート (例: ``/api/v1/items/{item_id}``) を使用し、
+実際のパスやユーザー名は含めません. ルートに一致しないリクエストは ``unmatched`` に集計されます.
+"""
+
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# "0" の場合、/metrics を公開せずリクエストの計測も行わない
+METRICS_ENABLED = os.environ.get("INVENTORY_METRICS_ENABLED", "1") != "0"
+
+# Prometheus テキスト形式の Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# リクエストのレイテンシー用のバケット (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# コネクションプールの取得待ち時間用のバケット (秒)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# 通知ジョブの実行時間用のバケット (秒)
+JOB_DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """メトリクスの一覧を保持し、Prometheus テキスト形式に変換します."""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric"):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """すべてのメトリクスを Prometheus テキスト形式で返します."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _check(self, labels: Tuple[str, ...]):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+
+    def get(self, labels: Tuple[str, ...] = ()):
+        """現在の値を返します (テストと診断用)."""
+        with self._lock:
+            return self._values.get(tuple(labels))
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    """単調に増加する値."""
+
+    kind = "counter"
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """増減する値."""
+
+    kind = "gauge"
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()):
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """観測値の分布. バケットごとの件数と合計・件数を保持します.
+
+    Attributes:
+        buckets (tuple[float, ...]): バケットの上限値 (昇順). ``+Inf`` は自動的に追加されます.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        self._check(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [バケットごとの件数..., +Inf の件数, 合計]
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, labels: Tuple[str, ...] = ()) -> int:
+        """観測した件数を返します."""
+        with self._lock:
+            state = self._values.get(tuple(labels))
+            return sum(state[:-1]) if state else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        names = self.labelnames + ("le",)
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(state[-1])}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+http_requests_total = Counter(
+    "http_requests_total", "Total HTTP requests by method, route and status code.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds.", ("method", "route"))
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being processed.", ("method",))
+db_pool_checkout_seconds = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a database connection from the pool.", ("engine",),
+    buckets=POOL_WAIT_BUCKETS)
+notification_runs_total = Counter(
+    "notification_runs_total", "Notification job runs by trigger and status.", ("trigger", "status"))
+notification_run_duration_seconds = Histogram(
+    "notification_run_duration_seconds", "Notification job duration in seconds.", buckets=JOB_DURATION_BUCKETS)
+notification_messages_total = Counter(
+    "notification_messages_total", "Notification emails by result.", ("result",))
+notification_last_success_timestamp_seconds = Gauge(
+    "notification_last_success_timestamp_seconds", "Unix time of the last successful notification run.")
+
+
+def route_label(scope: dict, root_path: str) -> str:
+    """リクエストを集計するルートのラベルを返します.
+
+    ``root_path`` はミドルウェアに到達した時点の値です. マウントされたアプリケーション
+    (``/static`` や ``/admin``) へのリクエストはマウント先のパスでまとめます.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is not None:
+        return path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path and mounted.startswith(root_path):
+        return mounted[len(root_path):] + "/{path}"
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """リクエストのレイテンシー・ステータスコード・処理中の件数を記録する ASGI ミドルウェア.
+
+    ``BaseHTTPMiddleware`` と異なりレスポンスをラップしないため、ストリーミングレスポンスの
+    動作を変えず、リクエストあたりのオーバーヘッドも小さく抑えられます.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec((method,))
+            route = route_label(scope, root_path)
+            http_request_duration_seconds.observe(elapsed, (method, route))
+            http_requests_total.inc((method, route, str(status_code)))
+
+
+def record_notification_run(run):
+    """通知ジョブの実行結果 (``schemas.SchedulerRun``) を記録します."""
+    notification_runs_total.inc((run.trigger, run.status))
+    notification_run_duration_seconds.observe(run.duration_seconds)
+    if run.status == "ok":
+        notification_last_success_timestamp_seconds.set(time.time())
+    report = run.report
+    if report is not None:
+        for result in ("sent", "failed", "retried"):
+            notification_messages_total.inc((result,), getattr(report, result))
@@ -1,15 +1,24 @@
 """Item Manager アプリケーションのデータベースモデル.
 
-このモジュールは、User, Item, Log, NotificationSettings, EmailTemplate など、
+このモジュールは、User, Item, Log, NotificationSettings, EmailTemplate, DataVersion, ItemStats,
+NotificationOutbox など、
 データベースインタラクションに使用される SQLAlchemy モデルを定義します.
 """
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, DateTime, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Date, DateTime, JSON, UniqueConstraint, event, inspect
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from datetime import datetime, timezone
 import enum
 from .database import Base
 
+def utcnow() -> datetime:
+    """現在の UTC 日時をタイムゾーン情報なしで返します.
+
+    SQLite の DateTime 列はタイムゾーン情報を保持せず、読み出した値は naive になります.
+    保存・比較する日時 (ログ、通知キュー、リース) はすべてこの関数で取得し、naive な UTC に統一します.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Role(str, enum.Enum):
     """ユーザーロールの列挙型."""
     admin = "admin"
@@ -26,6 +35,13 @@ class LogAction(str, enum.Enum):
     borrow = "borrow"
     return_ = "return"
 
+class OutboxStatus(str, enum.Enum):
+    """通知アウトボックスの送信状態の列挙型."""
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+    skipped = "skipped"
+
 class User(Base):
     """システム内のユーザーを表します.
 
@@ -39,6 +55,8 @@ class User(Base):
         department (str, optional): 部署名.
         role (str): ユーザーロール (admin または user).
         is_active (bool): ユーザーが有効かどうか.
+        token_version (int): トークンのバージョン. ロール・有効状態・パスワードが変更されると加算され、
+            それ以前に発行されたトークンは無効になります.
         items (list[Item]): ユーザーが所有している備品のリスト.
         logs (list[Log]): ユーザーに関連するログのリスト.
     """
@@ -53,6 +71,7 @@ class User(Base):
     department = Column(String, nullable=True)
     role = Column(String, default=Role.user.value)
     is_active = Column(Boolean, default=True)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     items = relationship("Item", back_populates="owner")
     logs = relationship("Log", back_populates="user")
@@ -63,6 +82,16 @@ class User(Base):
             return f"{self.display_name} ({self.username})"
         return self.username
 
+# これらの属性が変更されたユーザーの既存のトークンは無効にする
+TOKEN_REVOKING_ATTRIBUTES = ("role", "is_active", "hashed_password")
+
+@event.listens_for(User, "before_update")
+def _revoke_tokens_on_change(mapper, connection, target):
+    """ロール・有効状態・パスワードが変更されたユーザーのトークンのバージョンを加算します."""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in TOKEN_REVOKING_ATTRIBUTES):
+        target.token_version = (target.token_version or 0) + 1
+
 class Item(Base):
     """インベントリ内の備品を表します.
 
@@ -82,6 +111,13 @@ class Item(Base):
         logs (list[Log]): 備品に関連するログのリスト.
     """
     __tablename__ = "items"
+    __table_args__ = (
+        Index("ix_items_status_due_date", "status", "due_date"),
+        Index("ix_items_category_status", "category", "status"),
+        Index("ix_items_owner_id_status", "owner_id", "status"),
+        Index("ix_items_is_fixed_asset_status", "is_fixed_asset", "status"),
+        Index("ix_items_due_date", "due_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
@@ -115,12 +151,19 @@ class Log(Base):
         user (User): ログに関連するユーザー.
     """
     __tablename__ = "logs"
+    __table_args__ = (
+        Index("ix_logs_item_id_created_at", "item_id", "created_at"),
+        Index("ix_logs_user_id_created_at", "user_id", "created_at"),
+        Index("ix_logs_created_at", "created_at"),
+        # 削除した ID を再利用しない. アーカイブ済みのログと ID が重複しないようにする
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
     action = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
 
     item = relationship("Item", back_populates="logs")
     user = relationship("User", back_populates="logs")
@@ -170,3 +213,116 @@ class EmailTemplate(Base):
     name = Column(String, unique=True, index=True) # e.g., 'reminder', 'due_today', 'overdue'
     subject = Column(String)
     body = Column(String) # Text with placeholders
+
+class DataVersion(Base):
+    """キャッシュ無効化に使用するデータバージョンを表します.
+
+    備品やユーザーが変更されるたびに対応する行の ``version`` が加算されます.
+    各ワーカープロセスはこの値をポーリングしてキャッシュの鮮度を判定します.
+
+    Attributes:
+        name (str): バージョン名 (例: 'items', 'users', 'logs').
+        version (int): 現在のバージョン番号.
+    """
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class ItemStats(Base):
+    """備品ごとの利用統計を表します.
+
+    貸出・返却のたびに同じトランザクション内で更新されます.
+    ``python -m inventory_app.stats rebuild`` でログから再構築できます.
+
+    Attributes:
+        item_id (int): 備品ID.
+        borrow_count (int): 貸出回数.
+        total_borrowed_days (int): 返却済みの貸出の合計日数 (貸出日と返却日を含む).
+        last_borrowed_at (datetime, optional): 最後に貸し出された日時.
+        current_borrowed_at (datetime, optional): 貸出中の場合、その貸出の開始日時.
+    """
+    __tablename__ = "item_stats"
+    __table_args__ = (
+        Index("ix_item_stats_borrow_count", "borrow_count"),
+    )
+
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    borrow_count = Column(Integer, nullable=False, default=0)
+    total_borrowed_days = Column(Integer, nullable=False, default=0)
+    last_borrowed_at = Column(DateTime, nullable=True)
+    current_borrowed_at = Column(DateTime, nullable=True)
+
+class UserStats(Base):
+    """ユーザーごとの利用統計を表します.
+
+    Attributes:
+        user_id (int): ユーザーID.
+        borrow_count (int): 貸出回数.
+        total_borrowed_days (int): 返却済みの貸出の合計日数 (貸出日と返却日を含む).
+        last_borrowed_at (datetime, optional): 最後に借りた日時.
+        current_borrowed_count (int): 現在借りている備品の数.
+    """
+    __tablename__ = "user_stats"
+    __table_args__ = (
+        Index("ix_user_stats_borrow_count", "borrow_count"),
+        Index("ix_user_stats_current_borrowed_count", "current_borrowed_count"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    borrow_count = Column(Integer, nullable=False, default=0)
+    total_borrowed_days = Column(Integer, nullable=False, default=0)
+    last_borrowed_at = Column(DateTime, nullable=True)
+    current_borrowed_count = Column(Integer, nullable=False, default=0)
+
+class NotificationOutbox(Base):
+    """送信予定の通知 (アウトボックス) を表します.
+
+    (備品, テンプレート, 通知日) ごとに 1 行だけ作成されるため、同じ日の同じ通知は
+    何度スケジューラーが実行されても 1 回しか送信されません.
+
+    Attributes:
+        id (int): プライマリキー.
+        item_id (int): 備品ID.
+        user_id (int): 通知先のユーザーID (作成時点の借用者).
+        template_name (str): 通知の種類 ('reminder_before', 'due_date', 'overdue').
+        notify_date (date): 通知日.
+        status (str): 送信状態 (pending, sent, failed, skipped).
+        attempts (int): 送信を試みた回数.
+        last_error (str, optional): 最後のエラーメッセージ.
+        created_at (datetime): 作成日時.
+        sent_at (datetime, optional): 送信日時.
+    """
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        UniqueConstraint("item_id", "template_name", "notify_date", name="uq_notification_outbox_item_template_date"),
+        Index("ix_notification_outbox_status_notify_date", "status", "notify_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    template_name = Column(String, nullable=False)
+    notify_date = Column(Date, nullable=False)
+    status = Column(String, nullable=False, default=OutboxStatus.pending.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    item = relationship("Item")
+    user = relationship("User")
+
+class SchedulerLease(Base):
+    """複数のワーカーのうち 1 つだけが処理を行うためのリース (ロック行) を表します.
+
+    Attributes:
+        name (str): リース名 (例: 'notification_outbox').
+        holder (str, optional): 現在の保持者の識別子.
+        expires_at (datetime, optional): リースの有効期限 (UTC).
+    """
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
@@ -1,62 +1,739 @@
+"""返却期限に基づくメール通知.
+
+通知の実行では ``SMTP_WORKERS`` 個のワーカースレッドがそれぞれ認証済みの SMTP セッションを
+使い回してメールを並行に送信し、``SMTP_BATCH_SIZE`` 通ごとに接続し直します
+(リレーサーバーの 1 接続あたりの送信数制限への対策). 応答の遅い宛先があっても
+他のワーカーの送信は止まらないため、全体の所要時間はメール数ではなく並行数で決まります.
+
+一時的なエラー (4xx 応答、切断、タイムアウト) は指数バックオフで ``SMTP_MAX_ATTEMPTS`` 回まで
+再送し、恒久的なエラー (5xx 応答など) や再送し尽くしたメールはデッドレターとして報告します.
+
+通知は既定ではユーザーごとのダイジェスト (対象の備品をまとめた 1 通) として送信します.
+``INVENTORY_NOTIFICATION_MODE=item`` を指定すると、従来どおり備品ごとに 1 通ずつ送信します.
+テンプレートは実行ごとに 1 回だけ読み込んで解析します.
+
+送信する通知は (備品, テンプレート, 通知日) を一意キーとするアウトボックス
+(``notification_outbox`` テーブル) に登録してから、リースを取得した 1 つのワーカーだけが
+送信し、送信結果はメール 1 通ごとにコミットします. そのため ``uvicorn --workers`` で複数の
+プロセスを起動したり、送信中に再起動したりしても、同じ日の同じ通知は 1 回だけ送信されます
+(SMTP サーバーへの送信を終えてから結果をコミットするまでの間に異常終了したメールだけは再送されます).
+"""
+
+import contextlib
+import os
+import queue
+import random
 import smtplib
+import ssl
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
-from sqlalchemy.orm import Session
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Integer, bindparam, cast, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
-from .models import Item, NotificationSettings, EmailTemplate, ItemStatus, User
+from .database import retry_on_locked
+from .models import (
+    EmailTemplate, Item, ItemStatus, NotificationOutbox, NotificationSettings, OutboxStatus, User, utcnow,
+)
+from . import lease, schemas
 
-def send_email(settings: NotificationSettings, to_email: str, subject: str, body: str):
-    if not settings.sender_email or not settings.smtp_server:
-        print("SMTP settings not configured.")
-        return
+# SMTP サーバーとの通信のタイムアウト (秒). 1 通の送信中の各コマンドに適用される
+SMTP_TIMEOUT = float(os.environ.get("INVENTORY_SMTP_TIMEOUT", "30"))
+
+# 並行して送信するワーカー (SMTP セッション) の数
+SMTP_WORKERS = int(os.environ.get("INVENTORY_SMTP_WORKERS", "4"))
+
+# 一時的なエラーで再送する場合の 1 通あたりの最大試行回数
+SMTP_MAX_ATTEMPTS = int(os.environ.get("INVENTORY_SMTP_MAX_ATTEMPTS", "3"))
+
+# 再送までの待ち時間の基準値 (秒). 試行ごとに 2 倍になる
+SMTP_RETRY_BASE_DELAY = float(os.environ.get("INVENTORY_SMTP_RETRY_BASE_DELAY", "1.0"))
+SMTP_RETRY_MAX_DELAY = 30.0
+
+# 1 つの接続で送信するメールの最大数. これを超えると接続し直す
+SMTP_BATCH_SIZE = int(os.environ.get("INVENTORY_SMTP_BATCH_SIZE", "50"))
+
+# 暗黙の TLS (SMTPS) で接続するポート
+SMTPS_PORT = 465
+
+# 通知の送信単位. ``digest`` はユーザーごとに 1 通、``item`` は備品ごとに 1 通
+NOTIFICATION_MODE = os.environ.get("INVENTORY_NOTIFICATION_MODE", "digest")
+NOTIFICATION_MODES = ("digest", "item")
+
+MAX_REPORTED_ERRORS = 100
+
+# アウトボックスを送信するワーカーを 1 つに絞るためのリース名
+OUTBOX_LEASE = "notification_outbox"
+
+# アウトボックスから 1 回のバッチで送信するユーザーの数. バッチごとに送信結果をコミットする
+OUTBOX_BATCH_USERS = 100
+
+# 延滞通知の対象日をこの件数以下なら IN リストで、超える場合は経過日数の剰余で絞り込む
+MAX_OVERDUE_DATES = 500
+
+
+class SMTPSession:
+    """通知の実行中に使い回す SMTP セッション.
+
+    サーバーが STARTTLS を提示した場合のみ TLS に切り替えます. 認証情報が設定されている場合、
+    TLS で保護されていない接続では認証を行わずにエラーとします.
+
+    Attributes:
+        batch_size (int): 1 つの接続で送信するメールの最大数.
+        connections (int): これまでに確立した接続数.
+    """
+
+    def __init__(self, settings: NotificationSettings, timeout: float = SMTP_TIMEOUT, batch_size: int = SMTP_BATCH_SIZE):
+        self.host = settings.smtp_server
+        self.port = settings.smtp_port
+        self.username = settings.smtp_username
+        self.password = settings.smtp_password
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.connections = 0
+        self._server: Optional[smtplib.SMTP] = None
+        self._sent_on_connection = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """SMTP サーバーに接続し、必要に応じて STARTTLS と認証を行います."""
+        if self.port == SMTPS_PORT:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            secure = self.port == SMTPS_PORT
+            if not secure and server.has_extn("starttls"):
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+                secure = True
+            if self.username and self.password:
+                if not secure:
+                    raise smtplib.SMTPNotSupportedError("SMTP server does not support STARTTLS; refusing to send credentials")
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._sent_on_connection = 0
+        self.connections += 1
+
+    def close(self):
+        """接続を終了します."""
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def send(self, message):
+        """メールを送信します.
+
+        ``batch_size`` 通を送信した接続は終了して接続し直します. 送信中に接続が
+        切断された場合は 1 回だけ再接続して再送します.
+
+        Raises:
+            smtplib.SMTPException: 送信に失敗した場合.
+            OSError: サーバーに接続できない場合.
+        """
+        if self._server is not None and self._sent_on_connection >= self.batch_size:
+            self.close()
+        for attempt in range(2):
+            if self._server is None:
+                self.connect()
+            try:
+                self._server.send_message(message)
+            except Exception as e:
+                if not _is_disconnect(e):
+                    raise
+                self._server.close()
+                self._server = None
+                if attempt:
+                    raise
+                continue
+            self._sent_on_connection += 1
+            return
 
+
+def _is_disconnect(error: Exception) -> bool:
+    """接続の切断 (再接続すれば送信できる可能性がある失敗) かどうかを判定します."""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421
+
+
+def build_message(settings: NotificationSettings, to_email: str, subject: str, body: str) -> MIMEText:
+    """送信するメールを作成します."""
     msg = MIMEText(body)
     msg['Subject'] = subject
     msg['From'] = settings.sender_email
     msg['To'] = to_email
+    return msg
 
-    try:
-        with smtplib.SMTP(settings.smtp_server, settings.smtp_port) as server:
-            server.starttls()
-            if settings.smtp_username and settings.smtp_password:
-                server.login(settings.smtp_username, settings.smtp_password)
-            server.send_message(msg)
-        print(f"Email sent to {to_email}")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
 
-def check_and_send_notifications(db: Session):
-    print("Checking for notifications...")
-    settings = db.query(NotificationSettings).first()
-    if not settings:
-        print("No notification settings found.")
+def is_transient(error: Exception) -> bool:
+    """再送すれば成功する可能性がある一時的なエラーかどうかを判定します.
+
+    4xx 応答、接続の切断、タイムアウト、接続エラーを一時的なエラーとし、
+    5xx 応答や TLS・認証の設定不備などは恒久的なエラーとします.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # smtplib.SMTPException も OSError の派生クラスなので先に除外する
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # socket.timeout と ConnectionError は OSError の派生クラス
+    return isinstance(error, OSError)
+
+
+def retry_delay(attempt: int, base_delay: float = None) -> float:
+    """``attempt`` 回目の失敗の後に待つ時間 (秒) を返します (指数バックオフとジッター)."""
+    base_delay = SMTP_RETRY_BASE_DELAY if base_delay is None else base_delay
+    return random.uniform(0, min(SMTP_RETRY_MAX_DELAY, base_delay * 2 ** (attempt - 1)))
+
+
+def send_messages(settings: NotificationSettings, messages: Iterable[Tuple[str, MIMEText]],
+                  batch_size: int = SMTP_BATCH_SIZE, workers: int = SMTP_WORKERS,
+                  max_attempts: int = SMTP_MAX_ATTEMPTS, timeout: float = SMTP_TIMEOUT,
+                  retry_base_delay: float = None,
+                  on_result: Optional[Callable[[int, Optional[schemas.NotificationError]], None]] = None,
+                  stop: Optional[threading.Event] = None) -> schemas.NotificationReport:
+    """ワーカーごとに SMTP セッションを使い回し、メールを並行してまとめて送信します.
+
+    Args:
+        settings (NotificationSettings): SMTP の接続設定.
+        messages (Iterable[tuple[str, MIMEText]]): 宛先とメールの組.
+        batch_size (int): 1 つの接続で送信するメールの最大数.
+        workers (int): 並行して送信するワーカーの数.
+        max_attempts (int): 一時的なエラーの場合の 1 通あたりの最大試行回数.
+        timeout (float): SMTP サーバーとの通信のタイムアウト (秒).
+        retry_base_delay (float, optional): 再送までの待ち時間の基準値 (秒).
+        on_result (Callable, optional): 1 通ごとの結果を受け取る関数. ``messages`` 内の位置と、
+            失敗した場合はその情報 (成功した場合は None) を引数に、送信スレッドから呼び出されます.
+        stop (threading.Event, optional): セットされると、未送信のメールの送信を始めずに終了します.
+            送信しなかったメールについては ``on_result`` は呼び出されません.
+
+    Returns:
+        schemas.NotificationReport: 送信数、失敗数、再送数、接続数、スループットとデッドレター.
+    """
+    report = schemas.NotificationReport()
+    started = time.perf_counter()
+    pending: "queue.Queue[Tuple[int, str, MIMEText]]" = queue.Queue()
+    for index, (to_email, message) in enumerate(messages):
+        pending.put((index, to_email, message))
+    workers = max(1, min(workers, pending.qsize()))
+    lock = threading.Lock()
+
+    def record(field: str, dead_letter: Optional[schemas.NotificationError] = None):
+        with lock:
+            setattr(report, field, getattr(report, field) + 1)
+            if dead_letter is not None and len(report.dead_letters) < MAX_REPORTED_ERRORS:
+                report.dead_letters.append(dead_letter)
+
+    def deliver(session: SMTPSession, index: int, to_email: str, message: MIMEText):
+        for attempt in range(1, max_attempts + 1):
+            try:
+                session.send(message)
+            except (smtplib.SMTPException, OSError) as e:
+                transient = is_transient(e)
+                if not transient or attempt == max_attempts:
+                    print(f"Failed to send email to {to_email}: {e}")
+                    letter = schemas.NotificationError(
+                        recipient=to_email, error=str(e), attempts=attempt, permanent=not transient,
+                    )
+                    record("failed", letter)
+                    if on_result is not None:
+                        on_result(index, letter)
+                    return
+                # 状態の分からない接続は破棄し、次の試行では接続し直す
+                session.close()
+                record("retried")
+                time.sleep(retry_delay(attempt, retry_base_delay))
+                continue
+            record("sent")
+            if on_result is not None:
+                on_result(index, None)
+            return
+
+    def work(session: SMTPSession) -> int:
+        with session:
+            while stop is None or not stop.is_set():
+                try:
+                    index, to_email, message = pending.get_nowait()
+                except queue.Empty:
+                    break
+                deliver(session, index, to_email, message)
+            return session.connections
+
+    if not pending.empty():
+        # settings は ORM オブジェクトでセッションはスレッドセーフではないため、接続情報は
+        # 呼び出し元のスレッドで読み出してから送信スレッドに渡す
+        sessions = [SMTPSession(settings, timeout=timeout, batch_size=batch_size) for _ in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smtp") as executor:
+            futures = [executor.submit(work, session) for session in sessions]
+            report.connections = sum(future.result() for future in futures)
+        report.workers = workers
+    report.elapsed_seconds = time.perf_counter() - started
+    if report.elapsed_seconds > 0:
+        report.messages_per_second = report.sent / report.elapsed_seconds
+    return report
+
+
+def send_email(settings: NotificationSettings, to_email: str, subject: str, body: str):
+    if not settings.sender_email or not settings.smtp_server:
+        print("SMTP settings not configured.")
         return
 
-    today = datetime.now().date()
-    items = db.query(Item).filter(Item.status == ItemStatus.borrowed, Item.due_date != None).all()
+    report = send_messages(settings, [(to_email, build_message(settings, to_email, subject, body))])
+    if report.sent:
+        print(f"Email sent to {to_email}")
+
+def template_name_for(settings: NotificationSettings, days_diff: int) -> Optional[str]:
+    """返却期限までの日数に応じた通知テンプレート名を返します. 通知しない場合は None."""
+    if days_diff == settings.n_days_before:
+        return "reminder_before"
+    if days_diff == 0:
+        return "due_date"
+    if days_diff < 0 and settings.m_days_overdue and (-days_diff) % settings.m_days_overdue == 0:
+        return "overdue"
+    return None
+
+
+def due_candidates(db: Session, settings: NotificationSettings, today) -> List[Item]:
+    """今日通知が必要な貸出中の備品を、借用者を結合して取得します.
+
+    返却期限が ``today + n_days_before``、``today``、または ``m_days_overdue`` の倍数の日数だけ
+    過ぎている備品のみを ``ix_items_status_due_date`` で検索するため、処理量は備品の総数ではなく
+    通知の件数に比例します. 延滞通知の対象日は最も古い返却期限までの日付の IN リストとし、
+    その数が ``MAX_OVERDUE_DATES`` を超える場合は経過日数の剰余で絞り込みます.
+
+    Args:
+        db (Session): データベースセッション.
+        settings (NotificationSettings): 通知設定.
+        today (date): 基準日.
+
+    Returns:
+        list[Item]: 借用者 (``owner``) を読み込み済みの備品のリスト.
+    """
+    due_dates = {today + timedelta(days=settings.n_days_before), today}
+    conditions = []
+    step = settings.m_days_overdue
+    if step and step > 0:
+        oldest = db.scalar(
+            select(func.min(Item.due_date)).where(Item.status == ItemStatus.borrowed, Item.due_date < today)
+        )
+        if oldest is not None:
+            count = (today - oldest).days // step
+            if count <= MAX_OVERDUE_DATES:
+                due_dates.update(today - timedelta(days=step * k) for k in range(1, count + 1))
+            else:
+                days_overdue = cast(func.julianday(today) - func.julianday(Item.due_date), Integer)
+                conditions.append((Item.due_date < today) & (days_overdue % step == 0))
+    conditions.append(Item.due_date.in_(sorted(due_dates)))
 
-    for item in items:
-        if not item.owner or not item.owner.email:
+    stmt = (
+        select(Item)
+        .join(Item.owner)
+        .options(joinedload(Item.owner))
+        .where(Item.status == ItemStatus.borrowed, or_(*conditions), User.email.is_not(None), User.email != "")
+        .order_by(Item.due_date, Item.id)
+    )
+    return list(db.scalars(stmt))
+
+
+class CompiledTemplate:
+    """解析済みのメールテンプレート.
+
+    ``str.format`` 形式のプレースホルダーを作成時に 1 回だけ解析し、
+    送信するメールごとには値の埋め込みのみを行います.
+
+    Attributes:
+        name (str): テンプレート名.
+    """
+
+    _formatter = string.Formatter()
+
+    def __init__(self, name: str, subject: str, body: str):
+        self.name = name
+        self._subject = self._compile(subject or "")
+        self._body = self._compile(body or "")
+
+    @classmethod
+    def from_model(cls, template: EmailTemplate) -> "CompiledTemplate":
+        return cls(template.name, template.subject, template.body)
+
+    @classmethod
+    def _compile(cls, text: str):
+        return [
+            (literal, field, conversion, spec)
+            for literal, field, spec, conversion in cls._formatter.parse(text)
+        ]
+
+    @classmethod
+    def _render(cls, parts, values: dict) -> str:
+        chunks = []
+        for literal, field, conversion, spec in parts:
+            chunks.append(literal)
+            if field is None:
+                continue
+            value, _ = cls._formatter.get_field(field, (), values)
+            value = cls._formatter.convert_field(value, conversion)
+            chunks.append(format(value, spec or ""))
+        return "".join(chunks)
+
+    def render(self, **values) -> Tuple[str, str]:
+        """値を埋め込んだ件名と本文を返します.
+
+        Raises:
+            KeyError: テンプレートに未知のプレースホルダーが含まれる場合.
+        """
+        return self._render(self._subject, values), self._render(self._body, values)
+
+
+DIGEST_TEMPLATE_NAME = "digest"
+
+DEFAULT_DIGEST_TEMPLATE = CompiledTemplate(
+    DIGEST_TEMPLATE_NAME,
+    "【備品管理】返却期限のお知らせ ({item_count} 件)",
+    "{user_name} 様\n\n"
+    "お借りいただいている備品の返却期限についてお知らせします。\n\n"
+    "{items}\n\n"
+    "期限までの返却をお願いいたします。\n",
+)
+"""``digest`` テンプレートが登録されていない場合に使用するダイジェストのテンプレート."""
+
+DIGEST_SECTIONS = {
+    "reminder_before": "■ 返却期限が近い備品",
+    "due_date": "■ 本日が返却期限の備品",
+    "overdue": "■ 返却期限を過ぎている備品",
+}
+
+
+def load_templates(db: Session) -> Dict[str, CompiledTemplate]:
+    """登録されているメールテンプレートをすべて読み込み、解析済みのテンプレートを返します."""
+    return {template.name: CompiledTemplate.from_model(template) for template in db.query(EmailTemplate)}
+
+
+class Notice(NamedTuple):
+    """送信する 1 件の通知 (アウトボックスの 1 行)."""
+    key: int
+    item: Item
+    user: User
+    template_name: str
+    days_diff: int
+
+
+class OutgoingMessage(NamedTuple):
+    """作成したメールと、それに含まれる通知のキー."""
+    keys: List[int]
+    to_email: str
+    message: MIMEText
+
+
+def _template_values(notice: Notice) -> dict:
+    return {
+        "user_name": notice.user.display_name or notice.user.username,
+        "item_name": notice.item.name,
+        "due_date": notice.item.due_date,
+        "days_overdue": -notice.days_diff if notice.days_diff < 0 else 0,
+    }
+
+
+def build_item_messages(settings: NotificationSettings, templates: Dict[str, CompiledTemplate],
+                        notices: Iterable[Notice]) -> List[OutgoingMessage]:
+    """通知ごとに 1 通のメールを作成します. テンプレートがない種類の通知は含めません."""
+    messages = []
+    for notice in notices:
+        template = templates.get(notice.template_name)
+        if template is None:
             continue
+        subject, body = template.render(**_template_values(notice))
+        to_email = notice.user.email
+        print(f"Queueing {notice.template_name} email to {to_email}")
+        messages.append(OutgoingMessage([notice.key], to_email, build_message(settings, to_email, subject, body)))
+    return messages
+
+
+def build_digest_messages(settings: NotificationSettings, templates: Dict[str, CompiledTemplate],
+                          notices: Iterable[Notice]) -> List[OutgoingMessage]:
+    """ユーザーごとに、通知対象の備品をまとめた 1 通のダイジェストを作成します.
+
+    ダイジェストの件名と本文には ``digest`` テンプレート (なければ ``DEFAULT_DIGEST_TEMPLATE``) を使用します.
+    本文では ``{user_name}``、``{item_count}`` と、通知の種類ごとに備品を列挙した ``{items}`` を使用できます.
+    """
+    grouped: Dict[int, Tuple[User, List[int], Dict[str, List[str]]]] = {}
+    for notice in notices:
+        item = notice.item
+        line = f"- {item.name} (返却期限: {item.due_date}"
+        line += f", {-notice.days_diff} 日超過)" if notice.template_name == "overdue" else ")"
+        _, keys, sections = grouped.setdefault(notice.user.id, (notice.user, [], {}))
+        keys.append(notice.key)
+        sections.setdefault(notice.template_name, []).append(line)
 
-        days_diff = (item.due_date - today).days
-        template_name = None
+    template = templates.get(DIGEST_TEMPLATE_NAME, DEFAULT_DIGEST_TEMPLATE)
+    messages = []
+    for user, keys, sections in grouped.values():
+        items = "\n\n".join(
+            "\n".join([heading] + sections[name]) for name, heading in DIGEST_SECTIONS.items() if name in sections
+        )
+        subject, body = template.render(
+            user_name=user.display_name or user.username,
+            item_count=len(keys),
+            items=items,
+        )
+        print(f"Queueing digest email to {user.email}")
+        messages.append(OutgoingMessage(keys, user.email, build_message(settings, user.email, subject, body)))
+    return messages
 
-        if days_diff == settings.n_days_before:
-            template_name = "reminder_before"
-        elif days_diff == 0:
-            template_name = "due_date"
-        elif days_diff < 0 and (-days_diff) % settings.m_days_overdue == 0:
-            template_name = "overdue"
 
+@retry_on_locked
+def enqueue_notifications(db: Session, settings: NotificationSettings, today) -> int:
+    """今日送信する通知をアウトボックスに追加します.
+
+    (備品, テンプレート, 通知日) が同じ行は追加されないため、同じ日に何度実行しても
+    (複数のワーカーが同時に実行しても) 通知は 1 件だけ登録されます.
+
+    Returns:
+        int: 新たに追加した通知の数.
+    """
+    rows = []
+    for item in due_candidates(db, settings, today):
+        template_name = template_name_for(settings, (item.due_date - today).days)
         if template_name:
-            template = db.query(EmailTemplate).filter(EmailTemplate.name == template_name).first()
-            if template:
-                subject = template.subject
-                body = template.body.format(
-                    user_name=item.owner.display_name or item.owner.username,
-                    item_name=item.name,
-                    due_date=item.due_date,
-                    days_overdue=-days_diff if days_diff < 0 else 0
+            rows.append({
+                "item_id": item.id, "user_id": item.owner_id, "template_name": template_name,
+                "notify_date": today, "status": OutboxStatus.pending.value, "attempts": 0,
+                "created_at": utcnow(),
+            })
+    if not rows:
+        db.commit()
+        return 0
+    table = NotificationOutbox.__table__
+    stmt = sqlite_insert(table).on_conflict_do_nothing(
+        index_elements=[table.c.item_id, table.c.template_name, table.c.notify_date]
+    )
+    inserted = db.execute(stmt, rows).rowcount
+    db.commit()
+    return max(inserted, 0)
+
+
+@retry_on_locked
+def _mark_outbox(db: Session, updates: List[dict]):
+    """アウトボックスの行の送信状態をまとめて更新します."""
+    if updates:
+        table = NotificationOutbox.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("b_id")).values(
+                status=bindparam("b_status"),
+                attempts=table.c.attempts + bindparam("b_attempts"),
+                last_error=bindparam("b_error"),
+                sent_at=bindparam("b_sent_at"),
+            ),
+            updates,
+        )
+    db.commit()
+
+
+def _outbox_update(key: int, status: OutboxStatus, attempts: int = 0, error: Optional[str] = None,
+                   sent_at: Optional[datetime] = None) -> dict:
+    return {"b_id": key, "b_status": status.value, "b_attempts": attempts, "b_error": error, "b_sent_at": sent_at}
+
+
+def drain_outbox(db: Session, settings: NotificationSettings, templates: Dict[str, CompiledTemplate], today,
+                 mode: str = None, holder: Optional[str] = None,
+                 batch_users: int = OUTBOX_BATCH_USERS, lease_ttl: float = None) -> schemas.NotificationReport:
+    """アウトボックスの未送信の通知を送信します.
+
+    ``OUTBOX_LEASE`` を保持しているワーカーから呼び出します. 通知は ``batch_users`` 人分ずつ読み出し、
+    送信結果はメール 1 通ごとに (送信を終えた時点で) コミットします. このため途中で異常終了しても、
+    次のリースの保持者が再送するのは、SMTP サーバーへの送信を終えてから結果をコミットするまでの
+    間にあったメール (最大 ``SMTP_WORKERS`` 通) だけです. 送信中は ``lease.Heartbeat`` でリースを
+    更新し続け、リースを失った場合は未送信の通知を送信せずに終了します.
+    前日以前の未送信の通知や、返却済みなどで対象外になった通知は ``skipped`` にします.
+
+    Args:
+        db (Session): データベースセッション.
+        settings (NotificationSettings): 通知設定.
+        templates (dict[str, CompiledTemplate]): 解析済みのテンプレート.
+        today (date): 通知日.
+        mode (str, optional): ``digest`` または ``item``. 省略時は ``NOTIFICATION_MODE``.
+        holder (str, optional): リース保持者の識別子. 指定した場合、送信中とバッチごとにリースを更新します.
+        batch_users (int): 1 回のバッチで送信するユーザーの数.
+        lease_ttl (float, optional): リースの有効期間 (秒). 省略時は ``lease.LEASE_TTL``.
+
+    Returns:
+        schemas.NotificationReport: 送信結果.
+    """
+    mode = mode or NOTIFICATION_MODE
+    lease_ttl = lease.LEASE_TTL if lease_ttl is None else lease_ttl
+    table = NotificationOutbox.__table__
+    report = schemas.NotificationReport()
+    started = time.perf_counter()
+
+    expired = db.execute(
+        update(table)
+        .where(table.c.status == OutboxStatus.pending.value, table.c.notify_date < today)
+        .values(status=OutboxStatus.skipped.value, last_error="expired")
+    ).rowcount
+    report.skipped += max(expired, 0)
+    db.commit()
+
+    while True:
+        user_ids = db.scalars(
+            select(NotificationOutbox.user_id)
+            .where(NotificationOutbox.status == OutboxStatus.pending.value, NotificationOutbox.notify_date == today)
+            .group_by(NotificationOutbox.user_id)
+            .order_by(NotificationOutbox.user_id)
+            .limit(batch_users)
+        ).all()
+        if not user_ids:
+            break
+        rows = db.scalars(
+            select(NotificationOutbox)
+            .options(joinedload(NotificationOutbox.item), joinedload(NotificationOutbox.user))
+            .where(
+                NotificationOutbox.status == OutboxStatus.pending.value,
+                NotificationOutbox.notify_date == today,
+                NotificationOutbox.user_id.in_(user_ids),
+            )
+            .order_by(NotificationOutbox.user_id, NotificationOutbox.id)
+        ).all()
+
+        updates = []
+        notices = []
+        for row in rows:
+            item, user = row.item, row.user
+            if item is None or user is None or not user.email or item.status != ItemStatus.borrowed \
+                    or item.owner_id != row.user_id or item.due_date is None \
+                    or (mode == "item" and row.template_name not in templates):
+                updates.append(_outbox_update(row.id, OutboxStatus.skipped))
+                continue
+            notices.append(Notice(row.id, item, user, row.template_name, (item.due_date - today).days))
+        report.skipped += len(updates)
+
+        if mode == "digest":
+            outgoing = build_digest_messages(settings, templates, notices)
+        else:
+            outgoing = build_item_messages(settings, templates, notices)
+        # 対象外の通知を確定してトランザクションを終了し、送信中に書き込みロックを保持しない
+        _mark_outbox(db, updates)
+        unsaved: List[dict] = []
+        with contextlib.ExitStack() as stack:
+            result_db = Session(bind=db.get_bind())
+            stack.callback(result_db.close)
+            result_lock = threading.Lock()
+
+            def commit_result(index: int, error: Optional[schemas.NotificationError]):
+                # 送信を終えたメールの結果は 1 通ごとにコミットし、バッチの途中で異常終了しても
+                # 送信済みの通知が pending のまま残って再送されないようにする
+                if error is None:
+                    results = [_outbox_update(key, OutboxStatus.sent, 1, sent_at=utcnow())
+                               for key in outgoing[index].keys]
+                else:
+                    results = [_outbox_update(key, OutboxStatus.failed, error.attempts, error.error)
+                               for key in outgoing[index].keys]
+                with result_lock:
+                    try:
+                        _mark_outbox(result_db, results)
+                    except Exception as e:
+                        result_db.rollback()
+                        print(f"Failed to record notification result; retrying after the batch: {e}")
+                        unsaved.extend(results)
+
+            heartbeat = None
+            if holder is not None:
+                # 送信がリースの有効期間より長くかかっても、他のワーカーが同じ通知を送信しないようにする
+                heartbeat = stack.enter_context(
+                    lease.Heartbeat(lambda: Session(bind=db.get_bind()), OUTBOX_LEASE, holder, lease_ttl)
                 )
-                print(f"Sending {template_name} email to {item.owner.email}")
-                send_email(settings, item.owner.email, subject, body)
+            # 送信しなかった通知は pending のまま残し、リースの保持者が次回送信する
+            batch = send_messages(
+                settings, [(message.to_email, message.message) for message in outgoing],
+                on_result=commit_result,
+                stop=heartbeat.lost if heartbeat is not None else None,
+            )
+        _mark_outbox(db, unsaved)
+
+        report.sent += batch.sent
+        report.failed += batch.failed
+        report.retried += batch.retried
+        report.workers = max(report.workers, batch.workers)
+        report.connections += batch.connections
+        report.dead_letters.extend(batch.dead_letters[:MAX_REPORTED_ERRORS - len(report.dead_letters)])
+
+        if holder is not None and (heartbeat.lost.is_set() or not lease.acquire(db, OUTBOX_LEASE, holder, lease_ttl)):
+            print("Notification outbox lease lost; stopping.")
+            break
+
+    report.elapsed_seconds = time.perf_counter() - started
+    if report.elapsed_seconds > 0:
+        report.messages_per_second = report.sent / report.elapsed_seconds
+    return report
+
+
+def check_and_send_notifications(db: Session, mode: Optional[str] = None) -> Optional[schemas.NotificationReport]:
+    """返却期限に基づく通知をアウトボックスに登録し、送信します.
+
+    登録はどのワーカーからも行えますが、送信は ``OUTBOX_LEASE`` のリースを取得した
+    1 つのワーカーだけが行います. このため、複数のワーカーで実行したり再起動したりしても
+    同じ日の同じ通知は 1 回だけ送信されます (異常終了時の例外は ``drain_outbox`` を参照).
+
+    Args:
+        db (Session): データベースセッション.
+        mode (str, optional): ``digest`` (ユーザーごとに 1 通) または ``item`` (備品ごとに 1 通).
+            省略時は ``NOTIFICATION_MODE``.
+
+    Returns:
+        schemas.NotificationReport: 送信結果. 通知設定がない場合、または他のワーカーが
+        送信を担当している場合は None.
+
+    Raises:
+        ValueError: ``mode`` が不正な場合.
+    """
+    mode = mode or NOTIFICATION_MODE
+    if mode not in NOTIFICATION_MODES:
+        raise ValueError(f"Unsupported notification mode: {mode}")
+
+    print("Checking for notifications...")
+    settings = db.query(NotificationSettings).first()
+    if not settings:
+        print("No notification settings found.")
+        return None
+    if not settings.sender_email or not settings.smtp_server:
+        print("SMTP settings not configured.")
+        return None
+
+    today = datetime.now().date()
+    templates = load_templates(db)
+    queued = enqueue_notifications(db, settings, today)
+
+    holder = lease.default_holder()
+    with lease.held(db, OUTBOX_LEASE, holder) as acquired:
+        if not acquired:
+            print(f"Queued {queued} notifications; another worker is sending them.")
+            return None
+        report = drain_outbox(db, settings, templates, today, mode=mode, holder=holder)
+    report.queued = queued
+    print(
+        f"Notification run finished ({mode}): queued={report.queued} sent={report.sent} failed={report.failed} "
+        f"skipped={report.skipped} retried={report.retried} workers={report.workers} "
+        f"connections={report.connections} ({report.messages_per_second:.1f} msg/s)"
+    )
+    return report
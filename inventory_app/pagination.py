@@ -0,0 +1,180 @@
+"""キーセット (カーソル) ページネーション.
+
+このモジュールは、``offset`` を使用せずに ``id`` (またはソートキーと ``id`` の組) を
+キーとして次ページを取得するためのヘルパーを提供します. カーソルはクライアントからは不透明な文字列として扱われます.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+# 1 ページあたりの最大取得件数
+MAX_PAGE_SIZE = 1000
+
+# レスポンスヘッダー名
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+class InvalidCursorError(ValueError):
+    """カーソル文字列が不正な場合に送出される例外."""
+
+
+def encode_cursor(values: dict) -> str:
+    """カーソル値を不透明な文字列にエンコードします.
+
+    Args:
+        values (dict): カーソルに含める値 (JSON シリアライズ可能であること).
+
+    Returns:
+        str: URL セーフな Base64 文字列.
+    """
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """不透明なカーソル文字列をデコードします.
+
+    Args:
+        cursor (str): ``encode_cursor`` で生成された文字列.
+
+    Returns:
+        dict: カーソル値.
+
+    Raises:
+        InvalidCursorError: カーソルが不正な場合.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(values, dict) or not isinstance(values.get("id"), int):
+        raise InvalidCursorError("Invalid cursor")
+    return values
+
+
+def keyset_paginate(
+    query,
+    id_column,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    descending: bool = False,
+    sort_column=None,
+) -> Tuple[List[Any], Optional[str]]:
+    """``id`` (または ソートキーと ``id`` の組) をキーとしてクエリの 1 ページ分を取得します.
+
+    ``sort_column`` を指定した場合は ``(sort_column, id_column)`` の順で並べ替えます.
+    NULL は SQLite と同様に昇順では先頭、降順では末尾に並びます.
+
+    Args:
+        query: SQLAlchemy の Query オブジェクト.
+        id_column: キーとして使用する一意な列.
+        limit (int): 取得する最大件数.
+        cursor (str, optional): 前ページのレスポンスで返された次ページカーソル.
+        skip (int): カーソルが指定されていない場合にスキップする件数 (互換性のため).
+        descending (bool): Trueの場合、キーの降順で取得します.
+        sort_column (optional): ``id`` より優先して並べ替える列.
+
+    Returns:
+        tuple[list, str | None]: 取得した行と次ページのカーソル. 最終ページの場合は None.
+
+    Raises:
+        InvalidCursorError: カーソルが不正な場合.
+    """
+    sort_name = sort_column.key if sort_column is not None else None
+    if cursor:
+        values = decode_cursor(cursor)
+        if values.get("s") != sort_name:
+            raise InvalidCursorError("Cursor does not match the requested sort order")
+        query = query.filter(_after_condition(values, id_column, sort_column, descending))
+
+    if sort_column is not None:
+        query = query.order_by(
+            sort_column.desc() if descending else sort_column.asc(),
+            id_column.desc() if descending else id_column.asc(),
+        )
+    else:
+        query = query.order_by(id_column.desc() if descending else id_column)
+    if not cursor and skip:
+        query = query.offset(skip)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = {"id": getattr(last, id_column.key)}
+        if sort_column is not None:
+            values["s"] = sort_name
+            values["k"] = _dump_value(getattr(last, sort_name))
+        next_cursor = encode_cursor(values)
+    return rows, next_cursor
+
+
+def _after_condition(values: dict, id_column, sort_column, descending: bool):
+    """カーソル位置より後ろの行を表す条件式を構築します."""
+    last_id = values["id"]
+    id_after = id_column < last_id if descending else id_column > last_id
+    if sort_column is None:
+        return id_after
+
+    if "k" not in values:
+        raise InvalidCursorError("Invalid cursor")
+    key = _load_value(sort_column, values["k"])
+    if key is None:
+        if descending:
+            # NULL は末尾に並ぶため、残りは同じく NULL の行のみ
+            return and_(sort_column.is_(None), id_after)
+        return or_(and_(sort_column.is_(None), id_after), sort_column.isnot(None))
+
+    if descending:
+        return or_(
+            sort_column < key,
+            and_(sort_column == key, id_after),
+            sort_column.is_(None),
+        )
+    return or_(sort_column > key, and_(sort_column == key, id_after))
+
+
+def _dump_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    try:
+        if python_type is datetime:
+            return datetime.fromisoformat(value)
+        if python_type is date:
+            return date.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(value, python_type):
+        raise InvalidCursorError("Invalid cursor")
+    return value
+
+
+def set_page_headers(response, next_cursor: Optional[str], total: int):
+    """次ページカーソルと総件数をレスポンスヘッダーに設定します.
+
+    Args:
+        response: FastAPI のレスポンスオブジェクト.
+        next_cursor (str, optional): 次ページカーソル. 最終ページの場合は None.
+        total (int): 総件数.
+    """
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
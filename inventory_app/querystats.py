@@ -0,0 +1,174 @@
+"""リクエストごとの SQL 実行回数と実行時間の計測 (N+1 の検出).
+
+``INVENTORY_QUERY_STATS=1`` を指定すると、SQLAlchemy のエンジンイベントで各リクエストが実行した
+SQL 文の数と合計時間を集計し、レスポンスヘッダー ``X-DB-Queries`` (実行回数) と ``X-DB-Time``
+(合計時間、ミリ秒) に付加します. 同じ SQL 文が ``QUERY_REPEAT_THRESHOLD`` 回以上実行された場合は、
+行ごとの遅延ロード (N+1) の可能性があるものとして ``X-DB-Repeated`` ヘッダーと
+ログに SQL 文を出力します.
+
+集計先は ``contextvars`` でリクエストごとに分けられるため、同時に処理されるリクエストの
+SQL が混ざることはありません. ``sqladmin`` の画面を含むすべてのリクエストが対象です.
+
+テストでは ``assert_max_queries`` でエンドポイントごとの SQL 実行回数の上限を確認できます.
+"""
+
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# "1" の場合、リクエストごとの SQL 実行回数と実行時間を計測する (開発・調査用)
+QUERY_STATS_ENABLED = os.environ.get("INVENTORY_QUERY_STATS", "0") == "1"
+
+# 同じ SQL 文がこの回数以上実行されたリクエストを N+1 の疑いとして報告する
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("INVENTORY_QUERY_REPEAT_THRESHOLD", "5"))
+
+RESPONSE_HEADERS = ["X-DB-Queries", "X-DB-Time", "X-DB-Repeated"]
+
+
+class QueryStats:
+    """一連の処理で実行された SQL の集計.
+
+    Attributes:
+        count (int): 実行した SQL 文の数.
+        elapsed (float): SQL の合計実行時間 (秒).
+        statements (collections.Counter): SQL 文ごとの実行回数.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+        self.statements: "collections.Counter[str]" = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed: float):
+        with self._lock:
+            self.count += 1
+            self.elapsed += elapsed
+            self.statements[statement] += 1
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """``threshold`` 回以上実行された SQL 文と実行回数を、回数の多い順に返します."""
+        with self._lock:
+            return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("inventory_query_stats", default=None)
+
+# assert_max_queries で集計中の QueryStats. コンテキストに関係なくすべての SQL を集計する
+_global_stats: List[QueryStats] = []
+
+_listening = False
+_listen_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - getattr(context, "_query_stats_started", time.perf_counter())
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    for stats in list(_global_stats):
+        stats.record(statement, elapsed)
+
+
+def install():
+    """すべてのエンジンに SQL の計測用のイベントリスナーを登録します (複数回呼んでも 1 回だけ登録します)."""
+    global _listening
+    with _listen_lock:
+        if _listening:
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+
+
+@contextmanager
+def collect() -> Iterator[QueryStats]:
+    """現在のコンテキスト (リクエストやスレッド) で実行された SQL を集計します."""
+    install()
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryStatsMiddleware:
+    """リクエストごとの SQL の実行回数と時間をレスポンスヘッダーとログに出力する ASGI ミドルウェア.
+
+    ヘッダーはレスポンスの開始時点の値です. ストリーミングレスポンスの送信中に実行された SQL は
+    ログにのみ含まれます.
+    """
+
+    def __init__(self, app, repeat_threshold: int = QUERY_REPEAT_THRESHOLD):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+        install()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with collect() as stats:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-queries", str(stats.count).encode()))
+                    headers.append((b"x-db-time", f"{stats.elapsed * 1000:.2f}".encode()))
+                    repeated = stats.repeated(self.repeat_threshold)
+                    if repeated:
+                        headers.append((b"x-db-repeated", str(repeated[0][1]).encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        print(f"{scope['method']} {scope['path']}: {stats.count} queries in {stats.elapsed * 1000:.2f} ms")
+        for statement, n in stats.repeated(self.repeat_threshold):
+            print(f"  Possible N+1: executed {n} times: {' '.join(statement.split())}")
+
+
+@contextmanager
+def assert_max_queries(limit: int, allow_repeated: bool = False,
+                       repeat_threshold: int = QUERY_REPEAT_THRESHOLD) -> Iterator[QueryStats]:
+    """ブロック内で実行された SQL 文の数が ``limit`` 以下であることを確認します (テスト用).
+
+    ``TestClient`` はアプリケーションを別スレッドで実行するため、コンテキストに関係なく
+    すべてのエンジンで実行された SQL を集計します.
+
+    Args:
+        limit (int): 許容する SQL 文の数.
+        allow_repeated (bool): False の場合、同じ SQL 文が ``repeat_threshold`` 回以上
+            実行されたとき (N+1 の疑い) も失敗させます.
+        repeat_threshold (int): N+1 とみなす実行回数.
+
+    Raises:
+        AssertionError: 上限を超えた場合、または N+1 の疑いがある場合.
+    """
+    install()
+    stats = QueryStats()
+    _global_stats.append(stats)
+    try:
+        yield stats
+    finally:
+        _global_stats.remove(stats)
+    repeated = [] if allow_repeated else stats.repeated(repeat_threshold)
+    if stats.count > limit or repeated:
+        listing = "\n".join(f"  {n} x {' '.join(statement.split())}" for statement, n in stats.statements.most_common())
+        reason = f"{stats.count} queries executed, budget is {limit}"
+        if repeated:
+            reason += f"; {len(repeated)} statement(s) repeated {repeat_threshold}+ times (possible N+1)"
+        raise AssertionError(f"{reason}:\n{listing}")
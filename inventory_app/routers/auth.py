@@ -7,20 +7,28 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from datetime import timedelta
-from jose import JWTError, jwt
-from .. import database, schemas, crud, security, models
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from jose import JWTError
+from .. import cache, database, schemas, crud_async, security, models
 
 router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
     """Bearer トークンから現在のユーザーを取得するための依存関係.
-    
+
+    トークンにはユーザー ID・ロール・トークンのバージョンが含まれます. ユーザーのスナップショットは
+    ``cache.principal_cache`` にキャッシュされ、有効期間内はトークンのバージョンとの比較だけで
+    データベースへ問い合わせずに認可します. ロールや有効状態の変更でバージョンが加算されると、
+    それ以前に発行されたトークンは拒否されます.
+
+    Returns:
+        schemas.Principal: 認証済みユーザーのスナップショット.
+
     Raises:
-        HTTPException: クレデンシャルが無効な場合.
+        HTTPException: クレデンシャルが無効な場合、またはトークンが失効している場合.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -28,19 +36,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
+        claims = security.decode_user_token(token)
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
+    principal = await _load_principal(db, claims["uid"])
+    if principal is None or principal.token_version != claims["ver"] or principal.role != claims["role"]:
         raise credentials_exception
-    return user
+    return principal
 
-async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+async def _load_principal(db: AsyncSession, user_id: int):
+    """キャッシュまたはデータベースからユーザーのスナップショットを取得します."""
+    principal = cache.principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    generation = cache.principal_cache.generation
+    user = await crud_async.get_user(db, user_id=user_id)
+    if user is None:
+        return None
+    principal = schemas.Principal.model_validate(user)
+    cache.principal_cache.put(user_id, principal, generation)
+    return principal
+
+async def get_current_active_user(current_user: schemas.Principal = Depends(get_current_user)):
     """現在のアクティブなユーザーを取得するための依存関係.
     
     Raises:
@@ -50,7 +67,7 @@ async def get_current_active_user(current_user: models.User = Depends(get_curren
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-async def get_current_admin_user(current_user: models.User = Depends(get_current_active_user)):
+async def get_current_admin_user(current_user: schemas.Principal = Depends(get_current_active_user)):
     """現在の管理者ユーザーを取得するための依存関係.
     
     Raises:
@@ -61,17 +78,58 @@ async def get_current_admin_user(current_user: models.User = Depends(get_current
     return current_user
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    """OAuth2 互換トークンログイン, 将来のリクエストのためのアクセストークンを取得します."""
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    """OAuth2 互換トークンログイン, 将来のリクエストのためのアクセストークンを取得します.
+
+    bcrypt によるパスワード検証はイベントループをブロックしないよう、同時実行数を制限した
+    専用のスレッドプールで実行します. ハッシュのコストが ``security.BCRYPT_ROUNDS`` と異なる場合は
+    ログインの成功時に再ハッシュして保存します.
+    """
+    user = await crud_async.get_user_by_username(db, username=form_data.username)
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await security.verify_and_update_async(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+    tokens = _issue_tokens(user)
+    if new_hash:
+        username = user.username
+        try:
+            await crud_async.update_password_hash(db, user.id, new_hash)
+        except OperationalError as e:
+            # 再ハッシュは次回のログインでも行えるため、失敗してもログインは継続する
+            await db.rollback()
+            print(f"Failed to rehash password for {username}: {e}")
+    return tokens
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(request: schemas.RefreshRequest, db: AsyncSession = Depends(database.get_async_db)):
+    """リフレッシュトークンを検証し、新しいアクセストークンとリフレッシュトークンを発行します.
+
+    ユーザーが無効化された場合や、ロールの変更などでトークンのバージョンが加算された場合は拒否します.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    try:
+        claims = security.decode_user_token(request.refresh_token, security.REFRESH_TOKEN_TYPE)
+    except JWTError:
+        raise credentials_exception
+    user = await crud_async.get_user(db, user_id=claims["uid"])
+    if user is None or not user.is_active or (user.token_version or 0) != claims["ver"]:
+        raise credentials_exception
+    return _issue_tokens(user)
+
+def _issue_tokens(user) -> dict:
+    return {
+        "access_token": security.create_user_token(user, security.ACCESS_TOKEN_TYPE),
+        "refresh_token": security.create_user_token(user, security.REFRESH_TOKEN_TYPE),
+        "token_type": "bearer",
+        "expires_in": security.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
@@ -4,32 +4,33 @@
 備品に関連するエンドポイントを処理します.
 """
 
+import csv
 from datetime import date
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
-from .. import crud, database, models, schemas
+from .. import cache, crud, database, exporter, importer, models, schemas
+from ..pagination import MAX_PAGE_SIZE, InvalidCursorError, set_page_headers
 from .auth import get_current_active_user, get_current_admin_user
 
+ITEM_SORT_PATTERN = "^-?(" + "|".join(crud.ITEM_SORT_FIELDS) + ")$"
+
 router = APIRouter(
     prefix="/api/v1/items",
     tags=["items"],
 )
 
-@router.get("/status", response_model=List[schemas.GrowiItem])
-def get_items_status(db: Session = Depends(database.get_db)):
-    """Growi 連携用にフォーマットされたすべての備品ステータスを取得します.
-    
-    このエンドポイントは、期限切れステータスと所有者の表示名が計算された備品を返します.
-    """
-    # This endpoint logic was moved from routers/growi.py
-    items = crud.get_items(db, skip=0, limit=1000)
+_growi_items_adapter = TypeAdapter(List[schemas.GrowiItem])
+
+def _render_items_status(db: Session, today: date) -> bytes:
+    """Growi 連携用の備品ステータス一覧を JSON にシリアライズします."""
     result = []
-    today = date.today()
     
-    for item in items:
+    for item in crud.iter_items(db, with_owner=True):
         is_overdue = False
         if item.status == models.ItemStatus.borrowed.value and item.due_date:
             if today > item.due_date:
@@ -52,32 +53,212 @@ def get_items_status(db: Session = Depends(database.get_db)):
             lending_reason=item.lending_reason,
             lending_location=item.lending_location
         ))
-    return result
+    return _growi_items_adapter.dump_json(result)
+
+@router.get("/status", response_model=List[schemas.GrowiItem])
+def get_items_status(db: Session = Depends(database.get_db), if_none_match: Optional[str] = Header(None)):
+    """Growi 連携用にフォーマットされたすべての備品ステータスを取得します.
+    
+    このエンドポイントは、期限切れステータスと所有者の表示名が計算された備品を返します.
+    レスポンスはデータバージョンと日付ごとにキャッシュされ、備品またはユーザーが
+    変更されるまで再構築されません. ``If-None-Match`` が現在の ETag と一致する場合は
+    304 を返します.
+    """
+    today = date.today()
+    etag = cache.make_etag("status", cache.items_status_cache.current_versions(db), today)
+    if cache.etag_matches(if_none_match, etag):
+        return cache.not_modified(etag)
+
+    versions, payload = cache.items_status_cache.get(
+        db, lambda session: _render_items_status(session, today), key=today
+    )
+    response = Response(content=payload, media_type="application/json")
+    cache.set_etag_headers(response, cache.make_etag("status", versions, today))
+    return response
 
 @router.get("/", response_model=List[schemas.ItemResponse])
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_active_user)):
+def read_items(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    is_fixed_asset: Optional[bool] = None,
+    owner_id: Optional[int] = None,
+    overdue: Optional[bool] = None,
+    due_before: Optional[date] = None,
+    due_after: Optional[date] = None,
+    sort: str = Query("id", pattern=ITEM_SORT_PATTERN),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_active_user)
+):
     """備品を取得します.
     
+    備品はデフォルトで ID 順に返されます. 次ページがある場合は ``X-Next-Cursor`` ヘッダーに
+    カーソルが設定され、``cursor`` パラメータに指定すると続きを取得できます.
+    絞り込み条件に一致する総件数は ``X-Total-Count`` ヘッダーで返されます.
+
+    備品のデータバージョンから ETag を生成し、``If-None-Match`` が一致する場合は
+    備品を読み込まずに 304 を返します.
+
     Args:
-        skip (int): スキップする備品数.
+        skip (int): スキップする備品数 (``cursor`` 未指定時のみ有効).
         limit (int): 取得する備品の上限数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        status (str, optional): ステータスで絞り込みます.
+        category (str, optional): カテゴリで絞り込みます.
+        is_fixed_asset (bool, optional): 固定資産かどうかで絞り込みます.
+        owner_id (int, optional): 所有者IDで絞り込みます.
+        overdue (bool, optional): 期限切れかどうかで絞り込みます.
+        due_before (date, optional): この日付以前に返却予定の備品に絞り込みます.
+        due_after (date, optional): この日付以降に返却予定の備品に絞り込みます.
+        sort (str): 並べ替える列 (id, name, management_code, category, status, due_date).
+            先頭に ``-`` を付けると降順になります.
     """
-    items = crud.get_items(db, skip=skip, limit=limit)
+    filters = schemas.ItemFilter(
+        status=status,
+        category=category,
+        is_fixed_asset=is_fixed_asset,
+        owner_id=owner_id,
+        overdue=overdue,
+        due_before=due_before,
+        due_after=due_after,
+    )
+    # 期限切れの判定は日付に依存するため、日付もキーに含める
+    filter_key = (tuple(filters.model_dump().values()), date.today() if overdue is not None else None)
+    etag = cache.make_etag("items", cache.items_count.current_versions(db), skip, limit, cursor, sort, filter_key)
+    if cache.etag_matches(if_none_match, etag):
+        return cache.not_modified(etag)
+    try:
+        items, next_cursor = crud.get_items_page(db, limit=limit, cursor=cursor, skip=skip, filters=filters, sort=sort)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = cache.items_count.get(db, lambda session: crud.count_items(session, filters=filters), key=filter_key)
+    cache.set_etag_headers(response, etag)
+    set_page_headers(response, next_cursor, total)
     return items
 
+@router.get("/search", response_model=List[schemas.ItemResponse])
+def search_items(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_active_user)
+):
+    """備品を全文検索します.
+
+    名前・管理コード・カテゴリ・付属品を対象に、各単語に前方一致する備品を
+    関連度の高い順に返します.
+
+    Args:
+        q (str): 検索文字列 (例: "HDMI", "macbook pro").
+        limit (int): 取得する備品の上限数.
+    """
+    return crud.search_items(db, q, limit=limit)
+
 @router.post("/", response_model=schemas.ItemResponse, status_code=201)
-def create_item(item: schemas.ItemCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_admin_user)):
+def create_item(item: schemas.ItemCreate, db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_admin_user)):
     """新規備品を作成します. 管理者ユーザーのみアクセス可能です."""
     return crud.create_item(db=db, item=item)
 
+@router.post("/import", response_model=schemas.ImportReport)
+def import_items(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(importer.DEFAULT_BATCH_SIZE, ge=1, le=10000),
+    upsert: bool = True,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """CSV または NDJSON ファイルから備品を一括登録します. 管理者ユーザーのみアクセス可能です.
+
+    ファイルは 1 行ずつ読み込まれ、``batch_size`` 行ごとにコミットされます.
+    ``management_code`` が既に存在する備品は ``upsert`` が True の場合は更新され、
+    False の場合はスキップされます.
+
+    Args:
+        file (UploadFile): インポートするファイル. CSV の場合は 1 行目がヘッダー.
+        format (str, optional): ``csv`` または ``ndjson``. 省略時はファイル名から判定します.
+        batch_size (int): 1 回のコミットで書き込む行数.
+        upsert (bool): 既存の備品を更新するかどうか.
+    """
+    fmt = format or importer.detect_format(file.filename, file.content_type)
+    stream = importer.open_text(file.file)
+    try:
+        return importer.import_items(db, importer.iter_rows(stream, fmt), batch_size=batch_size, upsert=upsert)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}")
+    finally:
+        stream.detach()
+
+@router.get("/export")
+def export_items(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """備品の一覧 (借用者名を含む) をファイルとしてストリーミングで出力します. 管理者ユーザーのみアクセス可能です.
+
+    Args:
+        format (str): ``ndjson``、``csv`` または ``parquet``.
+    """
+    try:
+        chunks = exporter.export(db, "items", format)
+    except exporter.ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=exporter.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{exporter.filename("items", format)}"'},
+    )
+
 @router.delete("/{item_id}", status_code=204)
-def delete_item(item_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_admin_user)):
+def delete_item(item_id: int, db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_admin_user)):
     """備品を削除します. 管理者ユーザーのみアクセス可能です."""
     success = crud.delete_item(db=db, item_id=item_id)
     if not success:
         raise HTTPException(status_code=404, detail="Item not found")
     return None
 
+def _bulk_response(result: schemas.BulkOperationResult):
+    """``all_or_nothing`` モードで失敗した一括操作を 409 として返します."""
+    if result.mode == "all_or_nothing" and result.failed:
+        raise HTTPException(status_code=409, detail=result.model_dump())
+    return result
+
+@router.post("/bulk/borrow", response_model=schemas.BulkOperationResult)
+def bulk_borrow_items(
+    request: schemas.BulkBorrowRequest,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """複数の備品を一括で貸し出します. 管理者ユーザーのみアクセス可能です.
+
+    ``all_or_nothing`` モードで 1 件でも貸出できない備品がある場合は、何も変更せずに
+    備品ごとの結果を含む 409 を返します.
+    """
+    user = crud.get_user_by_username(db, username=request.username)
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    return _bulk_response(crud.bulk_borrow_items(db, request, user_id=user.id))
+
+@router.post("/bulk/return", response_model=schemas.BulkOperationResult)
+def bulk_return_items(
+    request: schemas.BulkReturnRequest,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """複数の備品を一括で返却します. 管理者ユーザーのみアクセス可能です.
+
+    ``all_or_nothing`` モードで 1 件でも返却できない備品がある場合は、何も変更せずに
+    備品ごとの結果を含む 409 を返します.
+    """
+    return _bulk_response(crud.bulk_return_items(db, request))
+
 class UnauthenticatedBorrowRequest(schemas.BaseModel):
     """貸出リクエスト用スキーマ."""
     username: str
@@ -112,6 +293,8 @@ def borrow_item(
             lending_reason=borrow_request.lending_reason,
             lending_location=borrow_request.lending_location
         )
+    except crud.ItemStateConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
         
@@ -121,27 +304,19 @@ def borrow_item(
 
 @router.post("/{item_id}/return", response_model=schemas.ItemResponse)
 def return_item(item_id: int, db: Session = Depends(database.get_db)):
-    """借りている備品を返却します."""
-    # Retrieve the item to find the current borrower (to log the action correctly)
-    item = crud.get_item(db, item_id)
-    if not item:
-         raise HTTPException(status_code=404, detail="Item not found")
-
-    user_id = item.owner_id
-    if not user_id:
-        # If no owner, maybe it's already returned or inconsistent.
-        # Check status check inside crud.return_item will handle "not borrowed" error.
-        # But we need a user_id for logging. Use 1 (Admin/System) or handle gracefully?
-        # crud.return_item requires user_id.
-        # If we can't identify, let's try to proceed, maybe crud throws error.
-        # Let's assume user_id=0 or 1 if None.
-        user_id = 1 # Fallback to admin/first user for log if somehow owner_id is missing
+    """借りている備品を返却します.
 
+    ログには返却時点の借用者が記録されます.
+    """
     try:
         # force=True allows return without checking if "current_user" matches "owner_id"
         # Since we don't have current_user, we just trust the action.
-        item = crud.return_item(db=db, item_id=item_id, user_id=user_id, force=True)
+        item = crud.return_item(db=db, item_id=item_id, force=True)
+    except crud.ItemStateConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-        
+
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
     return item
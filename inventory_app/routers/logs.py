@@ -0,0 +1,112 @@
+"""貸出・返却ログ用 API ルーター.
+
+このモジュールは、備品の貸出・返却履歴の取得など、
+ログに関連するエンドポイントを処理します.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from .. import archive, cache, crud, database, exporter, schemas
+from ..pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursorError, set_page_headers
+from .auth import get_current_active_user, get_current_admin_user
+
+router = APIRouter(
+    prefix="/api/v1/logs",
+    tags=["logs"],
+)
+
+@router.get("/", response_model=List[schemas.LogResponse])
+def read_logs(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    item_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_active_user)
+):
+    """ログを新しい順に取得します.
+
+    次ページカーソルと総件数はそれぞれ ``X-Next-Cursor`` と ``X-Total-Count``
+    ヘッダーで返されます.
+
+    Args:
+        limit (int): 取得するログの上限数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        item_id (int, optional): 指定した場合、この備品のログのみを取得します.
+        user_id (int, optional): 指定した場合、このユーザーのログのみを取得します.
+    """
+    etag = cache.make_etag("logs", cache.logs_count.current_versions(db), limit, cursor, item_id, user_id)
+    if cache.etag_matches(if_none_match, etag):
+        return cache.not_modified(etag)
+    try:
+        logs, next_cursor = crud.get_logs_page(db, limit=limit, cursor=cursor, item_id=item_id, user_id=user_id)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = cache.logs_count.get(
+        db, lambda session: crud.count_logs(session, item_id=item_id, user_id=user_id), key=(item_id, user_id)
+    )
+    cache.set_etag_headers(response, etag)
+    set_page_headers(response, next_cursor, total)
+    return logs
+
+@router.get("/history", response_model=List[schemas.HistoryEntry])
+def read_history(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    item_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_active_user)
+):
+    """アーカイブ済みのログを含む履歴を新しい順に取得します.
+
+    次ページカーソルは ``X-Next-Cursor`` ヘッダーで返されます.
+
+    Args:
+        limit (int): 取得するログの上限数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
+        item_id (int, optional): 指定した場合、この備品のログのみを取得します.
+        user_id (int, optional): 指定した場合、このユーザーのログのみを取得します.
+    """
+    try:
+        entries, next_cursor = archive.history_page(db, limit=limit, cursor=cursor, item_id=item_id, user_id=user_id)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return entries
+
+@router.get("/export")
+def export_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """監査用にログ (備品名・ユーザー名を含む) をファイルとしてストリーミングで出力します.
+
+    管理者ユーザーのみアクセス可能です. アーカイブ済みのログは含まれません.
+
+    Args:
+        format (str): ``ndjson``、``csv`` または ``parquet``.
+        start (datetime, optional): この日時以降に作成されたログのみを出力します.
+        end (datetime, optional): この日時より前に作成されたログのみを出力します.
+    """
+    try:
+        chunks = exporter.export(db, "logs", format, start=start, end=end)
+    except exporter.ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=exporter.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{exporter.filename("logs", format)}"'},
+    )
@@ -0,0 +1,61 @@
+"""利用統計用 API ルーター.
+
+このモジュールは、備品・ユーザーごとの利用統計の取得と再構築を行うエンドポイントを処理します.
+統計はログを走査せずに ``item_stats`` / ``user_stats`` テーブルから取得されます.
+"""
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from .. import database, models, schemas, stats
+from .auth import get_current_active_user, get_current_admin_user
+
+router = APIRouter(
+    prefix="/api/v1/stats",
+    tags=["stats"],
+)
+
+@router.get("/items", response_model=List[schemas.ItemStatsResponse])
+def list_item_stats(
+    order: str = Query("most", pattern="^(most|least)$"),
+    limit: int = Query(20, ge=1, le=500),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_active_user)
+):
+    """貸出回数の多い順 (``most``) または少ない順 (``least``) に備品の利用統計を取得します."""
+    return stats.list_item_stats(db, order=order, limit=limit)
+
+@router.get("/items/{item_id}", response_model=schemas.ItemStatsResponse)
+def read_item_stats(item_id: int, db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_active_user)):
+    """備品の利用統計を取得します."""
+    result = stats.get_item_stats(db, item_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return result
+
+@router.get("/users", response_model=List[schemas.UserStatsResponse])
+def list_user_stats(
+    sort: str = Query("current_borrowed_count", pattern="^(" + "|".join(stats.USER_SORT_FIELDS) + ")$"),
+    limit: int = Query(20, ge=1, le=500),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """指定した項目の多い順にユーザーの利用統計を取得します. 管理者ユーザーのみアクセス可能です."""
+    return stats.list_user_stats(db, sort=sort, limit=limit)
+
+@router.get("/users/{user_id}", response_model=schemas.UserStatsResponse)
+def read_user_stats(user_id: int, db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_active_user)):
+    """ユーザーの利用統計を取得します. 管理者以外は自分の統計のみ取得できます."""
+    if current_user.role != models.Role.admin.value and current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    result = stats.get_user_stats(db, user_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return result
+
+@router.post("/rebuild", response_model=schemas.StatsRebuildReport)
+def rebuild_stats(db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_admin_user)):
+    """ログから利用統計を再構築します. 管理者ユーザーのみアクセス可能です."""
+    return stats.rebuild(db)
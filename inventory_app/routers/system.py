@@ -0,0 +1,44 @@
+"""システム管理用 API ルーター.
+
+このモジュールは、通知スケジューラーの状態の取得と即時実行、
+およびプロセス内キャッシュの統計情報の取得を行うエンドポイントを処理します.
+"""
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+
+from .. import cache, schemas
+from .auth import get_current_admin_user
+
+router = APIRouter(
+    prefix="/api/v1/system",
+    tags=["system"],
+)
+
+def _get_scheduler(request: Request):
+    scheduler = getattr(request.app.state, "scheduler", None)
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="Scheduler is not running in this process")
+    return scheduler
+
+@router.get("/scheduler", response_model=schemas.SchedulerStatus)
+def read_scheduler_status(request: Request, current_user: schemas.Principal = Depends(get_current_admin_user)):
+    """通知スケジューラーの状態と直近の実行結果を取得します. 管理者ユーザーのみアクセス可能です."""
+    return _get_scheduler(request).status()
+
+@router.post("/scheduler/run", response_model=schemas.SchedulerStatus, status_code=status.HTTP_202_ACCEPTED)
+def run_scheduler_now(request: Request, current_user: schemas.Principal = Depends(get_current_admin_user)):
+    """通知ジョブの即時実行を要求します. 管理者ユーザーのみアクセス可能です.
+
+    ジョブはスケジューラースレッドで実行され、このリクエストは完了を待たずに応答します.
+    """
+    scheduler = _get_scheduler(request)
+    if not scheduler.trigger():
+        raise HTTPException(status_code=409, detail="Notification job is already running or queued")
+    return scheduler.status()
+
+@router.get("/caches", response_model=List[schemas.CacheStats])
+def read_cache_stats(current_user: schemas.Principal = Depends(get_current_admin_user)):
+    """このプロセスのキャッシュのヒット数・ミス数などを取得します. 管理者ユーザーのみアクセス可能です."""
+    return [cache.principal_cache.stats()]
@@ -4,12 +4,14 @@
 ユーザーに関連するエンドポイントを処理します.
 """
 
-from typing import List
+import csv
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
 from sqlalchemy.orm import Session
 
-from .. import crud, database, models, schemas
+from .. import cache, crud, database, importer, schemas
+from ..pagination import MAX_PAGE_SIZE, InvalidCursorError, set_page_headers
 from .auth import get_current_active_user, get_current_admin_user
 
 router = APIRouter(
@@ -19,7 +21,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_admin_user)):
+def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_admin_user)):
     """新規ユーザーを作成します. 管理者ユーザーのみアクセス可能です.
 
     Args:
@@ -30,18 +32,75 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
         raise HTTPException(status_code=400, detail="Username already registered")
     return crud.create_user(db=db, user=user)
 
+@router.post("/import", response_model=schemas.ImportReport)
+def import_users(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(importer.DEFAULT_BATCH_SIZE, ge=1, le=10000),
+    update_existing: bool = False,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.Principal = Depends(get_current_admin_user)
+):
+    """CSV または NDJSON ファイルからユーザーを一括登録します. 管理者ユーザーのみアクセス可能です.
+
+    平文のパスワードはプロセスプールで並列にハッシュ化されます. ハッシュ化済みの
+    パスワードを ``hashed_password`` 列で渡すこともできます.
+
+    Args:
+        file (UploadFile): インポートするファイル. CSV の場合は 1 行目がヘッダー.
+        format (str, optional): ``csv`` または ``ndjson``. 省略時はファイル名から判定します.
+        batch_size (int): 1 回のコミットで書き込む行数.
+        update_existing (bool): ユーザー名が一致する既存ユーザーを更新するかどうか.
+    """
+    fmt = format or importer.detect_format(file.filename, file.content_type)
+    stream = importer.open_text(file.file)
+    try:
+        return importer.import_users(db, importer.iter_rows(stream, fmt), batch_size=batch_size,
+                                     update_existing=update_existing)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}")
+    finally:
+        stream.detach()
+
 @router.get("/", response_model=List[schemas.UserResponse])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
+def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db)
+):
     """すべてのユーザーを取得します. (認証不要)
 
+    ユーザーは ID 順に返されます. 次ページカーソルと総件数はそれぞれ
+    ``X-Next-Cursor`` と ``X-Total-Count`` ヘッダーで返されます.
+
+    ユーザーのデータバージョンから ETag を生成し、``If-None-Match`` が一致する場合は
+    304 を返します.
+
     Args:
-        skip (int): スキップするユーザー数.
+        skip (int): スキップするユーザー数 (``cursor`` 未指定時のみ有効).
         limit (int): 取得するユーザーの上限数.
+        cursor (str, optional): 前ページで返された次ページカーソル.
     """
-    users = crud.get_users(db, skip=skip, limit=limit)
+    etag = cache.make_etag("users", cache.users_count.current_versions(db), skip, limit, cursor)
+    if cache.etag_matches(if_none_match, etag):
+        return cache.not_modified(etag)
+    try:
+        users, next_cursor = crud.get_users_page(db, limit=limit, cursor=cursor, skip=skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache.set_etag_headers(response, etag)
+    set_page_headers(response, next_cursor, cache.users_count.get(db, crud.count_users))
     return users
 
 @router.get("/me", response_model=schemas.UserResponse)
-def read_user_me(current_user: models.User = Depends(get_current_active_user)):
+def read_user_me(db: Session = Depends(database.get_db), current_user: schemas.Principal = Depends(get_current_active_user)):
     """現在認証されているユーザーの情報を取得します."""
-    return current_user
+    user = crud.get_user(db, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
@@ -0,0 +1,303 @@
+"""通知ジョブのスケジューラー.
+
+通知の確認と送信 (``notification.check_and_send_notifications``) は、データベースの走査と
+SMTP の送受信を含む同期処理です. イベントループ上で実行すると実行中は API の応答が
+止まるため、専用のワーカースレッドで独自のデータベースセッションを使って実行します.
+
+実行時刻は cron 形式 (``INVENTORY_NOTIFICATION_CRON``、既定値 ``0 8 * * *`` = 毎日 8:00) で
+指定します. 管理者は ``POST /api/v1/system/scheduler/run`` で即時実行を要求でき、
+直近の実行時間と結果は ``GET /api/v1/system/scheduler`` で確認できます.
+
+Usage:
+    python -m inventory_app.scheduler            # スケジュールに従って実行し続ける
+    python -m inventory_app.scheduler --once     # 1 回だけ実行する
+"""
+
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Deque, List, Optional, Set
+
+from . import metrics, schemas
+
+# 通知ジョブの実行時刻 (cron 形式: 分 時 日 月 曜日)
+NOTIFICATION_CRON = os.environ.get("INVENTORY_NOTIFICATION_CRON", "0 8 * * *")
+
+# "0" の場合、API サーバーのプロセス内でスケジューラーを起動しない (別プロセスで実行する場合など)
+SCHEDULER_ENABLED = os.environ.get("INVENTORY_SCHEDULER_ENABLED", "1") != "0"
+
+# 保持する実行履歴の件数
+MAX_RUN_HISTORY = 50
+
+# 次回の実行時刻を探す最大日数
+_MAX_SEARCH_DAYS = 366 * 5
+
+
+class CronError(ValueError):
+    """cron 式が不正な場合に送出される例外."""
+
+
+class CronSchedule:
+    """5 フィールド (分 時 日 月 曜日) の cron 式.
+
+    各フィールドでは ``*``、数値、範囲 (``1-5``)、間隔 (``*/15``, ``0-30/10``) と
+    それらのカンマ区切りのリストを使用できます. 曜日は 0 (または 7) が日曜日です.
+    日と曜日の両方を指定した場合は、どちらかに一致する日に実行します (一般的な cron と同じ).
+    すべての値を含むフィールド (``*``、``*/1``、``1-31``、``0-6`` など) は指定なしとして扱います.
+
+    Attributes:
+        expression (str): 元の cron 式.
+    """
+
+    _FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != len(self._FIELDS):
+            raise CronError(f"Cron expression must have 5 fields: {expression!r}")
+        fields = [self._parse(part, name, low, high) for part, (name, low, high) in zip(parts, self._FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # 日曜日は 0 と 7 のどちらでも指定できる. Python の weekday() に合わせて月曜日を 0 にする
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        # 書き方ではなく解析した値で判定する (``*/1`` や ``1-31`` も ``*`` と同じ)
+        self._any_day = self.days == set(range(1, 32))
+        self._any_weekday = self.weekdays == set(range(7))
+
+    @staticmethod
+    def _parse(field: str, name: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            base, _, step = part.partition("/")
+            try:
+                step = int(step) if step else 1
+                if base == "*":
+                    start, end = low, high
+                elif "-" in base:
+                    start, end = (int(value) for value in base.split("-", 1))
+                else:
+                    start = end = int(base)
+                    if step > 1:
+                        end = high
+            except ValueError:
+                raise CronError(f"Invalid {name} field: {field!r}") from None
+            if step < 1 or start < low or end > high or start > end:
+                raise CronError(f"Invalid {name} field: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _matches_day(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = day.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """``moment`` より後で、最初に cron 式に一致する日時 (秒は 0) を返します.
+
+        Raises:
+            CronError: 一致する日時が存在しない場合 (例: 2 月 30 日).
+        """
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(_MAX_SEARCH_DAYS):
+            if self._matches_day(day):
+                first_day = day == start.date()
+                for hour in sorted(self.hours):
+                    if first_day and hour < start.hour:
+                        continue
+                    for minute in sorted(self.minutes):
+                        if first_day and hour == start.hour and minute < start.minute:
+                            continue
+                        return datetime(day.year, day.month, day.day, hour, minute)
+            day += timedelta(days=1)
+        raise CronError(f"Cron expression never matches: {self.expression!r}")
+
+
+def _run_notifications(db):
+    from .notification import check_and_send_notifications
+
+    return check_and_send_notifications(db)
+
+
+class JobScheduler:
+    """cron 式に従ってジョブを専用スレッドで実行するスケジューラー.
+
+    ジョブは ``session_factory`` で作成した独自のセッションを受け取って実行され、
+    実行ごとにセッションを閉じます. 同時に実行されるジョブは常に 1 つです.
+
+    Attributes:
+        schedule (CronSchedule): 実行時刻.
+        session_factory (Callable): データベースセッションを作成する関数.
+        runs (collections.deque[schemas.SchedulerRun]): 直近の実行結果 (新しい順).
+        next_run_at (datetime, optional): 次回の実行予定時刻.
+    """
+
+    def __init__(self, schedule: CronSchedule, job: Callable = _run_notifications,
+                 session_factory: Optional[Callable] = None, name: str = "notification-scheduler"):
+        self.schedule = schedule
+        self.job = job
+        self.session_factory = session_factory
+        self.name = name
+        self.runs: Deque[schemas.SchedulerRun] = collections.deque(maxlen=MAX_RUN_HISTORY)
+        self.next_run_at: Optional[datetime] = None
+        self.run_count = 0
+        self.failure_count = 0
+        self._pending_triggers: List[str] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """スケジューラースレッドを開始します."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+        print(f"Notification scheduler started ({self.schedule.expression}).")
+
+    def stop(self, timeout: Optional[float] = None):
+        """スケジューラースレッドを停止します. 実行中のジョブは完了まで待ちます."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self) -> bool:
+        """ジョブの即時実行を要求します.
+
+        Returns:
+            bool: 要求を受け付けた場合は True. 既に実行中または実行待ちの場合は False.
+        """
+        with self._lock:
+            if self._running or self._pending_triggers:
+                return False
+            self._pending_triggers.append("manual")
+        self._wake.set()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.next_run_at = self.schedule.next_after(datetime.now())
+            print(f"Next notification check at {self.next_run_at}")
+            while not self._stop.is_set():
+                # 要求を確認する前にクリアする. 確認後の trigger() や stop() は wait() をすぐに終了させる
+                self._wake.clear()
+                with self._lock:
+                    trigger = self._pending_triggers.pop(0) if self._pending_triggers else None
+                if trigger is not None:
+                    break
+                remaining = (self.next_run_at - datetime.now()).total_seconds()
+                if remaining <= 0:
+                    trigger = "schedule"
+                    break
+                self._wake.wait(min(remaining, 60))
+            if self._stop.is_set():
+                break
+            self.run_once(trigger)
+
+    def run_once(self, trigger: str = "manual") -> schemas.SchedulerRun:
+        """ジョブを呼び出し元のスレッドで 1 回実行し、実行結果を記録します."""
+        with self._lock:
+            self._running = True
+        started_at = datetime.now()
+        started = time.perf_counter()
+        run = schemas.SchedulerRun(trigger=trigger, started_at=started_at)
+        db = self.session_factory() if self.session_factory else _default_session()
+        try:
+            result = self.job(db)
+            run.status = "ok" if result is not None else "skipped"
+            if isinstance(result, schemas.NotificationReport):
+                run.report = result
+        except Exception as e:  # noqa: BLE001 スケジューラーを止めずに失敗を記録する
+            run.status = "error"
+            run.error = f"{type(e).__name__}: {e}"
+            print(f"Error in notification job: {run.error}")
+        finally:
+            db.close()
+            run.finished_at = datetime.now()
+            run.duration_seconds = time.perf_counter() - started
+            with self._lock:
+                self._running = False
+                self.run_count += 1
+                self.failure_count += run.status == "error"
+                self.runs.appendleft(run)
+            metrics.record_notification_run(run)
+        print(f"Notification job finished: {run.status} in {run.duration_seconds:.2f}s ({trigger})")
+        return run
+
+    def status(self) -> schemas.SchedulerStatus:
+        """スケジューラーの状態と直近の実行結果を返します."""
+        with self._lock:
+            runs = list(self.runs)
+            running = self._running
+        durations = [run.duration_seconds for run in runs]
+        return schemas.SchedulerStatus(
+            cron=self.schedule.expression,
+            alive=self._thread is not None and self._thread.is_alive(),
+            running=running,
+            next_run_at=self.next_run_at,
+            run_count=self.run_count,
+            failure_count=self.failure_count,
+            last_duration_seconds=durations[0] if durations else None,
+            average_duration_seconds=sum(durations) / len(durations) if durations else None,
+            runs=runs,
+        )
+
+
+def _default_session():
+    from .database import SessionLocal
+
+    return SessionLocal()
+
+
+def create_notification_scheduler(expression: Optional[str] = None) -> JobScheduler:
+    """``INVENTORY_NOTIFICATION_CRON`` に従って通知ジョブを実行するスケジューラーを作成します.
+
+    Raises:
+        CronError: cron 式が不正な場合.
+    """
+    return JobScheduler(CronSchedule(expression or NOTIFICATION_CRON))
+
+
+def main(argv=None):
+    """API サーバーとは別のプロセスでスケジューラーを実行します."""
+    parser = argparse.ArgumentParser(description="通知ジョブをスケジュールに従って実行します.")
+    parser.add_argument("--cron", default=NOTIFICATION_CRON, help="実行時刻 (cron 形式).")
+    parser.add_argument("--once", action="store_true", help="1 回だけ実行して終了します.")
+    args = parser.parse_args(argv)
+
+    from .database import init_db
+
+    init_db()
+    try:
+        scheduler = create_notification_scheduler(args.cron)
+    except CronError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.once:
+        run = scheduler.run_once()
+        print(run.model_dump_json(indent=2))
+        return 0 if run.status != "error" else 1
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,13 @@
 """Item Manager アプリケーションの Pydantic スキーマ.
 
-このモジュールは、User, Item, Token, Growi 連携など、
+このモジュールは、User, Item, Log, Token, Growi 連携など、
 データバリデーションとシリアライゼーションに使用される Pydantic モデルを定義します.
 """
 
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class Token(BaseModel):
@@ -16,9 +16,21 @@ class Token(BaseModel):
     Attributes:
         access_token (str): JWTアクセストークン文字列.
         token_type (str): トークンのタイプ (例: "bearer").
+        refresh_token (str, optional): アクセストークンを再発行するためのリフレッシュトークン.
+        expires_in (int, optional): アクセストークンの有効期間 (秒).
     """
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    """トークン再発行リクエストのスキーマ.
+
+    Attributes:
+        refresh_token (str): ログイン時に発行されたリフレッシュトークン.
+    """
+    refresh_token: str
 
 class TokenData(BaseModel):
     """トークンペイロードデータのスキーマ.
@@ -28,6 +40,28 @@ class TokenData(BaseModel):
     """
     username: Optional[str] = None
 
+class Principal(BaseModel):
+    """認証済みユーザーの不変のスナップショット.
+
+    認証の依存関係が返す値で、``cache.principal_cache`` にキャッシュされます.
+
+    Attributes:
+        id (int): ユーザーID.
+        username (str): ユーザー名.
+        role (str): ユーザーロール.
+        is_active (bool): ユーザーが有効かどうか.
+        token_version (int): トークンのバージョン.
+    """
+    id: int
+    username: str
+    role: str
+    is_active: bool
+    token_version: int = 0
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class UserBase(BaseModel):
     """ユーザーデータの基本スキーマ.
 
@@ -52,6 +86,22 @@ class UserCreate(UserBase):
     """
     password: str
 
+class UserImportRow(UserBase):
+    """ユーザー一括インポートの 1 行分のスキーマ.
+
+    新規ユーザーには ``password`` または ``hashed_password`` (bcrypt) のいずれかが必要です.
+
+    Attributes:
+        password (str, optional): 平文のパスワード. インポート時にハッシュ化されます.
+        hashed_password (str, optional): ハッシュ化済みのパスワード.
+        role (str, optional): ユーザーロール (admin または user).
+        is_active (bool, optional): ユーザーが有効かどうか.
+    """
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None
+    role: Optional[Literal["admin", "user"]] = None
+    is_active: Optional[bool] = None
+
 class UserResponse(UserBase):
     """ユーザーレスポンス用スキーマ.
 
@@ -103,6 +153,26 @@ class ItemUpdate(BaseModel):
     lending_reason: Optional[str] = None
     lending_location: Optional[str] = None
 
+class ItemFilter(BaseModel):
+    """備品一覧の絞り込み条件スキーマ.
+
+    Attributes:
+        status (str, optional): ステータス.
+        category (str, optional): カテゴリ.
+        is_fixed_asset (bool, optional): 固定資産かどうか.
+        owner_id (int, optional): 所有者ID.
+        overdue (bool, optional): Trueの場合は期限切れの備品のみ、Falseの場合は期限切れ以外の備品のみ.
+        due_before (date, optional): この日付以前に返却予定の備品のみ.
+        due_after (date, optional): この日付以降に返却予定の備品のみ.
+    """
+    status: Optional[str] = None
+    category: Optional[str] = None
+    is_fixed_asset: Optional[bool] = None
+    owner_id: Optional[int] = None
+    overdue: Optional[bool] = None
+    due_before: Optional[date] = None
+    due_after: Optional[date] = None
+
 class ItemResponse(ItemBase):
     """備品レスポンス用スキーマ.
 
@@ -124,6 +194,33 @@ class ItemResponse(ItemBase):
     class Config:
         from_attributes = True
 
+class LogResponse(BaseModel):
+    """ログレスポンス用スキーマ.
+
+    Attributes:
+        id (int): ログID.
+        item_id (int): 備品ID.
+        user_id (int): ユーザーID.
+        action (str): アクション (borrow, return).
+        created_at (datetime): アクションの日時.
+    """
+    id: int
+    item_id: Optional[int] = None
+    user_id: Optional[int] = None
+    action: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class HistoryEntry(LogResponse):
+    """アーカイブ済みのログを含む履歴のレスポンス用スキーマ.
+
+    Attributes:
+        archived (bool): アーカイブデータベースから取得したログかどうか.
+    """
+    archived: bool = False
+
 class GrowiItem(BaseModel):
     """Growi 連携表示用アイテムスキーマ.
 
@@ -151,3 +248,277 @@ class GrowiItem(BaseModel):
     accessories: List[str] = []
     lending_reason: Optional[str] = None
     lending_location: Optional[str] = None
+
+class BulkItemSelection(BaseModel):
+    """一括操作の対象備品を指定する基本スキーマ.
+
+    Attributes:
+        item_ids (list[int]): 対象備品のIDのリスト.
+        management_codes (list[str]): 対象備品の管理コードのリスト.
+        mode (str): ``all_or_nothing`` の場合は 1 件でも失敗するとすべて取り消し、
+            ``best_effort`` の場合は成功した備品のみ反映します.
+    """
+    item_ids: List[int] = Field(default=[], max_length=1000)
+    management_codes: List[str] = Field(default=[], max_length=1000)
+    mode: Literal["all_or_nothing", "best_effort"] = "all_or_nothing"
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        """対象備品が少なくとも 1 件指定されていることを検証する."""
+        if not self.item_ids and not self.management_codes:
+            raise ValueError("item_ids or management_codes is required")
+        return self
+
+class BulkBorrowRequest(BulkItemSelection):
+    """一括貸出リクエスト用スキーマ.
+
+    Attributes:
+        username (str): 借用するユーザーのユーザー名.
+        due_date (date): 返却予定日.
+        lending_reason (str, optional): 貸出理由.
+        lending_location (str, optional): 貸出場所.
+    """
+    username: str
+    due_date: date
+    lending_reason: Optional[str] = None
+    lending_location: Optional[str] = None
+
+class BulkReturnRequest(BulkItemSelection):
+    """一括返却リクエスト用スキーマ."""
+    pass
+
+class BulkItemResult(BaseModel):
+    """一括操作における備品ごとの結果スキーマ.
+
+    Attributes:
+        key (str): リクエストで指定された備品ID または 管理コード.
+        item_id (int, optional): 解決された備品ID.
+        success (bool): 操作が反映されたかどうか.
+        error (str, optional): 失敗した場合の理由.
+    """
+    key: str
+    item_id: Optional[int] = None
+    success: bool
+    error: Optional[str] = None
+
+class BulkOperationResult(BaseModel):
+    """一括操作の結果スキーマ.
+
+    Attributes:
+        mode (str): 実行モード.
+        succeeded (int): 反映された備品数.
+        failed (int): 失敗した備品数.
+        results (list[BulkItemResult]): 備品ごとの結果.
+    """
+    mode: str
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+class ImportRowError(BaseModel):
+    """インポートで失敗した行の情報スキーマ.
+
+    Attributes:
+        row (int): 行番号 (CSV はヘッダーを 1 行目とする).
+        key (str, optional): 行の識別子 (管理コードやユーザー名).
+        error (str): 失敗の理由.
+    """
+    row: int
+    key: Optional[str] = None
+    error: str
+
+class ImportReport(BaseModel):
+    """一括インポートの結果スキーマ.
+
+    Attributes:
+        total (int): 読み込んだ行数.
+        inserted (int): 新規に登録された件数.
+        updated (int): 既存データを更新した件数.
+        skipped (int): 既存データのため登録しなかった件数.
+        failed (int): 失敗した行数.
+        errors (list[ImportRowError]): 失敗した行の情報 (最大 ``MAX_REPORTED_ERRORS`` 件).
+    """
+    total: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+
+class ArchiveReport(BaseModel):
+    """ログのアーカイブ結果スキーマ.
+
+    Attributes:
+        cutoff (datetime): この日時より前に作成されたログをアーカイブしました.
+        archived (int): アーカイブしたログの件数.
+        chunks (int): 処理したチャンク数.
+        years (dict[int, int]): 年ごとのアーカイブ件数.
+    """
+    cutoff: datetime
+    archived: int = 0
+    chunks: int = 0
+    years: Dict[int, int] = {}
+
+class ItemStatsResponse(BaseModel):
+    """備品の利用統計のレスポンス用スキーマ.
+
+    Attributes:
+        item_id (int): 備品ID.
+        name (str): 備品名.
+        management_code (str): 管理コード.
+        borrow_count (int): 貸出回数.
+        total_borrowed_days (int): 返却済みの貸出の合計日数.
+        last_borrowed_at (datetime, optional): 最後に貸し出された日時.
+        current_borrowed_at (datetime, optional): 貸出中の場合、その貸出の開始日時.
+        currently_overdue (bool): 現在延滞しているかどうか.
+    """
+    item_id: int
+    name: str
+    management_code: str
+    borrow_count: int = 0
+    total_borrowed_days: int = 0
+    last_borrowed_at: Optional[datetime] = None
+    current_borrowed_at: Optional[datetime] = None
+    currently_overdue: bool = False
+
+class UserStatsResponse(BaseModel):
+    """ユーザーの利用統計のレスポンス用スキーマ.
+
+    Attributes:
+        user_id (int): ユーザーID.
+        username (str): ユーザー名.
+        display_name (str, optional): 表示名.
+        borrow_count (int): 貸出回数.
+        total_borrowed_days (int): 返却済みの貸出の合計日数.
+        last_borrowed_at (datetime, optional): 最後に借りた日時.
+        current_borrowed_count (int): 現在借りている備品の数.
+        currently_overdue_count (int): 現在延滞している備品の数.
+    """
+    user_id: int
+    username: str
+    display_name: Optional[str] = None
+    borrow_count: int = 0
+    total_borrowed_days: int = 0
+    last_borrowed_at: Optional[datetime] = None
+    current_borrowed_count: int = 0
+    currently_overdue_count: int = 0
+
+class StatsRebuildReport(BaseModel):
+    """利用統計の再構築結果スキーマ.
+
+    Attributes:
+        logs (int): 読み込んだログの件数 (アーカイブを含む).
+        items (int): 統計を作成した備品の数.
+        users (int): 統計を作成したユーザーの数.
+    """
+    logs: int = 0
+    items: int = 0
+    users: int = 0
+
+class NotificationError(BaseModel):
+    """送信に失敗した通知メールの情報.
+
+    Attributes:
+        recipient (str): 宛先のメールアドレス.
+        error (str): 最後のエラーメッセージ.
+        attempts (int): 送信を試みた回数.
+        permanent (bool): 恒久的なエラー (再送しても成功しない) かどうか.
+    """
+    recipient: str
+    error: str
+    attempts: int = 1
+    permanent: bool = True
+
+class NotificationReport(BaseModel):
+    """通知メールの送信結果スキーマ.
+
+    Attributes:
+        queued (int): アウトボックスに新たに登録した通知の数.
+        sent (int): 送信したメールの数.
+        failed (int): 送信に失敗したメールの数.
+        skipped (int): 期限切れや返却済みのため送信しなかった通知の数.
+        retried (int): 一時的なエラーで再送した回数.
+        workers (int): 並行して送信したワーカーの数.
+        connections (int): 確立した SMTP 接続の数.
+        elapsed_seconds (float): 送信にかかった時間 (秒).
+        messages_per_second (float): 1 秒あたりの送信数.
+        dead_letters (list[NotificationError]): 送信できなかったメール (デッドレター) の情報.
+    """
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    retried: int = 0
+    workers: int = 0
+    connections: int = 0
+    elapsed_seconds: float = 0.0
+    messages_per_second: float = 0.0
+    dead_letters: List[NotificationError] = []
+
+class SchedulerRun(BaseModel):
+    """スケジューラーによるジョブの 1 回の実行結果スキーマ.
+
+    Attributes:
+        trigger (str): 実行のきっかけ (``schedule`` または ``manual``).
+        status (str): 結果 (``running``, ``ok``, ``skipped``, ``error``).
+        started_at (datetime): 開始日時.
+        finished_at (datetime, optional): 終了日時.
+        duration_seconds (float): 実行にかかった時間 (秒).
+        error (str, optional): 失敗した場合のエラーメッセージ.
+        report (NotificationReport, optional): 通知の送信結果.
+    """
+    trigger: str
+    status: str = "running"
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_seconds: float = 0.0
+    error: Optional[str] = None
+    report: Optional[NotificationReport] = None
+
+class SchedulerStatus(BaseModel):
+    """スケジューラーの状態スキーマ.
+
+    Attributes:
+        cron (str): 実行時刻 (cron 形式).
+        alive (bool): スケジューラースレッドが動作しているかどうか.
+        running (bool): ジョブを実行中かどうか.
+        next_run_at (datetime, optional): 次回の実行予定時刻.
+        run_count (int): 起動してからの実行回数.
+        failure_count (int): 起動してから失敗した実行の回数.
+        last_duration_seconds (float, optional): 直近の実行にかかった時間 (秒).
+        average_duration_seconds (float, optional): 保持している実行履歴の平均実行時間 (秒).
+        runs (list[SchedulerRun]): 直近の実行結果 (新しい順).
+    """
+    cron: str
+    alive: bool
+    running: bool
+    next_run_at: Optional[datetime] = None
+    run_count: int = 0
+    failure_count: int = 0
+    last_duration_seconds: Optional[float] = None
+    average_duration_seconds: Optional[float] = None
+    runs: List[SchedulerRun] = []
+
+class CacheStats(BaseModel):
+    """キャッシュの統計情報スキーマ.
+
+    Attributes:
+        name (str): キャッシュ名.
+        size (int): 保持しているエントリーの数.
+        max_entries (int): 保持するエントリーの最大数.
+        ttl_seconds (float): エントリーの有効期間 (秒).
+        hits (int): ヒット数.
+        misses (int): ミス数 (期限切れを含む).
+        evictions (int): 容量超過で破棄したエントリーの数.
+        invalidations (int): 無効化の回数.
+        hit_ratio (float): ヒット率.
+    """
+    name: str
+    size: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    hit_ratio: float
@@ -0,0 +1,159 @@
+"""SQLite FTS5 による備品の全文検索.
+
+このモジュールは、``items`` テーブルの名前・管理コード・カテゴリ・付属品を対象とした
+FTS5 仮想テーブル ``items_fts`` と、それを ``items`` と同期させるトリガーを管理します.
+付属品 (JSON 配列) はトリガー内で空白区切りの文字列に展開して索引付けされます.
+
+トークナイザーには ``unicode61`` を使用します. 日本語は空白や記号で区切られた
+まとまりが 1 トークンとなるため、前方一致で検索してください.
+"""
+
+import re
+from typing import List
+
+from sqlalchemy import Integer, column, event, text
+
+from . import models
+
+FTS_TABLE = "items_fts"
+
+# bm25 の列ごとの重み (name, management_code, category, accessories)
+RANK_WEIGHTS = (10.0, 8.0, 2.0, 4.0)
+
+_ACCESSORIES_TEXT = (
+    "(SELECT group_concat(value, ' ') FROM json_each("
+    "CASE WHEN json_valid({row}.accessories) THEN {row}.accessories ELSE '[]' END))"
+)
+
+_INSERT_ROW = (
+    f"INSERT INTO {FTS_TABLE}(rowid, name, management_code, category, accessories) "
+    "VALUES ({row}.id, {row}.name, {row}.management_code, {row}.category, "
+    + _ACCESSORIES_TEXT + ");"
+)
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, management_code, category, accessories, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN "
+    + _INSERT_ROW.format(row="new")
+    + " END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_au "
+    "AFTER UPDATE OF id, name, management_code, category, accessories ON items BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+    + _INSERT_ROW.format(row="new")
+    + " END",
+]
+
+_REBUILD = (
+    f"INSERT INTO {FTS_TABLE}(rowid, name, management_code, category, accessories) "
+    "SELECT items.id, items.name, items.management_code, items.category, "
+    + _ACCESSORIES_TEXT.format(row="items")
+    + " FROM items"
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def install(connection):
+    """FTS5 仮想テーブルと同期用トリガーを作成します.
+
+    仮想テーブルが新規に作成された場合は、既存の備品から索引を構築します.
+
+    Args:
+        connection: SQLAlchemy のコネクション.
+    """
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE},
+    ).first()
+    for statement in _DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql(_REBUILD)
+
+
+def rebuild(connection):
+    """全文検索の索引を ``items`` テーブルから再構築します.
+
+    Args:
+        connection: SQLAlchemy のコネクション.
+    """
+    connection.exec_driver_sql(f"DELETE FROM {FTS_TABLE}")
+    connection.exec_driver_sql(_REBUILD)
+
+
+def ensure_search_index(engine):
+    """起動時に全文検索の索引が存在することを保証します.
+
+    Args:
+        engine: SQLAlchemy のエンジン.
+    """
+    with engine.begin() as connection:
+        install(connection)
+
+
+def build_match_query(q: str) -> str:
+    """ユーザー入力から FTS5 の MATCH 式を生成します.
+
+    入力を単語に分割し、すべての単語に前方一致する備品を検索する式を返します.
+    FTS5 の演算子はエスケープされるため、任意の文字列を安全に渡せます.
+
+    Args:
+        q (str): 検索文字列.
+
+    Returns:
+        str: MATCH 式. 検索可能な単語が含まれない場合は空文字列.
+    """
+    tokens = _TOKEN_RE.findall(q)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def matching_ids(match: str):
+    """MATCH 式に一致する備品 ID を返すテキスト SELECT を生成します.
+
+    ``models.Item.id.in_(...)`` などのサブクエリとして使用できます.
+
+    Args:
+        match (str): ``build_match_query`` で生成した MATCH 式.
+    """
+    return text(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+    ).bindparams(match=match).columns(column("rowid", Integer))
+
+
+def ranked_ids(connection, match: str, limit: int) -> List[int]:
+    """MATCH 式に一致する備品 ID を関連度順に取得します.
+
+    Args:
+        connection: SQLAlchemy のコネクションまたはセッション.
+        match (str): ``build_match_query`` で生成した MATCH 式.
+        limit (int): 取得する最大件数.
+
+    Returns:
+        list[int]: 関連度の高い順に並んだ備品 ID.
+    """
+    weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+    rows = connection.execute(
+        text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT :limit"
+        ),
+        {"match": match, "limit": limit},
+    )
+    return [row[0] for row in rows]
+
+
+@event.listens_for(models.Item.__table__, "after_create")
+def _install_after_create(target, connection, **kw):
+    """``items`` テーブル作成時に全文検索の索引も作成します."""
+    install(connection)
+
+
+@event.listens_for(models.Item.__table__, "before_drop")
+def _drop_before_drop(target, connection, **kw):
+    """``items`` テーブル削除時に全文検索の索引も削除します."""
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
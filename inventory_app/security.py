@@ -1,27 +1,112 @@
-from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 # In a real production app, use environment variables for these
 SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# アクセストークンは短命にし、期限が切れたらリフレッシュトークンで再発行する
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("INVENTORY_ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_MINUTES = int(os.environ.get("INVENTORY_REFRESH_TOKEN_EXPIRE_MINUTES", str(60 * 24 * 7)))
+
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+# bcrypt のコスト (ラウンド数). これと異なるハッシュはログイン成功時に再ハッシュされる
+# 値はホストごとに ``python benchmark_bcrypt.py`` で目標のログイン時間に合わせて決める
+BCRYPT_ROUNDS = int(os.environ.get("INVENTORY_BCRYPT_ROUNDS", "12"))
+
+# 同時に実行するパスワードのハッシュ計算・検証の最大数
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("INVENTORY_PASSWORD_HASH_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# ハッシュ計算は CPU を占有するため、同期・非同期のどの呼び出し元からも同時実行数を制限する
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_CONCURRENCY)
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="password-hash")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with _hash_slots:
+        return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """パスワードを検証し、ハッシュの設定が古い場合は新しいハッシュも返します.
+
+    Returns:
+        tuple[bool, str | None]: 検証結果と、再ハッシュが必要な場合は新しいハッシュ値.
+    """
+    with _hash_slots:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with _hash_slots:
+        return pwd_context.hash(password)
+
+async def verify_and_update_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """``verify_and_update`` をパスワード処理専用のスレッドプールで実行します.
+
+    プールのスレッド数は ``PASSWORD_HASH_CONCURRENCY`` に制限されているため、ログインが集中しても
+    イベントループと FastAPI の共有スレッドプールは占有されません.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    """``get_password_hash`` をパスワード処理専用のスレッドプールで実行します."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+def create_user_token(user, token_type: str = ACCESS_TOKEN_TYPE, expires_delta: Optional[timedelta] = None) -> str:
+    """ユーザーの ID・ロール・トークンのバージョンを含む署名付きトークンを作成します.
+
+    Args:
+        user: ``models.User`` または ``schemas.Principal``.
+        token_type (str): ``access`` または ``refresh``.
+        expires_delta (timedelta, optional): 有効期間. 省略時はトークンの種類ごとの既定値.
+
+    Returns:
+        str: JWT 文字列.
+    """
+    if expires_delta is None:
+        minutes = ACCESS_TOKEN_EXPIRE_MINUTES if token_type == ACCESS_TOKEN_TYPE else REFRESH_TOKEN_EXPIRE_MINUTES
+        expires_delta = timedelta(minutes=minutes)
+    return create_access_token(
+        {"sub": user.username, "uid": user.id, "role": user.role, "ver": user.token_version or 0, "typ": token_type},
+        expires_delta=expires_delta,
+    )
+
+def decode_user_token(token: str, token_type: str = ACCESS_TOKEN_TYPE) -> dict:
+    """``create_user_token`` で作成したトークンを検証し、クレームを返します.
+
+    Raises:
+        JWTError: 署名・有効期限が不正な場合、種類が異なる場合、または必要なクレームがない場合.
+    """
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get("typ") != token_type:
+        raise JWTError(f"Expected a {token_type} token")
+    for claim in ("sub", "uid", "role", "ver"):
+        if payload.get(claim) is None:
+            raise JWTError(f"Missing claim: {claim}")
+    return payload
@@ -0,0 +1,411 @@
+"""備品・ユーザーごとの利用統計.
+
+このモジュールは、``item_stats`` / ``user_stats`` テーブルを貸出・返却と同じ
+トランザクション内で差分更新する関数と、ログから統計を再構築する関数を提供します.
+統計の参照はログの件数に依存せず、主キーまたはインデックスのみで行われます.
+
+延滞中かどうかは時刻の経過によって変化するため統計テーブルには保持せず、
+参照時に ``items`` テーブル (``ix_items_owner_id_status``) から求めます.
+
+``item_stats`` にはすべての備品の行があります. 備品の追加・削除時にトリガーで行を作成・削除するため、
+貸出回数の少ない順の一覧も外部結合や ``coalesce`` を使わず ``ix_item_stats_borrow_count`` で取得できます.
+
+Usage:
+    python -m inventory_app.stats rebuild
+"""
+
+import argparse
+import heapq
+import sys
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, delete, event, func, insert, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import archive, models, schemas
+
+ITEM_ORDERS = ("most", "least")
+USER_SORT_FIELDS = ("borrow_count", "current_borrowed_count", "total_borrowed_days")
+
+_ITEM_STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS item_stats_ai AFTER INSERT ON items BEGIN "
+    "INSERT OR IGNORE INTO item_stats (item_id, borrow_count, total_borrowed_days) VALUES (new.id, 0, 0); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS item_stats_ad AFTER DELETE ON items BEGIN "
+    "DELETE FROM item_stats WHERE item_id = old.id; "
+    "END",
+]
+
+_SEED_ITEM_STATS = (
+    "INSERT OR IGNORE INTO item_stats (item_id, borrow_count, total_borrowed_days) SELECT id, 0, 0 FROM items"
+)
+
+
+def install(connection):
+    """備品ごとの統計行を作成・削除するトリガーを作成します.
+
+    トリガーが新規に作成された場合は、既存の備品のうち統計行がないものに 0 の行を作成します.
+
+    Args:
+        connection: SQLAlchemy のコネクション.
+    """
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'item_stats_ai'")
+    ).first()
+    for statement in _ITEM_STATS_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql(_SEED_ITEM_STATS)
+
+
+def ensure_item_stats(engine):
+    """起動時にすべての備品の統計行と同期用トリガーが存在することを保証します.
+
+    Args:
+        engine: SQLAlchemy のエンジン.
+    """
+    with engine.begin() as connection:
+        install(connection)
+
+
+def borrowed_days(start: datetime, end: datetime) -> int:
+    """貸出日と返却日を含む貸出日数を返します (同日の返却は 1 日)."""
+    return max(1, (end.date() - start.date()).days + 1)
+
+
+def _ensure_rows(db: Session, model, key: str, ids: Iterable[int]):
+    """統計行が存在しない場合に 0 で初期化した行を作成します."""
+    rows = [{key: id_} for id_ in ids]
+    if rows:
+        db.execute(sqlite_insert(model.__table__).on_conflict_do_nothing(), rows)
+
+
+def record_borrows(db: Session, user_id: int, item_ids: List[int], at: datetime):
+    """貸出を統計に反映します. 呼び出し側のトランザクション内で実行されます.
+
+    Args:
+        db (Session): データベースセッション.
+        user_id (int): 借りたユーザーのID.
+        item_ids (list[int]): 貸し出した備品のID.
+        at (datetime): 貸出日時 (ログの日時と同じ値).
+    """
+    if not item_ids:
+        return
+    items = models.ItemStats.__table__
+    _ensure_rows(db, models.ItemStats, "item_id", item_ids)
+    db.execute(
+        update(items)
+        .where(items.c.item_id.in_(item_ids))
+        .values(borrow_count=items.c.borrow_count + 1, last_borrowed_at=at, current_borrowed_at=at)
+    )
+
+    users = models.UserStats.__table__
+    _ensure_rows(db, models.UserStats, "user_id", [user_id])
+    db.execute(
+        update(users)
+        .where(users.c.user_id == user_id)
+        .values(
+            borrow_count=users.c.borrow_count + len(item_ids),
+            current_borrowed_count=users.c.current_borrowed_count + len(item_ids),
+            last_borrowed_at=at,
+        )
+    )
+
+
+def record_returns(db: Session, owners: Dict[int, Optional[int]], at: datetime):
+    """返却を統計に反映します. 呼び出し側のトランザクション内で実行されます.
+
+    貸出日数は ``item_stats.current_borrowed_at`` から求めます. 統計の作成前に
+    貸し出された備品の場合は、最後の貸出ログ (``ix_logs_item_id_created_at``) を使用します.
+
+    Args:
+        db (Session): データベースセッション.
+        owners (dict[int, int | None]): 返却した備品のIDと返却前の借用者のID.
+        at (datetime): 返却日時 (ログの日時と同じ値).
+    """
+    if not owners:
+        return
+    items = models.ItemStats.__table__
+    started = dict(db.execute(
+        select(items.c.item_id, items.c.current_borrowed_at)
+        .where(items.c.item_id.in_(list(owners)), items.c.current_borrowed_at.isnot(None))
+    ).all())
+    missing = [item_id for item_id in owners if item_id not in started]
+    if missing:
+        log = models.Log
+        started.update(db.execute(
+            select(log.item_id, func.max(log.created_at))
+            .where(log.item_id.in_(missing), log.action == models.LogAction.borrow.value)
+            .group_by(log.item_id)
+        ).all())
+    days = {item_id: borrowed_days(started[item_id], at) if started.get(item_id) else 1 for item_id in owners}
+
+    _ensure_rows(db, models.ItemStats, "item_id", owners)
+    db.execute(
+        update(items)
+        .where(items.c.item_id == bindparam("b_item_id"))
+        .values(total_borrowed_days=items.c.total_borrowed_days + bindparam("b_days"), current_borrowed_at=None),
+        [{"b_item_id": item_id, "b_days": value} for item_id, value in days.items()],
+    )
+
+    per_user: Dict[int, List[int]] = {}
+    for item_id, owner_id in owners.items():
+        if owner_id is not None:
+            per_user.setdefault(owner_id, []).append(days[item_id])
+    if not per_user:
+        return
+    users = models.UserStats.__table__
+    _ensure_rows(db, models.UserStats, "user_id", per_user)
+    db.execute(
+        update(users)
+        .where(users.c.user_id == bindparam("b_user_id"))
+        .values(
+            total_borrowed_days=users.c.total_borrowed_days + bindparam("b_days"),
+            current_borrowed_count=func.max(users.c.current_borrowed_count - bindparam("b_count"), 0),
+        ),
+        [{"b_user_id": user_id, "b_days": sum(values), "b_count": len(values)} for user_id, values in per_user.items()],
+    )
+
+
+def rebuild(db: Session, archive_dir: Optional[str] = None, batch_size: int = 1000) -> schemas.StatsRebuildReport:
+    """アーカイブ済みのログを含むすべてのログから統計を再構築します.
+
+    ログは ID 順にストリーミングで読み込まれ、メモリ使用量は備品数とユーザー数に比例します.
+    現在の貸出数は ``items`` テーブルの状態から求めます.
+
+    Args:
+        db (Session): データベースセッション.
+        archive_dir (str, optional): アーカイブの格納先. 省略時は ``archive.ARCHIVE_DIR``.
+        batch_size (int): ログを一度に読み込む件数.
+
+    Returns:
+        schemas.StatsRebuildReport: 読み込んだログの件数と作成した統計の件数.
+    """
+    log_table = models.Log.__table__
+    columns = [log_table.c.id, log_table.c.item_id, log_table.c.user_id, log_table.c.action, log_table.c.created_at]
+    sources = []
+    connections = []
+    for _, path in reversed(archive.list_archives(archive_dir)):
+        connection = archive.archive_engine(path).connect()
+        connections.append(connection)
+        table = archive.archived_logs
+        sources.append(connection.execute(
+            select(*(table.c[c.name] for c in columns)).order_by(table.c.id).execution_options(yield_per=batch_size)
+        ))
+    sources.append(db.execute(select(*columns).order_by(log_table.c.id).execution_options(yield_per=batch_size)))
+
+    item_state: Dict[int, dict] = {}
+    user_state: Dict[int, dict] = {}
+    open_borrows: Dict[int, tuple] = {}
+    scanned = 0
+    try:
+        for row in heapq.merge(*sources, key=lambda r: r.id):
+            scanned += 1
+            if row.item_id is None or row.created_at is None:
+                continue
+            item = item_state.setdefault(row.item_id, _empty_stats())
+            if row.action == models.LogAction.borrow.value:
+                item["borrow_count"] += 1
+                item["last_borrowed_at"] = row.created_at
+                open_borrows[row.item_id] = (row.created_at, row.user_id)
+                if row.user_id is not None:
+                    user = user_state.setdefault(row.user_id, _empty_stats())
+                    user["borrow_count"] += 1
+                    user["last_borrowed_at"] = row.created_at
+            elif row.action == models.LogAction.return_.value and row.item_id in open_borrows:
+                started_at, user_id = open_borrows.pop(row.item_id)
+                days = borrowed_days(started_at, row.created_at)
+                item["total_borrowed_days"] += days
+                if user_id is not None:
+                    user_state.setdefault(user_id, _empty_stats())["total_borrowed_days"] += days
+    finally:
+        for connection in connections:
+            connection.close()
+
+    borrowed = db.execute(
+        select(models.Item.id, models.Item.owner_id).where(models.Item.status == models.ItemStatus.borrowed.value)
+    ).all()
+    current_counts: Dict[int, int] = {}
+    for item_id, owner_id in borrowed:
+        if item_id in open_borrows:
+            item_state.setdefault(item_id, _empty_stats())["current_borrowed_at"] = open_borrows[item_id][0]
+        if owner_id is not None:
+            current_counts[owner_id] = current_counts.get(owner_id, 0) + 1
+
+    db.execute(delete(models.ItemStats))
+    db.execute(delete(models.UserStats))
+    if item_state:
+        db.execute(insert(models.ItemStats), [
+            {"item_id": item_id, "current_borrowed_at": None, **values} for item_id, values in item_state.items()
+        ])
+    # 貸出ログのない備品にも 0 の統計行を作成する
+    db.execute(text(_SEED_ITEM_STATS))
+    for user_id in current_counts:
+        user_state.setdefault(user_id, _empty_stats())
+    if user_state:
+        db.execute(insert(models.UserStats), [
+            {
+                "user_id": user_id,
+                "borrow_count": values["borrow_count"],
+                "total_borrowed_days": values["total_borrowed_days"],
+                "last_borrowed_at": values["last_borrowed_at"],
+                "current_borrowed_count": current_counts.get(user_id, 0),
+            }
+            for user_id, values in user_state.items()
+        ])
+    db.commit()
+    return schemas.StatsRebuildReport(logs=scanned, items=len(item_state), users=len(user_state))
+
+
+def _empty_stats() -> dict:
+    return {"borrow_count": 0, "total_borrowed_days": 0, "last_borrowed_at": None}
+
+
+def _item_stats_query():
+    item, item_stats = models.Item, models.ItemStats
+    return select(
+        item_stats.item_id, item.name, item.management_code, item.status, item.due_date,
+        item_stats.borrow_count, item_stats.total_borrowed_days,
+        item_stats.last_borrowed_at, item_stats.current_borrowed_at,
+    ).select_from(item_stats).join(item, item.id == item_stats.item_id)
+
+
+def _item_response(row, today: date) -> schemas.ItemStatsResponse:
+    overdue = row.status == models.ItemStatus.borrowed.value and row.due_date is not None and row.due_date < today
+    return schemas.ItemStatsResponse(
+        item_id=row.item_id,
+        name=row.name,
+        management_code=row.management_code,
+        borrow_count=row.borrow_count,
+        total_borrowed_days=row.total_borrowed_days,
+        last_borrowed_at=row.last_borrowed_at,
+        current_borrowed_at=row.current_borrowed_at,
+        currently_overdue=overdue,
+    )
+
+
+def get_item_stats(db: Session, item_id: int, today: Optional[date] = None) -> Optional[schemas.ItemStatsResponse]:
+    """備品の利用統計を取得します.
+
+    Returns:
+        schemas.ItemStatsResponse: 利用統計. 備品が見つからない場合は None.
+    """
+    row = db.execute(_item_stats_query().where(models.ItemStats.item_id == item_id)).first()
+    if row is None:
+        return None
+    return _item_response(row, today or date.today())
+
+
+def list_item_stats(db: Session, order: str = "most", limit: int = 20,
+                    today: Optional[date] = None) -> List[schemas.ItemStatsResponse]:
+    """貸出回数の多い順 (``most``) または少ない順 (``least``) に備品の利用統計を取得します.
+
+    ``least`` では一度も貸し出されていない備品が先頭に並びます. どちらも ``ix_item_stats_borrow_count``
+    を順に読むため、備品の数に関係なく ``limit`` 件分の行だけを参照します.
+    """
+    if order not in ITEM_ORDERS:
+        raise ValueError(f"Unsupported order: {order}")
+    borrow_count, item_id = models.ItemStats.borrow_count, models.ItemStats.item_id
+    if order == "most":
+        stmt = _item_stats_query().where(borrow_count > 0).order_by(borrow_count.desc(), item_id)
+    else:
+        stmt = _item_stats_query().order_by(borrow_count, item_id)
+    today = today or date.today()
+    return [_item_response(row, today) for row in db.execute(stmt.limit(limit))]
+
+
+def _overdue_counts(db: Session, user_ids: List[int], today: date) -> Dict[int, int]:
+    item = models.Item
+    return dict(db.execute(
+        select(item.owner_id, func.count(item.id))
+        .where(
+            item.owner_id.in_(user_ids),
+            item.status == models.ItemStatus.borrowed.value,
+            item.due_date < today,
+        )
+        .group_by(item.owner_id)
+    ).all())
+
+
+def _user_stats_query():
+    user, user_stats = models.User, models.UserStats
+    return select(
+        user.id.label("user_id"), user.username, user.display_name,
+        func.coalesce(user_stats.borrow_count, 0).label("borrow_count"),
+        func.coalesce(user_stats.total_borrowed_days, 0).label("total_borrowed_days"),
+        user_stats.last_borrowed_at,
+        func.coalesce(user_stats.current_borrowed_count, 0).label("current_borrowed_count"),
+    ).outerjoin(user_stats, user_stats.user_id == user.id)
+
+
+def _user_responses(db: Session, rows, today: date) -> List[schemas.UserStatsResponse]:
+    rows = list(rows)
+    overdue = _overdue_counts(db, [row.user_id for row in rows], today) if rows else {}
+    return [
+        schemas.UserStatsResponse(**row._mapping, currently_overdue_count=overdue.get(row.user_id, 0))
+        for row in rows
+    ]
+
+
+def get_user_stats(db: Session, user_id: int, today: Optional[date] = None) -> Optional[schemas.UserStatsResponse]:
+    """ユーザーの利用統計を取得します.
+
+    Returns:
+        schemas.UserStatsResponse: 利用統計. ユーザーが見つからない場合は None.
+    """
+    rows = db.execute(_user_stats_query().where(models.User.id == user_id)).all()
+    if not rows:
+        return None
+    return _user_responses(db, rows, today or date.today())[0]
+
+
+def list_user_stats(db: Session, sort: str = "current_borrowed_count", limit: int = 20,
+                    today: Optional[date] = None) -> List[schemas.UserStatsResponse]:
+    """指定した項目の多い順にユーザーの利用統計を取得します.
+
+    Args:
+        sort (str): ``borrow_count``、``current_borrowed_count`` または ``total_borrowed_days``.
+    """
+    if sort not in USER_SORT_FIELDS:
+        raise ValueError(f"Unsupported sort field: {sort}")
+    column = getattr(models.UserStats, sort)
+    stmt = (
+        _user_stats_query()
+        .where(column > 0)
+        .order_by(column.desc(), models.User.id)
+        .limit(limit)
+    )
+    return _user_responses(db, db.execute(stmt), today or date.today())
+
+
+@event.listens_for(models.ItemStats.__table__, "after_create")
+def _install_after_create(target, connection, **kw):
+    """``item_stats`` テーブル作成時に同期用トリガーも作成します."""
+    install(connection)
+
+
+def main(argv=None):
+    """コマンドラインから統計を再構築します."""
+    parser = argparse.ArgumentParser(description="備品とユーザーの利用統計を管理します.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="ログから統計を再構築します.")
+    rebuild_parser.add_argument("--archive-dir", default=None, help="アーカイブの格納先ディレクトリ.")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        report = rebuild(db, archive_dir=args.archive_dir)
+    finally:
+        db.close()
+    print(report.model_dump_json(indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
@@ -1,23 +1,36 @@
+import os
+import tempfile
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from inventory_app.main import app
-from inventory_app.database import Base, get_db
-from inventory_app import models
+from inventory_app.database import Base, get_async_db, get_db
+from inventory_app import cache, models
 from inventory_app.security import get_password_hash
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# The sync and async engines must see the same database, so use a temporary file
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs each test on a new event loop, so async connections must not be pooled
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+@event.listens_for(engine, "connect")
+def _fast_test_pragmas(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA synchronous=OFF")
+
 def override_get_db():
     try:
         db = TestingSessionLocal()
@@ -25,15 +38,25 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 
 @pytest.fixture(scope="function")
 def client():
     Base.metadata.create_all(bind=engine)
+    cache.clear_all()
     with TestClient(app) as c:
         yield c
     Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture
+def session_factory(client):
+    return TestingSessionLocal
+
 @pytest.fixture
 def admin_token_headers(client):
     db = TestingSessionLocal()
@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+
+from inventory_app import archive, models
+
+
+def _add_logs(session_factory, created):
+    db = session_factory()
+    user = models.User(username="archiver", hashed_password="x", display_name="Archiver")
+    item = models.Item(name="Old PC", management_code="OLD-001")
+    db.add_all([user, item])
+    db.flush()
+    db.add_all(
+        models.Log(item_id=item.id, user_id=user.id, action="borrow", created_at=created_at)
+        for created_at in created
+    )
+    db.commit()
+    ids = item.id, user.id
+    db.close()
+    return ids
+
+
+def test_retention_cutoff():
+    assert archive.retention_cutoff(12, now=datetime(2026, 3, 31, 9)) == datetime(2025, 3, 31, 9)
+    assert archive.retention_cutoff(1, now=datetime(2026, 3, 31)) == datetime(2026, 2, 28)
+    assert archive.retention_cutoff(3, now=datetime(2026, 1, 15)) == datetime(2025, 10, 15)
+
+
+def test_archive_moves_old_logs_in_chunks(session_factory, tmp_path):
+    created = [datetime(2023, 5, 1), datetime(2023, 12, 31), datetime(2024, 6, 1), datetime(2099, 1, 1)]
+    _add_logs(session_factory, created)
+
+    db = session_factory()
+    report = archive.archive_logs(db, datetime(2025, 1, 1), chunk_size=2, archive_dir=str(tmp_path))
+    assert (report.archived, report.chunks, report.years) == (3, 2, {2023: 2, 2024: 1})
+    assert [log.created_at for log in db.query(models.Log)] == [datetime(2099, 1, 1)]
+
+    # 再実行しても重複しない
+    assert archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path)).archived == 0
+    db.close()
+    assert [year for year, _ in archive.list_archives(str(tmp_path))] == [2024, 2023]
+
+
+def test_history_api_merges_archives(client, admin_token_headers, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    created = [datetime(2022, 1, 1), datetime(2023, 1, 1), datetime(2024, 1, 1), datetime(2099, 1, 1), datetime(2099, 2, 1)]
+    item_id, _ = _add_logs(session_factory, created)
+    db = session_factory()
+    archive.archive_logs(db, datetime(2025, 1, 1))
+    db.close()
+
+    response = client.get("/api/v1/logs/history", params={"limit": 3, "item_id": item_id}, headers=admin_token_headers)
+    assert response.status_code == 200
+    first = response.json()
+    assert [entry["archived"] for entry in first] == [False, False, True]
+    assert first[2]["created_at"].startswith("2024")
+
+    response = client.get("/api/v1/logs/history", params={"limit": 3, "item_id": item_id, "cursor": response.headers["X-Next-Cursor"]},
+                          headers=admin_token_headers)
+    second = response.json()
+    assert [entry["created_at"][:4] for entry in second] == ["2023", "2022"]
+    assert "X-Next-Cursor" not in response.headers
+
+    assert client.get("/api/v1/logs/", headers=admin_token_headers).headers["X-Total-Count"] == "2"
+
+
+def test_archive_again_after_new_logs(session_factory, tmp_path):
+    old = datetime(2023, 5, 1)
+    item_id, user_id = _add_logs(session_factory, [old, old])
+    db = session_factory()
+    assert archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path)).archived == 2
+    assert db.query(models.Log).count() == 0
+
+    # ids are not reused once the live table is empty, so the new logs reach the archive too
+    db.add_all(models.Log(item_id=item_id, user_id=user_id, action="return", created_at=old) for _ in range(2))
+    db.commit()
+    assert archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path)).archived == 2
+    rows, _ = archive.history_page(db, archive_dir=str(tmp_path))
+    db.close()
+    assert [row["action"] for row in rows] == ["return", "return", "borrow", "borrow"]
+    assert len({row["id"] for row in rows}) == 4
+
+
+def test_archive_refuses_conflicting_ids(session_factory, tmp_path):
+    item_id, user_id = _add_logs(session_factory, [datetime(2023, 5, 1)])
+    db = session_factory()
+    archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path))
+    [archived] = archive.history_page(db, archive_dir=str(tmp_path))[0]
+    # a log that reused an archived id before ids were AUTOINCREMENT
+    db.add(models.Log(id=archived["id"], item_id=item_id, user_id=user_id, action="return", created_at=datetime(2023, 6, 1)))
+    db.commit()
+
+    with pytest.raises(archive.ArchiveConflictError):
+        archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path))
+    assert db.query(models.Log).count() == 1
+    db.close()
+
+
+def test_archive_reserves_archived_ids(session_factory, tmp_path):
+    from sqlalchemy import text
+
+    item_id, user_id = _add_logs(session_factory, [datetime(2023, 5, 1)] * 3)
+    db = session_factory()
+    archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path))
+    # a database migrated to AUTOINCREMENT after its ids had been reused starts the sequence low
+    db.execute(text("DELETE FROM sqlite_sequence WHERE name = 'logs'"))
+    db.commit()
+
+    archive.archive_logs(db, datetime(2025, 1, 1), archive_dir=str(tmp_path))
+    log = models.Log(item_id=item_id, user_id=user_id, action="borrow")
+    db.add(log)
+    db.commit()
+    archived_ids = [row["id"] for row in archive.history_page(db, archive_dir=str(tmp_path))[0] if row["archived"]]
+    assert log.id > max(archived_ids)
+    db.close()
@@ -11,3 +11,205 @@ def test_login_fail(client):
 def test_protected_route(client):
     response = client.get("/api/v1/users/me")
     assert response.status_code == 401
+
+def test_login_does_not_block_event_loop(client, user_token_headers):
+    import asyncio
+    import time
+
+    import httpx
+
+    from inventory_app.main import app
+
+    async def scenario():
+        gaps = []
+        done = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            task = asyncio.create_task(ticker())
+            started = time.perf_counter()
+            responses = await asyncio.gather(
+                *[ac.post("/token", data={"username": "user", "password": "user"}) for _ in range(4)]
+            )
+            elapsed = time.perf_counter() - started
+            done.set()
+            await task
+        assert all(r.status_code == 200 for r in responses)
+        return max(gaps), elapsed
+
+    max_gap, elapsed = asyncio.run(scenario())
+    # bcrypt runs off the loop, so the ticker keeps running while logins are verified
+    assert max_gap < elapsed / 2
+
+def test_principal_cache_skips_user_lookups(client, user_token_headers):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from inventory_app import cache
+
+    cache.principal_cache.clear()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", capture)
+    try:
+        for _ in range(5):
+            assert client.get("/api/v1/items/", headers=user_token_headers).status_code == 200
+    finally:
+        event.remove(Engine, "before_cursor_execute", capture)
+    stats = cache.principal_cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (4, 1, 1)
+    assert len(statements) == 1
+
+def test_principal_cache_invalidated_when_user_changes(client, user_token_headers, admin_token_headers, session_factory):
+    from inventory_app import models
+
+    assert client.get("/api/v1/items/", headers=user_token_headers).status_code == 200
+    db = session_factory()
+    db.query(models.User).filter_by(username="user").one().is_active = False
+    db.commit()
+    db.close()
+    # deactivation bumps the token version, so the outstanding token is revoked
+    assert client.get("/api/v1/items/", headers=user_token_headers).status_code == 401
+
+    response = client.get("/api/v1/system/caches", headers=admin_token_headers)
+    assert response.status_code == 200
+    [stats] = response.json()
+    assert stats["name"] == "principals" and stats["invalidations"] >= 1
+
+def test_access_token_carries_role_claims(client, admin_token_headers):
+    from inventory_app import security
+
+    response = client.post("/token", data={"username": "admin", "password": "admin"})
+    body = response.json()
+    assert body["expires_in"] == security.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    claims = security.decode_user_token(body["access_token"])
+    assert (claims["sub"], claims["role"], claims["ver"]) == ("admin", "admin", 0)
+    assert isinstance(claims["uid"], int)
+
+def test_admin_check_uses_cached_principal(client, admin_token_headers):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from inventory_app import cache
+
+    cache.principal_cache.clear()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", capture)
+    try:
+        for _ in range(3):
+            assert client.get("/api/v1/system/caches", headers=admin_token_headers).status_code == 200
+    finally:
+        event.remove(Engine, "before_cursor_execute", capture)
+    assert len(statements) == 1
+
+def test_role_change_revokes_tokens(client, user_token_headers, session_factory):
+    from inventory_app import models
+
+    assert client.get("/api/v1/users/me", headers=user_token_headers).status_code == 200
+    refresh_token = client.post("/token", data={"username": "user", "password": "user"}).json()["refresh_token"]
+    db = session_factory()
+    user = db.query(models.User).filter_by(username="user").one()
+    user.role = models.Role.admin.value
+    db.commit()
+    assert user.token_version == 1
+    db.close()
+    assert client.get("/api/v1/users/me", headers=user_token_headers).status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+    response = client.post("/token", data={"username": "user", "password": "user"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/v1/system/caches", headers=headers).status_code == 200
+
+def test_refresh_token_issues_new_access_token(client, user_token_headers):
+    tokens = client.post("/token", data={"username": "user", "password": "user"}).json()
+    # a refresh token is not accepted as an access token, nor the other way round
+    headers = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": tokens["access_token"]})
+    assert response.status_code == 401
+
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/v1/users/me", headers=headers).json()["username"] == "user"
+
+def test_principal_cache_lru_and_ttl(monkeypatch):
+    from inventory_app import cache
+
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    principals = cache.PrincipalCache("test", ttl=10, max_entries=2)
+    principals.put("a", 1)
+    principals.put("b", 2)
+    assert principals.get("a") == 1
+    principals.put("c", 3)
+    assert principals.get("b") is None
+    assert principals.evictions == 1
+    now[0] += 11
+    assert principals.get("a") is None
+    generation = principals.generation
+    principals.invalidate("c")
+    principals.put("c", 3, generation)
+    assert principals.get("c") is None
+
+def test_login_rehashes_outdated_password_hash(client, session_factory):
+    from passlib.context import CryptContext
+
+    from inventory_app import models, security
+
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("legacy")
+    db = session_factory()
+    db.add(models.User(username="legacy", hashed_password=old_hash, display_name="Legacy"))
+    db.commit()
+
+    response = client.post("/token", data={"username": "legacy", "password": "legacy"})
+    assert response.status_code == 200
+    db.expire_all()
+    new_hash = db.query(models.User).filter_by(username="legacy").one().hashed_password
+    db.close()
+    assert new_hash != old_hash
+    assert new_hash.startswith(f"$2b${security.BCRYPT_ROUNDS:02d}$")
+    assert client.post("/token", data={"username": "legacy", "password": "legacy"}).status_code == 200
+
+def test_password_hashing_concurrency_is_capped(monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from inventory_app import security
+
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_hash(password):
+        with lock:
+            active.append(password)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.remove(password)
+        return password
+
+    monkeypatch.setattr(security.pwd_context, "hash", slow_hash)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(security.get_password_hash, [str(i) for i in range(16)])) == [str(i) for i in range(16)]
+    assert max(peak) <= security.PASSWORD_HASH_CONCURRENCY
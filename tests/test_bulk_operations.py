@@ -0,0 +1,100 @@
+from inventory_app import models
+
+
+def _create_items(client, headers, count):
+    ids = []
+    for i in range(count):
+        response = client.post("/api/v1/items/", json={"name": f"Bulk {i}", "management_code": f"BLK-{i:03d}"}, headers=headers)
+        ids.append(response.json()["id"])
+    return ids
+
+
+def test_bulk_borrow_and_return(client, admin_token_headers, user_token_headers):
+    ids = _create_items(client, admin_token_headers, 3)
+
+    response = client.post("/api/v1/items/bulk/borrow", json={
+        "username": "user",
+        "due_date": "2099-01-01",
+        "item_ids": ids[:2],
+        "management_codes": ["BLK-002"],
+    }, headers=admin_token_headers)
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 3
+
+    items = client.get("/api/v1/items/", headers=admin_token_headers).json()
+    assert {i["status"] for i in items} == {"borrowed"}
+    logs = client.get("/api/v1/logs/", headers=admin_token_headers)
+    assert logs.headers["X-Total-Count"] == "3"
+
+    response = client.post("/api/v1/items/bulk/return", json={"management_codes": ["BLK-000", "BLK-001", "BLK-002"]}, headers=admin_token_headers)
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 3
+    logs = client.get("/api/v1/logs/", headers=admin_token_headers).json()
+    user_id = client.get("/api/v1/users/me", headers=user_token_headers).json()["id"]
+    assert [log["user_id"] for log in logs if log["action"] == "return"] == [user_id] * 3
+
+
+def test_bulk_borrow_all_or_nothing_rolls_back(client, admin_token_headers):
+    ids = _create_items(client, admin_token_headers, 2)
+    client.post(f"/api/v1/items/{ids[0]}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+
+    response = client.post("/api/v1/items/bulk/borrow", json={
+        "username": "admin", "due_date": "2099-01-01", "item_ids": [ids[0], ids[1], 9999],
+    }, headers=admin_token_headers)
+    assert response.status_code == 409
+    errors = {r["key"]: r["error"] for r in response.json()["detail"]["results"]}
+    assert errors == {str(ids[0]): "Item is not available", str(ids[1]): "Rolled back", "9999": "Item not found"}
+    statuses = {i["id"]: i["status"] for i in client.get("/api/v1/items/", headers=admin_token_headers).json()}
+    assert statuses[ids[1]] == "available"
+
+
+def test_bulk_borrow_best_effort(client, admin_token_headers):
+    ids = _create_items(client, admin_token_headers, 2)
+    client.post(f"/api/v1/items/{ids[0]}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+
+    response = client.post("/api/v1/items/bulk/borrow", json={
+        "username": "admin", "due_date": "2099-01-01", "item_ids": ids, "mode": "best_effort",
+    }, headers=admin_token_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["succeeded"], data["failed"]) == (1, 1)
+
+
+def test_bulk_return_rejects_items_without_borrower(client, admin_token_headers, session_factory):
+    ids = _create_items(client, admin_token_headers, 2)
+    client.post(f"/api/v1/items/{ids[0]}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+    db = session_factory()
+    db.get(models.Item, ids[1]).status = models.ItemStatus.borrowed.value
+    db.commit()
+    db.close()
+
+    response = client.post("/api/v1/items/bulk/return", json={"item_ids": ids, "mode": "best_effort"}, headers=admin_token_headers)
+    assert response.status_code == 200
+    errors = {r["key"]: r["error"] for r in response.json()["results"] if r["error"]}
+    assert errors == {str(ids[1]): "Item has no borrower"}
+    returns = [log for log in client.get("/api/v1/logs/", headers=admin_token_headers).json() if log["action"] == "return"]
+    assert [log["item_id"] for log in returns] == [ids[0]]
+
+
+def test_bulk_return_logs_the_borrower_at_return_time(client, admin_token_headers, user_token_headers, monkeypatch):
+    from sqlalchemy import update
+
+    from inventory_app import crud
+
+    ids = _create_items(client, admin_token_headers, 1)
+    client.post(f"/api/v1/items/{ids[0]}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+    user_id = client.get("/api/v1/users/me", headers=user_token_headers).json()["id"]
+    resolve = crud._resolve_bulk_items
+
+    def returned_and_reborrowed_after_resolving(db, selection):
+        resolved = resolve(db, selection)
+        # 対象の解決後、返却前に別のユーザーが返却・再貸出した
+        db.execute(update(models.Item).where(models.Item.id == ids[0]).values(owner_id=user_id)
+                   .execution_options(synchronize_session=False))
+        return resolved
+
+    monkeypatch.setattr(crud, "_resolve_bulk_items", returned_and_reborrowed_after_resolving)
+    response = client.post("/api/v1/items/bulk/return", json={"item_ids": ids}, headers=admin_token_headers)
+    assert response.json()["succeeded"] == 1
+    returns = [log for log in client.get("/api/v1/logs/", headers=admin_token_headers).json() if log["action"] == "return"]
+    assert [log["user_id"] for log in returns] == [user_id]
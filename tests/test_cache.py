@@ -0,0 +1,79 @@
+import threading
+import time
+
+from inventory_app import cache, models
+from inventory_app.cache import SnapshotCache
+
+
+def test_status_reflects_borrow_immediately(client, admin_token_headers):
+    client.post("/api/v1/items/", json={"name": "Cached", "management_code": "C-001"}, headers=admin_token_headers)
+    first = client.get("/api/v1/items/status").json()
+    assert first[0]["status"] == "available"
+
+    client.post(f"/api/v1/items/{first[0]['id']}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+    second = client.get("/api/v1/items/status").json()
+    assert second[0]["status"] == "borrowed"
+    assert second[0]["owner_name"] == "Admin User"
+
+
+def test_orm_changes_bump_versions(session_factory):
+    db = session_factory()
+    try:
+        before = cache.get_versions(db, ("items", "users"))
+        db.add(models.Item(name="V", management_code="V-001"))
+        db.commit()
+        after = cache.get_versions(db, ("items", "users"))
+    finally:
+        db.close()
+    assert after[0] == before[0] + 1
+    assert after[1] == before[1]
+
+
+def test_concurrent_misses_are_coalesced(session_factory):
+    snapshot = SnapshotCache(("items",), poll_interval=60)
+    builds = []
+
+    def build(db):
+        builds.append(1)
+        time.sleep(0.05)
+        return b"[]"
+
+    def worker():
+        db = session_factory()
+        try:
+            snapshot.get(db, build)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(builds) == 1
+
+
+def test_status_etag_not_modified(client, admin_token_headers):
+    client.post("/api/v1/items/", json={"name": "Tagged", "management_code": "T-001"}, headers=admin_token_headers)
+    response = client.get("/api/v1/items/status")
+    etag = response.headers["ETag"]
+
+    response = client.get("/api/v1/items/status", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.post("/api/v1/items/", json={"name": "Tagged2", "management_code": "T-002"}, headers=admin_token_headers)
+    response = client.get("/api/v1/items/status", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_list_endpoints_etag(client, admin_token_headers):
+    response = client.get("/api/v1/users/")
+    etag = response.headers["ETag"]
+    assert client.get("/api/v1/users/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/v1/users/?limit=1", headers={"If-None-Match": etag}).status_code == 200
+
+    response = client.get("/api/v1/items/", headers=admin_token_headers)
+    headers = {**admin_token_headers, "If-None-Match": response.headers["ETag"]}
+    assert client.get("/api/v1/items/", headers=headers).status_code == 304
@@ -0,0 +1,87 @@
+import datetime
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory_app import crud, models
+
+ITEM_COUNT = 10
+ATTEMPTS = int(os.environ.get("INVENTORY_STRESS_ATTEMPTS", "2000"))
+THREADS = 16
+
+
+def _setup(session_factory):
+    db = session_factory()
+    users = [models.User(username=f"stress{i}", hashed_password="x", display_name=f"Stress {i}") for i in range(4)]
+    items = [models.Item(name=f"Stress {i}", management_code=f"STR-{i:03d}") for i in range(ITEM_COUNT)]
+    db.add_all(users + items)
+    db.commit()
+    ids = ([u.id for u in users], [i.id for i in items])
+    db.close()
+    return ids
+
+
+def _hammer(session_factory, attempts, operation):
+    """``operation`` を複数スレッドから同時に実行し、備品ごとの成功数と競合数を返します."""
+    barrier = threading.Barrier(THREADS)
+
+    def worker(indexes):
+        barrier.wait()
+        wins, conflicts = [], 0
+        for index in indexes:
+            db = session_factory()
+            try:
+                item = operation(db, index)
+                if item is not None:
+                    wins.append(item.id)
+            except crud.ItemStateConflictError:
+                conflicts += 1
+            finally:
+                db.close()
+        return wins, conflicts
+
+    chunks = [range(t, attempts, THREADS) for t in range(THREADS)]
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = list(pool.map(worker, chunks))
+    wins = Counter(item_id for item_ids, _ in results for item_id in item_ids)
+    return wins, sum(conflicts for _, conflicts in results)
+
+
+def test_concurrent_borrows_have_one_winner_per_item(session_factory):
+    user_ids, item_ids = _setup(session_factory)
+    due = datetime.date.today() + datetime.timedelta(days=7)
+
+    def borrow(db, index):
+        return crud.borrow_item(db, item_ids[index % len(item_ids)], user_ids[index % len(user_ids)], due)
+
+    winners, conflicts = _hammer(session_factory, ATTEMPTS, borrow)
+    assert winners == Counter({item_id: 1 for item_id in item_ids})
+    assert conflicts == ATTEMPTS - len(item_ids)
+
+    db = session_factory()
+    logs = db.query(models.Log).filter(models.Log.action == models.LogAction.borrow.value).all()
+    items = db.query(models.Item).all()
+    db.close()
+    assert sorted(log.item_id for log in logs) == sorted(item_ids)
+    # ログの借用者と備品の借用者が一致する (敗者の書き込みが混ざっていない)
+    owners = {item.id: item.owner_id for item in items}
+    assert all(owners[log.item_id] == log.user_id for log in logs)
+
+    def give_back(db, index):
+        return crud.return_item(db, item_ids[index % len(item_ids)], force=True)
+
+    winners, conflicts = _hammer(session_factory, ATTEMPTS // 4, give_back)
+    assert winners == Counter({item_id: 1 for item_id in item_ids})
+
+    db = session_factory()
+    returns = db.query(models.Log).filter(models.Log.action == models.LogAction.return_.value).all()
+    db.close()
+    assert sorted((log.item_id, log.user_id) for log in returns) == sorted(owners.items())
+
+
+def test_return_of_available_item_conflicts(client, admin_token_headers):
+    item_id = client.post("/api/v1/items/", json={"name": "Idle", "management_code": "IDLE-1"}, headers=admin_token_headers).json()["id"]
+    response = client.post(f"/api/v1/items/{item_id}/return")
+    assert response.status_code == 409
+    assert client.post("/api/v1/items/9999/return").status_code == 404
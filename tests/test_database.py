@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from inventory_app import database
+
+
+def test_profile_from_env():
+    profile = database.EngineProfile.from_env({
+        "INVENTORY_SQLITE_JOURNAL_MODE": "DELETE",
+        "INVENTORY_SQLITE_BUSY_TIMEOUT_MS": "250",
+        "INVENTORY_DB_POOL_TIMEOUT": "1.5",
+    })
+    assert profile.journal_mode == "DELETE"
+    assert profile.busy_timeout_ms == 250
+    assert profile.pool_timeout == 1.5
+    assert profile.synchronous == database.EngineProfile().synchronous
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///./inventory.db", "sqlite+aiosqlite:///./inventory.db"),
+    ("sqlite:////var/data/sqlite://inventory.db", "sqlite+aiosqlite:////var/data/sqlite://inventory.db"),
+    ("sqlite+pysqlite:///:memory:", "sqlite+aiosqlite:///:memory:"),
+    ("postgresql://app:secret@db/inventory", None),
+])
+def test_async_database_url(url, expected):
+    async_url = database.async_database_url(url)
+    if expected is None:
+        assert async_url is None
+    else:
+        assert (async_url.drivername, async_url.database) == ("sqlite+aiosqlite", make_url(expected).database)
+
+
+def test_engine_options_are_sqlite_specific():
+    profile = database.EngineProfile()
+    assert "connect_args" in profile.engine_options("sqlite:///./inventory.db")
+    assert "pool_size" not in profile.engine_options("sqlite://")
+    options = profile.engine_options("postgresql://app:secret@db/inventory")
+    assert "connect_args" not in options
+    assert options["pool_size"] == profile.pool_size
+
+
+def test_pragmas_are_applied_only_to_sqlite():
+    from sqlalchemy import create_mock_engine
+
+    engine = create_mock_engine("postgresql://", executor=None)
+    database.apply_profile(engine, database.EngineProfile())  # no listener, no error
+    sqlite_engine = database.create_profiled_engine("sqlite://", database.EngineProfile())
+    with sqlite_engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+    sqlite_engine.dispose()
+
+
+def test_profiled_engine_applies_pragmas():
+    path = os.path.join(tempfile.mkdtemp(), "profile.db")
+    profile = database.EngineProfile(busy_timeout_ms=1234, cache_size=-1024, mmap_size=1 << 20)
+    engine = database.create_profiled_engine(f"sqlite:///{path}", profile)
+    with engine.connect() as connection:
+        pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1  # NORMAL
+        assert pragma("busy_timeout") == 1234
+        assert pragma("cache_size") == -1024
+        assert pragma("temp_store") == 2  # MEMORY
+    assert engine.pool.size() == profile.pool_size
+    engine.dispose()
+
+
+class _FakeSession:
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _locked():
+    return OperationalError("UPDATE items", {}, sqlite3.OperationalError("database is locked"))
+
+
+def test_retry_on_locked_retries_lock_errors(monkeypatch):
+    monkeypatch.setattr(database, "RETRY_BASE_DELAY", 0)
+    calls = []
+
+    @database.retry_on_locked
+    def write(db):
+        calls.append(db)
+        if len(calls) < 3:
+            raise _locked()
+        return "done"
+
+    db = _FakeSession()
+    assert write(db) == "done"
+    assert len(calls) == 3
+    assert db.rollbacks == 2
+
+
+def test_retry_on_locked_gives_up(monkeypatch):
+    monkeypatch.setattr(database, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(database, "WRITE_RETRIES", 2)
+    calls = []
+
+    @database.retry_on_locked
+    def write(db):
+        calls.append(db)
+        raise _locked()
+
+    with pytest.raises(OperationalError):
+        write(_FakeSession())
+    assert len(calls) == 3
+
+    @database.retry_on_locked
+    def broken(db):
+        calls.append(db)
+        raise OperationalError("SELECT", {}, sqlite3.OperationalError("no such table: items"))
+
+    calls.clear()
+    with pytest.raises(OperationalError):
+        broken(_FakeSession())
+    assert len(calls) == 1
+
+
+def _legacy_logs_db():
+    path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+    legacy = sqlite3.connect(path)
+    legacy.executescript(
+        "CREATE TABLE logs (id INTEGER NOT NULL PRIMARY KEY, item_id INTEGER, user_id INTEGER, action VARCHAR, created_at DATETIME);"
+        "INSERT INTO logs (id, item_id, user_id, action) VALUES (1, 1, 1, 'borrow'), (7, 1, 1, 'return');"
+    )
+    legacy.close()
+    return path
+
+
+def test_init_db_rebuilds_logs_with_autoincrement():
+    from sqlalchemy import create_engine
+
+    path = _legacy_logs_db()
+    engine = create_engine(f"sqlite:///{path}")
+    database.init_db(engine)
+    database.init_db(engine)
+    engine.dispose()
+    connection = sqlite3.connect(path)
+    assert "AUTOINCREMENT" in connection.execute("SELECT sql FROM sqlite_master WHERE name = 'logs'").fetchone()[0]
+    assert connection.execute("SELECT id, action FROM logs ORDER BY id").fetchall() == [(1, "borrow"), (7, "return")]
+    connection.execute("DELETE FROM logs")
+    connection.execute("INSERT INTO logs (item_id, user_id, action) VALUES (1, 1, 'borrow')")
+    assert connection.execute("SELECT id FROM logs").fetchall() == [(8,)]
+    indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'logs'")}
+    assert "ix_logs_item_id_created_at" in indexes
+    connection.close()
+
+
+def test_concurrent_workers_rebuild_logs_once():
+    import threading
+
+    from sqlalchemy import create_engine
+
+    for _ in range(5):
+        path = _legacy_logs_db()
+        engines = [create_engine(f"sqlite:///{path}") for _ in range(4)]
+        barrier = threading.Barrier(len(engines))
+        errors = []
+
+        def start_worker(engine):
+            barrier.wait()
+            try:
+                database.ensure_autoincrement(engine)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start_worker, args=(engine,)) for engine in engines]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for engine in engines:
+            engine.dispose()
+        assert errors == []
+        connection = sqlite3.connect(path)
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'logs%'")]
+        assert tables == ["logs"]
+        assert connection.execute("SELECT id FROM logs ORDER BY id").fetchall() == [(1,), (7,)]
+        connection.close()
+
+
+def test_concurrent_workers_add_missing_columns_once():
+    import threading
+
+    from sqlalchemy import create_engine
+
+    from inventory_app import models  # noqa: F401 テーブル定義を登録する
+
+    for _ in range(5):
+        path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+        engine = create_engine(f"sqlite:///{path}")
+        database.Base.metadata.create_all(engine)
+        engine.dispose()
+        legacy = sqlite3.connect(path)
+        legacy.execute("ALTER TABLE users DROP COLUMN token_version")
+        legacy.close()
+
+        engines = [create_engine(f"sqlite:///{path}") for _ in range(4)]
+        barrier = threading.Barrier(len(engines))
+        errors = []
+
+        def start_worker(engine):
+            barrier.wait()
+            try:
+                database.ensure_columns(engine)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start_worker, args=(engine,)) for engine in engines]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for engine in engines:
+            engine.dispose()
+        assert errors == []
+        connection = sqlite3.connect(path)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(users)")]
+        connection.close()
+        assert columns.count("token_version") == 1
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from inventory_app import exporter, models
+
+
+def _seed(session_factory):
+    db = session_factory()
+    user = models.User(username="auditor", hashed_password="x", display_name="監査 太郎")
+    item = models.Item(name="Camera", management_code="CAM-001", category="AV", accessories=["Strap", "SD"],
+                       status="borrowed")
+    db.add_all([user, item])
+    db.flush()
+    item.owner_id = user.id
+    db.add_all(
+        models.Log(item_id=item.id, user_id=user.id, action="borrow", created_at=datetime(2026, month, 1))
+        for month in (1, 2, 3, 4)
+    )
+    db.commit()
+    db.close()
+
+
+def test_export_logs_ndjson_with_date_range(client, admin_token_headers, session_factory):
+    _seed(session_factory)
+    response = client.get("/api/v1/logs/export", params={"start": "2026-02-01", "end": "2026-04-01"},
+                          headers=admin_token_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "attachment" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["created_at"][:7] for row in rows] == ["2026-02", "2026-03"]
+    assert rows[0]["item_name"] == "Camera"
+    assert rows[0]["display_name"] == "監査 太郎"
+
+
+def test_export_items_csv(client, admin_token_headers, session_factory):
+    _seed(session_factory)
+    response = client.get("/api/v1/items/export", params={"format": "csv"}, headers=admin_token_headers)
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert len(rows) == 1
+    assert rows[0]["owner_username"] == "auditor"
+    assert json.loads(rows[0]["accessories"]) == ["Strap", "SD"]
+
+
+def test_export_requires_admin(client, user_token_headers):
+    assert client.get("/api/v1/logs/export", headers=user_token_headers).status_code == 403
+
+
+def test_export_streams_in_batches(session_factory):
+    _seed(session_factory)
+    db = session_factory()
+    chunks = list(exporter.export(db, "logs", "ndjson", batch_size=3))
+    db.close()
+    assert [chunk.count(b"\n") for chunk in chunks] == [3, 1]
+
+
+def test_export_parquet(client, admin_token_headers, session_factory):
+    pq = pytest.importorskip("pyarrow.parquet")
+    _seed(session_factory)
+    db = session_factory()
+    data = b"".join(exporter.export(db, "logs", "parquet", batch_size=2))
+    db.close()
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 4
+    assert pq.ParquetFile(io.BytesIO(data)).metadata.num_row_groups == 2
+
+    response = client.get("/api/v1/items/export", params={"format": "parquet"}, headers=admin_token_headers)
+    items = pq.read_table(io.BytesIO(response.content)).to_pylist()
+    assert items[0]["accessories"] == ["Strap", "SD"]
@@ -0,0 +1,97 @@
+import io
+import json
+
+
+def test_import_items_csv(client, admin_token_headers):
+    csv_data = (
+        "name,management_code,category,accessories,is_fixed_asset\n"
+        "MacBook,PC-001,PC,Charger;Mouse,1\n"
+        ",PC-002,PC,,\n"
+        "Monitor,MON-001,Monitor,\"[\"\"HDMI Cable\"\"]\",0\n"
+    )
+    response = client.post(
+        "/api/v1/items/import",
+        files={"file": ("assets.csv", io.BytesIO(csv_data.encode("utf-8")), "text/csv")},
+        params={"batch_size": 1},
+        headers=admin_token_headers,
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["total"], report["inserted"], report["failed"]) == (3, 2, 1)
+    assert report["errors"][0]["row"] == 3
+
+    items = {i["management_code"]: i for i in client.get("/api/v1/items/", headers=admin_token_headers).json()}
+    assert items["PC-001"]["accessories"] == ["Charger", "Mouse"]
+    assert items["PC-001"]["is_fixed_asset"] is True
+    assert items["MON-001"]["accessories"] == ["HDMI Cable"]
+
+
+def test_import_items_ndjson_upsert(client, admin_token_headers):
+    client.post("/api/v1/items/", json={"name": "Old", "management_code": "PC-001"}, headers=admin_token_headers)
+    lines = [
+        json.dumps({"name": "New", "management_code": "PC-001"}),
+        json.dumps({"name": "Other", "management_code": "PC-002"}),
+        "not json",
+    ]
+    payload = ("\n".join(lines) + "\n").encode("utf-8")
+
+    response = client.post(
+        "/api/v1/items/import",
+        files={"file": ("assets.ndjson", io.BytesIO(payload), "application/x-ndjson")},
+        headers=admin_token_headers,
+    )
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (1, 1, 1)
+    names = {i["management_code"]: i["name"] for i in client.get("/api/v1/items/", headers=admin_token_headers).json()}
+    assert names == {"PC-001": "New", "PC-002": "Other"}
+
+    response = client.post(
+        "/api/v1/items/import",
+        files={"file": ("assets.ndjson", io.BytesIO(lines[0].encode("utf-8")), "application/x-ndjson")},
+        params={"upsert": False},
+        headers=admin_token_headers,
+    )
+    assert response.json()["skipped"] == 1
+
+
+def test_import_users(client, admin_token_headers):
+    from inventory_app.security import get_password_hash
+
+    hashed = get_password_hash("prehashed")
+    csv_data = (
+        "username,password,hashed_password,display_name,employee_id,email\n"
+        "sato,secret,,佐藤,U0001,sato@example.com\n"
+        f"suzuki,,{hashed},鈴木,U0002,suzuki@example.com\n"
+        "dup,secret,,Dup,U0001,dup@example.com\n"
+        "nopass,,,No Pass,U0003,\n"
+    )
+    response = client.post(
+        "/api/v1/users/import",
+        files={"file": ("employees.csv", io.BytesIO(csv_data.encode("utf-8")), "text/csv")},
+        headers=admin_token_headers,
+    )
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (2, 2)
+    assert client.post("/token", data={"username": "sato", "password": "secret"}).status_code == 200
+    assert client.post("/token", data={"username": "suzuki", "password": "prehashed"}).status_code == 200
+
+    update = "username,department,email\nsato,Sales,suzuki@example.com\nsuzuki,Engineering,\n"
+    response = client.post(
+        "/api/v1/users/import",
+        files={"file": ("employees.csv", io.BytesIO(update.encode("utf-8")), "text/csv")},
+        params={"update_existing": True},
+        headers=admin_token_headers,
+    )
+    report = response.json()
+    assert (report["updated"], report["failed"]) == (1, 1)
+    departments = {u["username"]: u["department"] for u in client.get("/api/v1/users/").json()}
+    assert departments["suzuki"] == "Engineering"
+
+
+def test_password_hasher_uses_process_pool():
+    from inventory_app.importer import PasswordHasher
+    from inventory_app.security import verify_password
+
+    with PasswordHasher(max_workers=2, min_parallel=2) as hasher:
+        hashes = hasher.hash_all(["a", "b", "c"])
+    assert all(verify_password(p, h) for p, h in zip("abc", hashes))
@@ -0,0 +1,68 @@
+import datetime
+
+from sqlalchemy import text
+
+from inventory_app import models
+
+
+def _seed(session_factory):
+    today = datetime.date.today()
+    db = session_factory()
+    db.add_all([
+        models.Item(name="A", management_code="F-1", category="PC", status="available"),
+        models.Item(name="B", management_code="F-2", category="PC", status="borrowed", due_date=today - datetime.timedelta(days=3)),
+        models.Item(name="C", management_code="F-3", category="Monitor", status="borrowed", due_date=today + datetime.timedelta(days=3)),
+        models.Item(name="D", management_code="F-4", category="PC", status="borrowed", due_date=today + datetime.timedelta(days=1), is_fixed_asset=True),
+        models.Item(name="E", management_code="F-5", category="Book", status="borrowed"),
+    ])
+    db.commit()
+    db.close()
+
+
+def test_filter_items(client, admin_token_headers, session_factory):
+    _seed(session_factory)
+
+    def names(**params):
+        response = client.get("/api/v1/items/", params=params, headers=admin_token_headers)
+        assert response.status_code == 200
+        return sorted(i["name"] for i in response.json())
+
+    assert names(status="borrowed", category="PC") == ["B", "D"]
+    assert names(overdue=True) == ["B"]
+    assert names(overdue=False) == ["A", "C", "D", "E"]
+    assert names(is_fixed_asset=True) == ["D"]
+    assert names(due_after=datetime.date.today().isoformat()) == ["C", "D"]
+
+
+def test_sorted_cursor_pagination(client, admin_token_headers, session_factory):
+    _seed(session_factory)
+
+    for sort in ("due_date", "-due_date"):
+        collected = []
+        cursor = None
+        while True:
+            params = {"sort": sort, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/api/v1/items/", params=params, headers=admin_token_headers)
+            assert response.status_code == 200
+            collected.extend(i["name"] for i in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        expected = ["A", "E", "B", "D", "C"]
+        assert collected == (expected if sort == "due_date" else expected[::-1])
+
+
+def test_sort_is_whitelisted(client, admin_token_headers):
+    response = client.get("/api/v1/items/", params={"sort": "hashed_password"}, headers=admin_token_headers)
+    assert response.status_code == 422
+
+
+def test_status_due_date_index_is_used(client, session_factory):
+    db = session_factory()
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM items WHERE status = 'borrowed' AND due_date < '2030-01-01'"
+    )).all()
+    db.close()
+    assert any("ix_items_status_due_date" in row[-1] for row in plan)
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from inventory_app import lease, models
+
+
+def test_lease_is_exclusive_until_it_expires(session_factory):
+    db = session_factory()
+    now = datetime(2026, 4, 1, 8, 0)
+    assert lease.acquire(db, "job", "a", ttl=60, now=now)
+    assert not lease.acquire(db, "job", "b", ttl=60, now=now + timedelta(seconds=30))
+    # 保持者自身は更新できる
+    assert lease.acquire(db, "job", "a", ttl=60, now=now + timedelta(seconds=30))
+    assert lease.acquire(db, "job", "b", ttl=60, now=now + timedelta(seconds=120))
+    assert not lease.acquire(db, "job", "a", ttl=60, now=now + timedelta(seconds=121))
+    db.close()
+
+
+def test_held_releases_the_lease(session_factory):
+    db = session_factory()
+    with lease.held(db, "job", "a") as acquired:
+        assert acquired
+        with lease.held(db, "job", "b") as other:
+            assert not other
+    assert lease.acquire(db, "job", "b")
+    db.close()
+
+
+def test_default_clock_matches_stored_expiry(session_factory):
+    db = session_factory()
+    assert lease.acquire(db, "job", "a", ttl=60)
+    expires_at = db.get(models.SchedulerLease, "job").expires_at
+    # 保存された有効期限と models.utcnow() は同じ naive な UTC で比較できる
+    assert expires_at.tzinfo is None
+    assert timedelta(seconds=55) < expires_at - models.utcnow() <= timedelta(seconds=60)
+    assert not lease.acquire(db, "job", "b", ttl=60, now=models.utcnow())
+    assert lease.acquire(db, "job", "b", ttl=60, now=models.utcnow() + timedelta(seconds=61))
+    db.close()
@@ -0,0 +1,76 @@
+from inventory_app import database, metrics, schemas, scheduler
+
+
+def _sample(text, line_prefix):
+    [line] = [line for line in text.splitlines() if line.startswith(line_prefix + " ")]
+    return float(line.rsplit(" ", 1)[1])
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    requests = metrics.Counter("requests_total", "Requests.", ("route",), registry=registry)
+    latency = metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+    requests.inc(('/a "quoted"',))
+    requests.inc(('/a "quoted"',), 2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a \\"quoted\\""} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_requests_are_recorded_by_route_template(client, user_token_headers):
+    before = metrics.http_request_duration_seconds.count(("GET", "/api/v1/users/me"))
+    assert client.get("/api/v1/users/me", headers=user_token_headers).status_code == 200
+    assert client.get("/api/v1/users/me").status_code == 401
+    assert client.get("/no/such/path").status_code == 404
+    assert client.get("/static/growi_table.html").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert metrics.http_request_duration_seconds.count(("GET", "/api/v1/users/me")) == before + 2
+    assert _sample(text, 'http_requests_total{method="GET",route="/api/v1/users/me",status="401"}') >= 1
+    assert _sample(text, 'http_requests_total{method="GET",route="unmatched",status="404"}') >= 1
+    assert _sample(text, 'http_requests_total{method="GET",route="/static/{path}",status="200"}') >= 1
+    # the /metrics request itself is still being processed while the text is rendered
+    assert _sample(text, 'http_requests_in_progress{method="GET"}') == 1
+
+
+def test_pool_checkout_wait_is_recorded_only_when_a_connection_is_used(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+
+    engine = database.create_profiled_engine(f"sqlite:///{tmp_path / 'pool.db'}", database.EngineProfile())
+    before = metrics.db_pool_checkout_seconds.count(("sync",))
+    with Session(engine) as db:
+        # a session that never runs SQL does not check out a connection
+        assert metrics.db_pool_checkout_seconds.count(("sync",)) == before
+        db.execute(text("SELECT 1"))
+    assert metrics.db_pool_checkout_seconds.count(("sync",)) == before + 1
+    engine.dispose()
+
+
+def test_notification_runs_are_recorded():
+    class Session:
+        def close(self):
+            pass
+
+    report = schemas.NotificationReport(queued=3, sent=2, failed=1, retried=4)
+    job = scheduler.JobScheduler(scheduler.CronSchedule("0 8 * * *"), job=lambda db: report, session_factory=Session)
+    before = {result: metrics.notification_messages_total.get((result,)) or 0 for result in ("sent", "failed", "retried")}
+    runs = metrics.notification_runs_total.get(("manual", "ok")) or 0
+
+    job.run_once()
+    assert metrics.notification_runs_total.get(("manual", "ok")) == runs + 1
+    assert metrics.notification_messages_total.get(("sent",)) == before["sent"] + 2
+    assert metrics.notification_messages_total.get(("failed",)) == before["failed"] + 1
+    assert metrics.notification_messages_total.get(("retried",)) == before["retried"] + 4
+    assert metrics.notification_last_success_timestamp_seconds.get() > 0
@@ -0,0 +1,455 @@
+import asyncio
+import email
+import email.header
+import socket
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from inventory_app import models, notification
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller  # noqa: E402
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = 0
+        self.drop_on = set()
+        self.fail_once = {}
+        self.delay = 0.0
+        self._received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        self.sessions += 1
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        reply = self.fail_once.pop(address, None)
+        if reply:
+            return reply
+        if address.startswith("unknown"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self._received += 1
+        if self._received in self.drop_on:
+            return "421 Service closing transmission channel"
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+def _settings(port, **kwargs):
+    return models.NotificationSettings(
+        n_days_before=1, m_days_overdue=1, smtp_server="127.0.0.1", smtp_port=port,
+        sender_email="noreply@example.com", **kwargs,
+    )
+
+
+def _messages(settings, count):
+    return [
+        (f"user{i}@example.com", notification.build_message(settings, f"user{i}@example.com", "Reminder", f"Body {i}"))
+        for i in range(count)
+    ]
+
+
+def test_send_messages_reuses_sessions_in_batches(smtp_server):
+    handler, port = smtp_server
+    settings = _settings(port)
+    report = notification.send_messages(settings, _messages(settings, 120), batch_size=50, workers=1)
+    assert (report.sent, report.failed, report.connections) == (120, 0, 3)
+    assert handler.sessions == 3
+    assert len(handler.messages) == 120
+    assert report.messages_per_second > 0
+
+
+def test_send_messages_reconnects_after_drop(smtp_server):
+    handler, port = smtp_server
+    handler.drop_on = {3}
+    settings = _settings(port)
+    report = notification.send_messages(settings, _messages(settings, 5), workers=1)
+    assert (report.sent, report.failed, report.connections) == (5, 0, 2)
+    assert [envelope.rcpt_tos[0] for envelope in handler.messages] == [f"user{i}@example.com" for i in range(5)]
+
+
+def test_send_messages_reports_failures():
+    settings = _settings(_free_port())
+    report = notification.send_messages(settings, _messages(settings, 2), max_attempts=2, retry_base_delay=0)
+    assert (report.sent, report.failed, report.retried) == (0, 2, 2)
+    assert sorted(letter.recipient for letter in report.dead_letters) == ["user0@example.com", "user1@example.com"]
+    assert all(letter.attempts == 2 and not letter.permanent for letter in report.dead_letters)
+
+
+def test_credentials_require_tls(smtp_server):
+    _, port = smtp_server
+    settings = _settings(port, smtp_username="relay", smtp_password="secret")
+    report = notification.send_messages(settings, _messages(settings, 1), retry_base_delay=0)
+    assert (report.failed, report.retried) == (1, 0)
+    assert "STARTTLS" in report.dead_letters[0].error
+
+
+def test_send_messages_retries_transient_and_dead_letters_permanent(smtp_server):
+    handler, port = smtp_server
+    handler.fail_once = {"user1@example.com": "451 Try again later"}
+    settings = _settings(port)
+    messages = _messages(settings, 3)
+    messages.append(("unknown@example.com", notification.build_message(settings, "unknown@example.com", "Reminder", "Body")))
+    report = notification.send_messages(settings, messages, workers=2, retry_base_delay=0)
+    assert (report.sent, report.failed, report.retried) == (3, 1, 1)
+    assert sorted(envelope.rcpt_tos[0] for envelope in handler.messages) == [f"user{i}@example.com" for i in range(3)]
+    [letter] = report.dead_letters
+    assert (letter.recipient, letter.attempts, letter.permanent) == ("unknown@example.com", 1, True)
+
+
+def test_send_messages_wall_time_bounded_by_workers(smtp_server):
+    handler, port = smtp_server
+    handler.delay = 0.2
+    settings = _settings(port)
+    started = time.perf_counter()
+    report = notification.send_messages(settings, _messages(settings, 20), workers=10)
+    elapsed = time.perf_counter() - started
+    assert (report.sent, report.workers) == (20, 10)
+    # 逐次送信なら 4 秒以上かかる
+    assert elapsed < 2.0
+
+
+def test_send_messages_reads_settings_only_on_calling_thread(smtp_server):
+    import threading
+
+    _, port = smtp_server
+    settings = _settings(port)
+    messages = _messages(settings, 8)
+    readers = set()
+
+    class TrackingSettings:
+        # an expired ORM instance would refresh through the (non thread-safe) session on access
+        def __getattr__(self, name):
+            readers.add(threading.current_thread())
+            return getattr(settings, name)
+
+    report = notification.send_messages(TrackingSettings(), messages, workers=4)
+    assert (report.sent, report.workers) == (8, 4)
+    assert readers == {threading.current_thread()}
+
+
+def test_check_and_send_notifications(smtp_server, session_factory):
+    handler, port = smtp_server
+    db = session_factory()
+    db.add(_settings(port))
+    db.add(models.EmailTemplate(name="reminder_before", subject="Return {item_name}", body="Hi {user_name}, {item_name} is due {due_date}"))
+    users = [models.User(username=f"n{i}", hashed_password="x", display_name=f"N{i}", email=f"n{i}@example.com") for i in range(3)]
+    db.add_all(users)
+    db.flush()
+    tomorrow = date.today() + timedelta(days=1)
+    db.add_all(
+        models.Item(name=f"Item {i}", management_code=f"NTF-{i}", status="borrowed", owner_id=users[i % 3].id, due_date=tomorrow)
+        for i in range(6)
+    )
+    db.commit()
+
+    report = notification.check_and_send_notifications(db, mode="item")
+    db.close()
+    assert (report.sent, report.failed) == (6, 0)
+    assert handler.sessions == report.connections <= report.workers
+    assert sorted(envelope.rcpt_tos[0] for envelope in handler.messages) == sorted([f"n{i}@example.com" for i in range(3)] * 2)
+
+
+
+def test_check_and_send_notifications_digest(smtp_server, session_factory):
+    from sqlalchemy import event
+
+    handler, port = smtp_server
+    db = session_factory()
+    db.add(_settings(port))
+    users = [models.User(username=f"d{i}", hashed_password="x", display_name=f"D{i}", email=f"d{i}@example.com") for i in range(2)]
+    db.add_all(users)
+    db.flush()
+    today = date.today()
+    due = {"Soon": 1, "Today": 0, "Late": -2, "Later": -5}
+    db.add_all(
+        models.Item(name=name, management_code=f"DIG-{name}", status="borrowed", owner_id=users[0].id,
+                    due_date=today + timedelta(days=offset))
+        for name, offset in due.items()
+    )
+    db.add(models.Item(name="Other", management_code="DIG-Other", status="borrowed", owner_id=users[1].id, due_date=today))
+    db.commit()
+
+    template_queries = []
+    engine = db.get_bind()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM email_templates" in statement:
+            template_queries.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        report = notification.check_and_send_notifications(db, mode="digest")
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    db.close()
+    assert (report.sent, report.failed) == (2, 0)
+    assert len(template_queries) == 1
+    mails = {envelope.rcpt_tos[0]: email.message_from_bytes(envelope.content) for envelope in handler.messages}
+    assert set(mails) == {"d0@example.com", "d1@example.com"}
+    assert "4 件" in str(email.header.make_header(email.header.decode_header(mails["d0@example.com"]["Subject"])))
+    bodies = {to: mail.get_payload(decode=True).decode("utf-8") for to, mail in mails.items()}
+    assert "Late (返却期限: " in bodies["d0@example.com"] and "2 日超過" in bodies["d0@example.com"]
+    assert all(name in bodies["d0@example.com"] for name in due)
+    assert "Other" not in bodies["d0@example.com"]
+
+
+def test_compiled_template_renders_placeholders():
+    template = notification.CompiledTemplate("t", "Return {item_name}", "{user_name}: {due_date:%Y/%m/%d} ({days_overdue!r})")
+    assert template.render(item_name="Camera", user_name="Alice", due_date=date(2026, 4, 1), days_overdue=3) == (
+        "Return Camera", "Alice: 2026/04/01 (3)",
+    )
+    with pytest.raises(KeyError):
+        template.render(item_name="Camera")
+
+
+def _borrowed_items(db, due_dates):
+    user = models.User(username="cand", hashed_password="x", email="cand@example.com")
+    no_email = models.User(username="cand-no-email", hashed_password="x")
+    db.add_all([user, no_email])
+    db.flush()
+    db.add_all(
+        models.Item(name=f"Due {offset}", management_code=f"CND-{offset}", status="borrowed", owner_id=user.id, due_date=due)
+        for offset, due in due_dates.items()
+    )
+    db.add(models.Item(name="Silent", management_code="CND-silent", status="borrowed", owner_id=no_email.id,
+                       due_date=date(2026, 4, 10)))
+    db.add(models.Item(name="Returned", management_code="CND-returned", status="available", due_date=date(2026, 4, 10)))
+    db.commit()
+
+
+@pytest.mark.parametrize("max_dates", [notification.MAX_OVERDUE_DATES, 0])
+def test_due_candidates_selects_only_due_items(session_factory, monkeypatch, max_dates):
+    monkeypatch.setattr(notification, "MAX_OVERDUE_DATES", max_dates)
+    today = date(2026, 4, 10)
+    db = session_factory()
+    _borrowed_items(db, {offset: today + timedelta(days=offset) for offset in range(-10, 5)})
+    settings = models.NotificationSettings(n_days_before=3, m_days_overdue=4)
+
+    candidates = notification.due_candidates(db, settings, today)
+    db.close()
+    assert [item.name for item in candidates] == ["Due -8", "Due -4", "Due 0", "Due 3"]
+    assert all(item.owner.email == "cand@example.com" for item in candidates)
+    assert [notification.template_name_for(settings, (item.due_date - today).days) for item in candidates] == [
+        "overdue", "overdue", "due_date", "reminder_before",
+    ]
+
+
+def test_due_candidates_uses_status_due_date_index(session_factory):
+    from sqlalchemy import event
+
+    db = session_factory()
+    _borrowed_items(db, {0: date(2026, 4, 10)})
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "JOIN users" in statement:
+            statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        notification.due_candidates(db, models.NotificationSettings(n_days_before=1, m_days_overdue=1), date(2026, 4, 10))
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    [(statement, parameters)] = statements
+    plan = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    db.close()
+    assert any("ix_items_status_due_date" in row[-1] for row in plan)
+
+
+def _outbox_fixture(db, port, count=2):
+    db.add(_settings(port))
+    db.add(models.EmailTemplate(name="due_date", subject="Return {item_name}", body="{item_name} is due today"))
+    user = models.User(username="ob", hashed_password="x", email="ob@example.com")
+    db.add(user)
+    db.flush()
+    items = [
+        models.Item(name=f"Outbox {i}", management_code=f"OBX-{i}", status="borrowed", owner_id=user.id,
+                    due_date=date.today())
+        for i in range(count)
+    ]
+    db.add_all(items)
+    db.commit()
+    return items
+
+
+def test_outbox_sends_each_notification_once_per_day(smtp_server, session_factory):
+    handler, port = smtp_server
+    db = session_factory()
+    _outbox_fixture(db, port)
+
+    first = notification.check_and_send_notifications(db, mode="item")
+    second = notification.check_and_send_notifications(db, mode="item")
+    statuses = [row.status for row in db.query(models.NotificationOutbox)]
+    db.close()
+    assert (first.queued, first.sent) == (2, 2)
+    assert (second.queued, second.sent) == (0, 0)
+    assert statuses == ["sent", "sent"]
+    assert len(handler.messages) == 2
+
+
+def test_outbox_is_drained_only_by_the_lease_holder(smtp_server, session_factory):
+    from inventory_app import lease
+
+    handler, port = smtp_server
+    db = session_factory()
+    _outbox_fixture(db, port)
+    assert lease.acquire(db, notification.OUTBOX_LEASE, "other-worker")
+
+    assert notification.check_and_send_notifications(db) is None
+    assert handler.messages == []
+    assert db.query(models.NotificationOutbox).filter_by(status="pending").count() == 2
+
+    lease.release(db, notification.OUTBOX_LEASE, "other-worker")
+    report = notification.check_and_send_notifications(db)
+    db.close()
+    assert (report.queued, report.sent) == (0, 1)
+    assert [envelope.rcpt_tos for envelope in handler.messages] == [["ob@example.com"]]
+
+
+def _drain_in_background(db, ttl):
+    import threading
+
+    from inventory_app import lease
+
+    settings = db.query(models.NotificationSettings).one()
+    notification.enqueue_notifications(db, settings, date.today())
+    templates = notification.load_templates(db)
+    assert lease.acquire(db, notification.OUTBOX_LEASE, "sender", ttl)
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("report", notification.drain_outbox(
+        db, settings, templates, date.today(), mode="item", holder="sender", lease_ttl=ttl)))
+    thread.start()
+    return thread, result
+
+
+def test_outbox_lease_is_renewed_during_slow_sends(smtp_server, session_factory):
+    from inventory_app import lease
+
+    handler, port = smtp_server
+    handler.delay = 1.0
+    db = session_factory()
+    _outbox_fixture(db, port)
+    thread, result = _drain_in_background(db, ttl=0.4)
+
+    # the batch takes longer than the TTL, but the sender keeps the lease while sending
+    time.sleep(0.7)
+    other = session_factory()
+    assert not lease.acquire(other, notification.OUTBOX_LEASE, "other-worker", 0.4)
+    other.close()
+    thread.join()
+    statuses = [row.status for row in db.query(models.NotificationOutbox)]
+    db.close()
+    assert result["report"].sent == 2
+    assert statuses == ["sent", "sent"]
+    assert len(handler.messages) == 2
+
+
+def test_outbox_stops_sending_when_lease_is_lost(smtp_server, session_factory):
+    from inventory_app import lease
+
+    handler, port = smtp_server
+    handler.delay = 1.0
+    db = session_factory()
+    _outbox_fixture(db, port, count=2 * notification.SMTP_WORKERS)
+    thread, result = _drain_in_background(db, ttl=0.6)
+
+    time.sleep(0.3)
+    other = session_factory()
+    later = models.utcnow() + timedelta(hours=1)
+    assert lease.acquire(other, notification.OUTBOX_LEASE, "other-worker", 60, now=later)
+    other.close()
+    thread.join()
+    statuses = sorted(row.status for row in db.query(models.NotificationOutbox))
+    db.close()
+    # messages already in flight finish; the rest stay pending for the new lease holder
+    sent = notification.SMTP_WORKERS
+    assert result["report"].sent == sent
+    assert statuses == ["pending"] * sent + ["sent"] * sent
+    assert len(handler.messages) == sent
+
+
+def test_outbox_skips_returned_and_expired_notifications(smtp_server, session_factory):
+    handler, port = smtp_server
+    db = session_factory()
+    items = _outbox_fixture(db, port)
+    settings = db.query(models.NotificationSettings).one()
+    today = date.today()
+    notification.enqueue_notifications(db, settings, today)
+    db.add(models.NotificationOutbox(item_id=items[0].id, user_id=items[0].owner_id, template_name="due_date",
+                                     notify_date=today - timedelta(days=1)))
+    items[1].status, items[1].owner_id = "available", None
+    db.commit()
+
+    report = notification.drain_outbox(db, settings, notification.load_templates(db), today, mode="digest")
+    statuses = sorted((row.notify_date == today, row.item_id == items[0].id, row.status)
+                      for row in db.query(models.NotificationOutbox))
+    db.close()
+    assert (report.sent, report.skipped) == (1, 2)
+    assert statuses == [(False, True, "skipped"), (True, False, "skipped"), (True, True, "sent")]
+
+
+class _Crash(BaseException):
+    """送信中のプロセスの異常終了を模擬する例外."""
+
+
+def test_outbox_does_not_resend_after_crash_between_messages(smtp_server, session_factory, monkeypatch):
+    handler, port = smtp_server
+    db = session_factory()
+    _outbox_fixture(db, port, count=3)
+    settings = db.query(models.NotificationSettings).one()
+    templates = notification.load_templates(db)
+    notification.enqueue_notifications(db, settings, date.today())
+    send_messages = notification.send_messages
+
+    def crash_after_first_message(settings, messages, on_result=None, **kwargs):
+        def on_result_then_crash(index, error):
+            on_result(index, error)
+            raise _Crash()
+
+        return send_messages(settings, messages, workers=1, on_result=on_result_then_crash, **kwargs)
+
+    monkeypatch.setattr(notification, "send_messages", crash_after_first_message)
+    with pytest.raises(_Crash):
+        notification.drain_outbox(db, settings, templates, date.today(), mode="item")
+    db.rollback()
+    assert sorted(row.status for row in db.query(models.NotificationOutbox)) == ["pending", "pending", "sent"]
+
+    monkeypatch.setattr(notification, "send_messages", send_messages)
+    report = notification.drain_outbox(db, settings, templates, date.today(), mode="item")
+    statuses = [row.status for row in db.query(models.NotificationOutbox)]
+    db.close()
+    assert report.sent == 2
+    assert statuses == ["sent"] * 3
+    subjects = sorted(
+        str(email.header.make_header(email.header.decode_header(email.message_from_bytes(envelope.content)["Subject"])))
+        for envelope in handler.messages
+    )
+    assert subjects == ["Return Outbox 0", "Return Outbox 1", "Return Outbox 2"]
@@ -23,7 +23,7 @@ def test_borrow_item(client, admin_token_headers):
     
     # Borrow again fail
     response = client.post(f"/api/v1/items/{item_id}/borrow", json=param)
-    assert response.status_code == 400
+    assert response.status_code == 409
 
 def test_return_item(client, admin_token_headers, user_token_headers):
     # Setup: Create and borrow
@@ -93,3 +93,32 @@ def test_growi_status_endpoint(client, admin_token_headers, user_token_headers):
     data = response.json()
     assert isinstance(data, list)
     assert any(i["name"] == "PC_Growi" for i in data)
+
+def test_return_logs_the_borrower(client, admin_token_headers, user_token_headers, session_factory):
+    client.post("/api/v1/items/", json={"name": "PCLog", "management_code": "PC-LOG"}, headers=admin_token_headers)
+    items = client.get("/api/v1/items/", headers=admin_token_headers).json()
+    item_id = [i["id"] for i in items if i["name"] == "PCLog"][0]
+    client.post(f"/api/v1/items/{item_id}/borrow", json={"due_date": "2025-12-31", "username": "user"})
+
+    assert client.post(f"/api/v1/items/{item_id}/return").status_code == 200
+    db = session_factory()
+    borrower = db.query(models.User).filter_by(username="user").one()
+    [log] = db.query(models.Log).filter_by(item_id=item_id, action="return").all()
+    assert log.user_id == borrower.id
+    db.close()
+
+def test_return_without_borrower_is_rejected(client, session_factory):
+    db = session_factory()
+    # inconsistent data: borrowed but nobody to attribute the return to
+    item = models.Item(name="Orphan", management_code="ORPHAN-1", status=models.ItemStatus.borrowed.value)
+    db.add(item)
+    db.commit()
+    item_id = item.id
+    db.close()
+
+    response = client.post(f"/api/v1/items/{item_id}/return")
+    assert response.status_code == 409
+    db = session_factory()
+    assert db.query(models.Log).filter_by(item_id=item_id).count() == 0
+    assert db.get(models.Item, item_id).status == models.ItemStatus.borrowed.value
+    db.close()
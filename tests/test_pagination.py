@@ -0,0 +1,58 @@
+from inventory_app import models
+
+
+def _create_items(session_factory, count):
+    db = session_factory()
+    db.add_all([models.Item(name=f"Item {i}", management_code=f"PG-{i:05d}") for i in range(count)])
+    db.commit()
+    db.close()
+
+
+def test_items_cursor_pagination(client, admin_token_headers, session_factory):
+    _create_items(session_factory, 5)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/items/", params=params, headers=admin_token_headers)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "5"
+        seen.extend(i["id"] for i in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == sorted(seen)
+    assert len(set(seen)) == 5
+
+
+def test_invalid_cursor(client, admin_token_headers):
+    response = client.get("/api/v1/items/", params={"cursor": "not-a-cursor"}, headers=admin_token_headers)
+    assert response.status_code == 400
+
+
+def test_logs_listing(client, admin_token_headers):
+    client.post("/api/v1/items/", json={"name": "Logged", "management_code": "LG-001"}, headers=admin_token_headers)
+    item_id = client.get("/api/v1/items/", headers=admin_token_headers).json()[0]["id"]
+    client.post(f"/api/v1/items/{item_id}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+    client.post(f"/api/v1/items/{item_id}/return")
+
+    response = client.get("/api/v1/logs/", params={"item_id": item_id, "limit": 1}, headers=admin_token_headers)
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == "2"
+    assert response.json()[0]["action"] == "return"
+
+    response = client.get(
+        "/api/v1/logs/", params={"item_id": item_id, "cursor": response.headers["X-Next-Cursor"]}, headers=admin_token_headers
+    )
+    assert [log["action"] for log in response.json()] == ["borrow"]
+
+
+def test_status_returns_more_than_1000_items(client, session_factory):
+    _create_items(session_factory, 1205)
+    response = client.get("/api/v1/items/status")
+    assert response.status_code == 200
+    assert len(response.json()) == 1205
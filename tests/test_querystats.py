@@ -0,0 +1,78 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from inventory_app import models, querystats
+from inventory_app.main import app
+
+
+@pytest.fixture
+def borrowed_items(client, session_factory):
+    """Items owned by different users, each with a log entry, so per-row lazy loads would show up."""
+    db = session_factory()
+    users = [models.User(username=f"owner{i}", hashed_password="x", display_name=f"Owner {i}") for i in range(10)]
+    db.add_all(users)
+    db.flush()
+    items = [
+        models.Item(name=f"Item {i}", management_code=f"QS-{i}", status=models.ItemStatus.borrowed.value, owner_id=user.id)
+        for i, user in enumerate(users)
+    ]
+    db.add_all(items)
+    db.flush()
+    db.add_all([models.Log(item_id=item.id, user_id=item.owner_id, action="borrow") for item in items])
+    db.commit()
+    db.close()
+    return items
+
+
+def test_middleware_reports_queries_in_headers(borrowed_items, capsys):
+    instrumented = TestClient(querystats.QueryStatsMiddleware(app))
+    response = instrumented.get("/api/v1/items/status")
+    assert response.status_code == 200
+    assert int(response.headers["X-DB-Queries"]) >= 1
+    assert float(response.headers["X-DB-Time"]) >= 0
+    assert "X-DB-Repeated" not in response.headers
+    assert f"GET /api/v1/items/status: {response.headers['X-DB-Queries']} queries" in capsys.readouterr().out
+
+
+def test_middleware_flags_repeated_statements(borrowed_items, session_factory, capsys):
+    from fastapi import FastAPI
+
+    lazy = FastAPI()
+
+    @lazy.get("/owners")
+    def owners():
+        db = session_factory()
+        try:
+            # one lazy load per item: the N+1 pattern the middleware should flag
+            return [item.owner.username for item in db.query(models.Item).all()]
+        finally:
+            db.close()
+
+    response = TestClient(querystats.QueryStatsMiddleware(lazy)).get("/owners")
+    assert response.headers["X-DB-Queries"] == "11"
+    assert response.headers["X-DB-Repeated"] == "10"
+    assert "Possible N+1: executed 10 times" in capsys.readouterr().out
+
+
+def test_assert_max_queries_detects_n_plus_one(borrowed_items, session_factory):
+    db = session_factory()
+    try:
+        with pytest.raises(AssertionError, match="possible N\\+1"):
+            with querystats.assert_max_queries(100):
+                [log.user.username for log in db.query(models.Log).all()]
+        db.expire_all()
+        with pytest.raises(AssertionError, match="11 queries executed, budget is 5"):
+            with querystats.assert_max_queries(5, allow_repeated=True):
+                [log.user.username for log in db.query(models.Log).all()]
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("path, budget", [
+    ("/api/v1/items/status", 3),
+    ("/admin/log/list", 4),
+    ("/admin/item/list", 3),
+])
+def test_query_budget_does_not_grow_with_rows(client, borrowed_items, path, budget):
+    with querystats.assert_max_queries(budget):
+        assert client.get(path).status_code == 200
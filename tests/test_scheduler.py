@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from inventory_app import schemas, scheduler
+from inventory_app.main import app
+
+
+@pytest.mark.parametrize("expression, moment, expected", [
+    ("0 8 * * *", datetime(2026, 4, 1, 7, 59, 30), datetime(2026, 4, 1, 8, 0)),
+    ("0 8 * * *", datetime(2026, 4, 1, 8, 0), datetime(2026, 4, 2, 8, 0)),
+    ("*/15 9-10 * * *", datetime(2026, 4, 1, 9, 16), datetime(2026, 4, 1, 9, 30)),
+    ("*/15 9-10 * * *", datetime(2026, 4, 1, 10, 50), datetime(2026, 4, 2, 9, 0)),
+    # 2026-04-04 は土曜日. 平日のみ実行する
+    ("30 8 * * 1-5", datetime(2026, 4, 3, 9, 0), datetime(2026, 4, 6, 8, 30)),
+    ("0 0 * * 0", datetime(2026, 4, 1), datetime(2026, 4, 5, 0, 0)),
+    ("0 0 * * 7", datetime(2026, 4, 1), datetime(2026, 4, 5, 0, 0)),
+    # 日と曜日の両方を指定した場合はどちらかに一致する日
+    ("0 12 15 * 1", datetime(2026, 4, 1), datetime(2026, 4, 6, 12, 0)),
+    ("0 0 29 2 *", datetime(2026, 3, 1), datetime(2028, 2, 29, 0, 0)),
+    # すべての値を含むフィールドは * と同じ (曜日だけで絞り込む)
+    ("0 0 */1 * 1", datetime(2026, 4, 1), datetime(2026, 4, 6, 0, 0)),
+    ("0 0 1-31 * 1", datetime(2026, 4, 1), datetime(2026, 4, 6, 0, 0)),
+    ("0 0 15 * 0-6", datetime(2026, 4, 1), datetime(2026, 4, 15, 0, 0)),
+])
+def test_cron_next_after(expression, moment, expected):
+    assert scheduler.CronSchedule(expression).next_after(moment) == expected
+
+
+@pytest.mark.parametrize("expression", ["", "0 8 * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "a * * * *", "5-1 * * * *"])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(scheduler.CronError):
+        scheduler.CronSchedule(expression)
+
+
+class _Session:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_trigger_runs_job_in_scheduler_thread():
+    threads = []
+    done = threading.Event()
+    sessions = []
+
+    def job(db):
+        threads.append(threading.current_thread().name)
+        done.set()
+        return schemas.NotificationReport(sent=3)
+
+    def session_factory():
+        sessions.append(_Session())
+        return sessions[-1]
+
+    job_scheduler = scheduler.JobScheduler(scheduler.CronSchedule("0 0 1 1 *"), job=job, session_factory=session_factory)
+    job_scheduler.start()
+    try:
+        assert job_scheduler.trigger()
+        assert done.wait(5)
+    finally:
+        job_scheduler.stop(5)
+
+    status = job_scheduler.status()
+    assert threads == ["notification-scheduler"]
+    assert sessions[0].closed
+    assert (status.run_count, status.failure_count, status.alive) == (1, 0, False)
+    [run] = status.runs
+    assert (run.trigger, run.status, run.report.sent) == ("manual", "ok", 3)
+    assert run.duration_seconds >= 0 and status.last_duration_seconds == run.duration_seconds
+
+
+def test_failed_job_is_recorded():
+    def job(db):
+        raise RuntimeError("SMTP down")
+
+    job_scheduler = scheduler.JobScheduler(scheduler.CronSchedule("0 8 * * *"), job=job, session_factory=_Session)
+    run = job_scheduler.run_once("schedule")
+    assert (run.status, run.error) == ("error", "RuntimeError: SMTP down")
+    assert job_scheduler.status().failure_count == 1
+
+
+def test_scheduler_endpoints(client, admin_token_headers, user_token_headers, session_factory):
+    job_scheduler = app.state.scheduler
+    job_scheduler.session_factory = session_factory
+
+    assert client.get("/api/v1/system/scheduler", headers=user_token_headers).status_code == 403
+    response = client.get("/api/v1/system/scheduler", headers=admin_token_headers)
+    assert response.status_code == 200
+    assert response.json()["cron"] == scheduler.NOTIFICATION_CRON
+    assert response.json()["alive"] is True
+
+    response = client.post("/api/v1/system/scheduler/run", headers=admin_token_headers)
+    assert response.status_code == 202
+    deadline = time.monotonic() + 10
+    while job_scheduler.status().run_count == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    [run] = job_scheduler.status().runs
+    # 通知設定がないため送信は行われない
+    assert (run.trigger, run.status) == ("manual", "skipped")
+
+
+def test_trigger_during_wakeup_is_not_lost():
+    done = threading.Event()
+    job_scheduler = scheduler.JobScheduler(scheduler.CronSchedule("0 0 1 1 *"), job=lambda db: done.set(),
+                                           session_factory=_Session)
+    wake = job_scheduler._wake
+
+    class RacingEvent:
+        """待機が終わった直後 (次の確認の前) に即時実行が要求される Event."""
+
+        raced = False
+
+        def wait(self, timeout=None):
+            wake.wait(0.01)
+            if not self.raced:
+                self.raced = True
+                assert job_scheduler.trigger()
+            return True
+
+        def set(self):
+            wake.set()
+
+        def clear(self):
+            wake.clear()
+
+    job_scheduler._wake = RacingEvent()
+    job_scheduler.start()
+    try:
+        assert done.wait(5)
+    finally:
+        job_scheduler.stop(5)
+    assert [run.trigger for run in job_scheduler.status().runs] == ["manual"]
@@ -0,0 +1,43 @@
+def _create(client, headers, **item):
+    response = client.post("/api/v1/items/", json=item, headers=headers)
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_search_ranks_and_prefix_matches(client, admin_token_headers):
+    macbook = _create(client, admin_token_headers, name="MacBook Pro M3", management_code="PC-001", category="PC", accessories=["Charger"])
+    monitor = _create(client, admin_token_headers, name="USB-C Monitor", management_code="MON-001", category="Monitor", accessories=["HDMI Cable"])
+    _create(client, admin_token_headers, name="Design Book", management_code="BK-001", category="Book")
+
+    response = client.get("/api/v1/items/search", params={"q": "macb"}, headers=admin_token_headers)
+    assert response.status_code == 200
+    assert [i["id"] for i in response.json()] == [macbook]
+
+    response = client.get("/api/v1/items/search", params={"q": "hdmi"}, headers=admin_token_headers)
+    assert [i["id"] for i in response.json()] == [monitor]
+
+    response = client.get("/api/v1/items/search", params={"q": "MON-001"}, headers=admin_token_headers)
+    assert response.json()[0]["id"] == monitor
+
+
+def test_search_index_follows_updates_and_deletes(client, admin_token_headers, session_factory):
+    from inventory_app import models
+
+    item_id = _create(client, admin_token_headers, name="Projector", management_code="PRJ-001", accessories=["Remote"])
+    db = session_factory()
+    item = db.get(models.Item, item_id)
+    item.accessories = ["HDMI Cable"]
+    db.commit()
+    db.close()
+
+    search = lambda q: client.get("/api/v1/items/search", params={"q": q}, headers=admin_token_headers).json()
+    assert search("remote") == []
+    assert [i["id"] for i in search("hdmi")] == [item_id]
+
+    client.delete(f"/api/v1/items/{item_id}", headers=admin_token_headers)
+    assert search("projector") == []
+
+
+def test_search_escapes_fts_syntax(client, admin_token_headers):
+    response = client.get("/api/v1/items/search", params={"q": '"OR NEAR( *'}, headers=admin_token_headers)
+    assert response.status_code == 200
@@ -0,0 +1,82 @@
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from inventory_app import models
+
+STATIC_DIR = Path(__file__).resolve().parent.parent / "inventory_app" / "static"
+PAGES = ["growi_table.html", "growi_fixed_assets_table.html"]
+
+# Runs the page script with stubbed DOM, localStorage and fetch. The page is loaded twice so the
+# second load revalidates with the stored ETag and renders from the 304 path.
+NODE_HARNESS = """
+const [script, payload, etag] = [process.argv[1], JSON.parse(process.argv[2]), process.argv[3]];
+const storage = new Map();
+const requests = [];
+globalThis.localStorage = {
+    getItem: (key) => (storage.has(key) ? storage.get(key) : null),
+    setItem: (key, value) => storage.set(key, String(value)),
+};
+globalThis.fetch = async (url, options) => {
+    requests.push(options.headers['If-None-Match'] || null);
+    if (requests.length > 5) throw new Error('fetch called repeatedly');
+    const notModified = options.headers['If-None-Match'] === etag;
+    return {
+        status: notModified ? 304 : 200,
+        ok: !notModified,
+        headers: { get: (name) => (name === 'ETag' ? etag : null) },
+        json: async () => payload,
+    };
+};
+(async () => {
+    const rendered = [];
+    for (let load = 0; load < 2; load++) {
+        const container = { innerHTML: '' };
+        globalThis.document = { getElementById: () => container };
+        await eval(script);
+        rendered.push(container.innerHTML);
+    }
+    console.log(JSON.stringify({ requests, rendered }));
+})();
+"""
+
+
+def _script(page):
+    html = (STATIC_DIR / page).read_text(encoding="utf-8")
+    return re.search(r"<script>(.*?)</script>", html, re.S).group(1)
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_status_pages_are_served(client, page):
+    response = client.get(f"/static/{page}")
+    assert response.status_code == 200
+    assert "/api/v1/items/status" in response.text
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_fetch_status_parses_the_response_body(page):
+    body = re.search(r"async function fetchStatus\(\) \{(.*?)\n            \}\n", _script(page), re.S).group(1)
+    assert "await response.json()" in body
+    assert "fetchStatus(" not in body
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+@pytest.mark.parametrize("page", PAGES)
+def test_status_pages_render_items(client, session_factory, page):
+    db = session_factory()
+    db.add(models.Item(name="Smoke Laptop", management_code="SMOKE-1", is_fixed_asset=True))
+    db.commit()
+    db.close()
+    response = client.get("/api/v1/items/status")
+
+    result = subprocess.run(
+        ["node", "-e", NODE_HARNESS, _script(page), response.text, response.headers["ETag"]],
+        capture_output=True, text=True, timeout=30, check=True,
+    )
+    outcome = json.loads(result.stdout)
+    assert outcome["requests"] == [None, response.headers["ETag"]]
+    assert all("Smoke Laptop" in html for html in outcome["rendered"])
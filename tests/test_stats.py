@@ -0,0 +1,101 @@
+from datetime import date, datetime, timedelta
+
+from inventory_app import models, stats
+
+
+def _create_item(client, headers, code):
+    return client.post("/api/v1/items/", json={"name": code, "management_code": code}, headers=headers).json()["id"]
+
+
+def test_borrow_and_return_update_stats(client, admin_token_headers, user_token_headers):
+    first = _create_item(client, admin_token_headers, "ST-1")
+    second = _create_item(client, admin_token_headers, "ST-2")
+    user_id = client.get("/api/v1/users/me", headers=user_token_headers).json()["id"]
+    past = (date.today() - timedelta(days=1)).isoformat()
+
+    client.post(f"/api/v1/items/{first}/borrow", json={"username": "user", "due_date": past})
+    client.post("/api/v1/items/bulk/borrow", json={"username": "user", "due_date": "2099-01-01", "item_ids": [second]},
+                headers=admin_token_headers)
+
+    user_stats = client.get(f"/api/v1/stats/users/{user_id}", headers=user_token_headers).json()
+    assert (user_stats["borrow_count"], user_stats["current_borrowed_count"], user_stats["currently_overdue_count"]) == (2, 2, 1)
+    item_stats = client.get(f"/api/v1/stats/items/{first}", headers=user_token_headers).json()
+    assert item_stats["borrow_count"] == 1
+    assert item_stats["currently_overdue"] is True
+    assert item_stats["current_borrowed_at"] is not None
+
+    client.post(f"/api/v1/items/{first}/return")
+    client.post("/api/v1/items/bulk/return", json={"item_ids": [second]}, headers=admin_token_headers)
+    user_stats = client.get(f"/api/v1/stats/users/{user_id}", headers=user_token_headers).json()
+    assert (user_stats["current_borrowed_count"], user_stats["total_borrowed_days"]) == (0, 2)
+    item_stats = client.get(f"/api/v1/stats/items/{first}", headers=user_token_headers).json()
+    assert (item_stats["total_borrowed_days"], item_stats["current_borrowed_at"]) == (1, None)
+
+    ranking = client.get("/api/v1/stats/items", params={"order": "least"}, headers=user_token_headers).json()
+    assert {entry["item_id"] for entry in ranking} == {first, second}
+    assert client.get("/api/v1/stats/users", headers=user_token_headers).status_code == 403
+    assert client.get(f"/api/v1/stats/users/{user_id + 100}", headers=user_token_headers).status_code == 403
+
+
+def test_rebuild_repairs_drift(client, admin_token_headers, session_factory):
+    item_id = _create_item(client, admin_token_headers, "ST-3")
+    db = session_factory()
+    user = models.User(username="hoarder", hashed_password="x", display_name="Hoarder")
+    db.add(user)
+    db.commit()
+    # 統計を更新しない経路 (旧データ・直接編集) で作成されたログと貸出状態
+    db.add_all([
+        models.Log(item_id=item_id, user_id=user.id, action="borrow", created_at=datetime(2026, 1, 1, 9)),
+        models.Log(item_id=item_id, user_id=user.id, action="return", created_at=datetime(2026, 1, 3, 18)),
+        models.Log(item_id=item_id, user_id=user.id, action="borrow", created_at=datetime(2026, 2, 1, 9)),
+    ])
+    item = db.get(models.Item, item_id)
+    item.status, item.owner_id, item.due_date = "borrowed", user.id, date(2099, 1, 1)
+    db.commit()
+    user_id = user.id
+
+    assert stats.get_user_stats(db, user_id).borrow_count == 0
+    response = client.post("/api/v1/stats/rebuild", headers=admin_token_headers)
+    assert response.json() == {"logs": 3, "items": 1, "users": 1}
+
+    db.expire_all()
+    result = stats.get_user_stats(db, user_id)
+    assert (result.borrow_count, result.total_borrowed_days, result.current_borrowed_count) == (2, 3, 1)
+    assert stats.get_item_stats(db, item_id).current_borrowed_at == datetime(2026, 2, 1, 9)
+
+    # 再構築後の返却は統計の貸出開始日時から日数を求める
+    client.post(f"/api/v1/items/{item_id}/return")
+    db.expire_all()
+    assert stats.get_user_stats(db, user_id).current_borrowed_count == 0
+    db.close()
+
+
+def test_every_item_has_a_stats_row_and_least_uses_the_index(client, admin_token_headers, session_factory):
+    from sqlalchemy import event
+
+    borrowed = _create_item(client, admin_token_headers, "ST-4")
+    never = _create_item(client, admin_token_headers, "ST-5")
+    deleted = _create_item(client, admin_token_headers, "ST-6")
+    client.post(f"/api/v1/items/{borrowed}/borrow", json={"username": "admin", "due_date": "2099-01-01"})
+    client.delete(f"/api/v1/items/{deleted}", headers=admin_token_headers)
+
+    db = session_factory()
+    assert {row.item_id: row.borrow_count for row in db.query(models.ItemStats)} == {borrowed: 1, never: 0}
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "item_stats" in statement:
+            statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        ranking = stats.list_item_stats(db, order="least", limit=1)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    [(statement, parameters)] = statements
+    plan = " ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+    db.close()
+    assert [(entry.item_id, entry.borrow_count) for entry in ranking] == [(never, 0)]
+    assert "ix_item_stats_borrow_count" in plan
+    assert "TEMP B-TREE" not in plan